@@ -0,0 +1,283 @@
+"""
+Admission control and fair per-stage scheduling for world_server jobs.
+
+A job is admitted (or rejected) before its upload body is read:
+  - more than max_jobs admitted, unfinished jobs -> QueueFull, served as 503
+  - one client already holding max_per_client of them -> QueueFull, served as 429
+Rejections carry a Retry-After estimate (from recent job durations) and the
+position the job would have had in the queue.
+
+Admitted jobs then pass through one gate per pipeline stage (encode, upload,
+generate, download), each with its own concurrency limit. When a slot frees,
+it goes to the waiter with the best priority class; within a class, to the
+client with the fewest jobs already in that stage, then the one served least
+recently, then the oldest waiter. One client's burst therefore cannot starve
+the others. The generate slot is held until the World Labs operation
+finishes, so its limit caps upstream generations in flight.
+
+Threaded servers wait with StageGate.acquire / Ticket.enter; asyncio servers
+with acquire_async / enter_async, which suspend the task instead of a thread.
+Both kinds of waiters share the same gates and ordering.
+
+Environment:
+  WORLD_ADMISSION_MAX_JOBS         admitted, unfinished jobs (default 64)
+  WORLD_ADMISSION_MAX_PER_CLIENT   of those, per client (default 16)
+  WORLD_STAGE_ENCODE               concurrent compressions (default 2)
+  WORLD_STAGE_UPLOAD               concurrent uploads (default 4)
+  WORLD_STAGE_GENERATE             concurrent upstream generations (default 16)
+  WORLD_STAGE_DOWNLOAD             concurrent generated-asset downloads (default 4)
+"""
+
+import asyncio
+import itertools
+import math
+import os
+import threading
+import time
+from typing import Optional
+
+PRIORITY_CLASSES = ("high", "normal", "low")
+DEFAULT_PRIORITY = "normal"
+# create_world on_stage names -> gate that stage runs under.
+STAGE_GATES = {"compressing": "encode", "uploading": "upload", "generating": "generate", "downloading": "download"}
+# Starting guess for a job's duration, before any job has finished.
+INITIAL_JOB_ESTIMATE_S = 300.0
+
+
+class QueueFull(Exception):
+    def __init__(self, message: str, status: int, retry_after_s: float, queue_position: int):
+        super().__init__(message)
+        self.status = status
+        self.retry_after_s = retry_after_s
+        self.queue_position = queue_position
+
+
+class _Waiter:
+    def __init__(self, client: str, rank: int, seq: int):
+        self.client = client
+        self.rank = rank
+        self.seq = seq
+        self.granted = False
+        self.future = None  # set for acquire_async waiters
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class StageGate:
+    """Counting semaphore that hands free slots out by priority, then per-client fairness."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = max(1, limit)
+        self._in_use = 0
+        self._active = {}  # client -> slots held
+        self._last_served = {}  # client -> grant sequence number
+        self._waiters = []
+        self._grants = itertools.count()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def acquire(self, client: str, priority: str = DEFAULT_PRIORITY, on_wait=None):
+        """Block until granted a slot; on_wait(gate_name) is called first if it has to wait."""
+        with self._cond:
+            waiter = _Waiter(client, PRIORITY_CLASSES.index(priority), next(self._seq))
+            self._waiters.append(waiter)
+            self._grant_locked()
+            if waiter.granted:
+                return
+        if on_wait:
+            on_wait(self.name)
+        with self._cond:
+            while not waiter.granted:
+                self._cond.wait()
+
+    async def acquire_async(self, client: str, priority: str = DEFAULT_PRIORITY, on_wait=None):
+        """acquire() for asyncio tasks; cancelling the wait gives up the place (or the slot)."""
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            waiter = _Waiter(client, PRIORITY_CLASSES.index(priority), next(self._seq))
+            self._waiters.append(waiter)
+            self._grant_locked()
+            if waiter.granted:
+                return
+            waiter.future = loop.create_future()
+        if on_wait:
+            on_wait(self.name)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._cond:
+                granted = waiter.granted
+                if not granted:
+                    self._waiters.remove(waiter)
+            if granted:
+                self.release(client)
+            raise
+
+    def release(self, client: str):
+        with self._cond:
+            self._in_use -= 1
+            self._active[client] -= 1
+            if not self._active[client]:
+                del self._active[client]
+            self._grant_locked()
+
+    def _grant_locked(self):
+        granted = False
+        while self._waiters and self._in_use < self.limit:
+            waiter = min(
+                self._waiters,
+                key=lambda w: (w.rank, self._active.get(w.client, 0), self._last_served.get(w.client, -1), w.seq),
+            )
+            self._waiters.remove(waiter)
+            waiter.granted = True
+            self._in_use += 1
+            self._active[waiter.client] = self._active.get(waiter.client, 0) + 1
+            self._last_served[waiter.client] = next(self._grants)
+            if waiter.future is not None:
+                # Releases may come from any thread; wake the task on its own loop.
+                waiter.future.get_loop().call_soon_threadsafe(_wake, waiter.future)
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def in_use(self) -> int:
+        with self._cond:
+            return self._in_use
+
+    def waiting(self) -> int:
+        with self._cond:
+            return len(self._waiters)
+
+
+class Ticket:
+    """One admitted job's passage through the stage gates."""
+
+    def __init__(self, controller: "AdmissionController", client: str, priority: str, queue_position: int):
+        self.controller = controller
+        self.client = client
+        self.priority = priority
+        self.queue_position = queue_position
+        self.admitted_at = time.monotonic()
+        self.stage = None
+        self.ran = False
+        self._finished = False
+        self._lock = threading.Lock()
+
+    def enter(self, stage: str, on_wait=None):
+        """Move to the gate for an on_stage name, releasing the previous one; blocks for a slot.
+
+        Stages without a gate (e.g. "receiving") and repeats of the current stage are no-ops.
+        on_wait(gate_name) is called if the slot is not free right away.
+        """
+        gate = self._leave_for(stage)
+        if gate is not None:
+            gate.acquire(self.client, self.priority, on_wait)
+            self._entered(gate)
+
+    async def enter_async(self, stage: str, on_wait=None):
+        """enter() for asyncio tasks."""
+        gate = self._leave_for(stage)
+        if gate is not None:
+            await gate.acquire_async(self.client, self.priority, on_wait)
+            self._entered(gate)
+
+    def _leave_for(self, stage: str) -> Optional[StageGate]:
+        """Release the current gate and return the one stage needs, or None if nothing changes."""
+        gate_name = STAGE_GATES.get(stage)
+        with self._lock:
+            if gate_name is None or gate_name == self.stage or self._finished:
+                return None
+            previous, self.stage = self.stage, None
+        if previous:
+            self.controller.gates[previous].release(self.client)
+        return self.controller.gates[gate_name]
+
+    def _entered(self, gate: StageGate):
+        with self._lock:
+            if self._finished:
+                # finish() ran while we waited; hand the slot straight back.
+                gate.release(self.client)
+                return
+            self.stage = gate.name
+            self.ran = True
+
+    def finish(self):
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+            stage, self.stage = self.stage, None
+        if stage:
+            self.controller.gates[stage].release(self.client)
+        self.controller._finished(self)
+
+
+class AdmissionController:
+    def __init__(self, max_jobs: int = 64, max_per_client: int = 16, stage_limits: Optional[dict] = None):
+        self.max_jobs = max_jobs
+        self.max_per_client = max_per_client
+        limits = {"encode": 2, "upload": 4, "generate": 16, "download": 4}
+        limits.update(stage_limits or {})
+        self.gates = {name: StageGate(name, limit) for name, limit in limits.items()}
+        self._admitted = 0
+        self._per_client = {}
+        self._avg_job_s = INITIAL_JOB_ESTIMATE_S
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            max_jobs=int(os.environ.get("WORLD_ADMISSION_MAX_JOBS", "64")),
+            max_per_client=int(os.environ.get("WORLD_ADMISSION_MAX_PER_CLIENT", "16")),
+            stage_limits={
+                "encode": int(os.environ.get("WORLD_STAGE_ENCODE", "2")),
+                "upload": int(os.environ.get("WORLD_STAGE_UPLOAD", "4")),
+                "generate": int(os.environ.get("WORLD_STAGE_GENERATE", "16")),
+                "download": int(os.environ.get("WORLD_STAGE_DOWNLOAD", "4")),
+            },
+        )
+
+    def admit(self, client: str, priority: str = DEFAULT_PRIORITY) -> Ticket:
+        """Ticket for a new job, or QueueFull when the server or this client is at capacity."""
+        if priority not in PRIORITY_CLASSES:
+            priority = DEFAULT_PRIORITY
+        with self._lock:
+            client_jobs = self._per_client.get(client, 0)
+            if self._admitted >= self.max_jobs:
+                raise QueueFull(
+                    "Server is at capacity; retry later", 503, self._wait_estimate_locked(1), self._admitted + 1
+                )
+            if client_jobs >= self.max_per_client:
+                raise QueueFull(
+                    "Too many jobs in progress for this client (max %d)" % self.max_per_client,
+                    429,
+                    self._wait_estimate_locked(client_jobs - self.max_per_client + 1),
+                    client_jobs + 1,
+                )
+            self._admitted += 1
+            self._per_client[client] = client_jobs + 1
+            return Ticket(self, client, priority, self._admitted)
+
+    def _wait_estimate_locked(self, jobs_ahead: int) -> float:
+        """Rough seconds until jobs_ahead jobs finish, with `generate` of them running at once."""
+        parallel = self.gates["generate"].limit
+        return self._avg_job_s * math.ceil(jobs_ahead / float(parallel))
+
+    def _finished(self, ticket: Ticket):
+        with self._lock:
+            self._admitted -= 1
+            self._per_client[ticket.client] -= 1
+            if not self._per_client[ticket.client]:
+                del self._per_client[ticket.client]
+            if ticket.ran:
+                # Exponentially weighted, so the estimate follows the current upstream speed.
+                elapsed = time.monotonic() - ticket.admitted_at
+                self._avg_job_s = 0.8 * self._avg_job_s + 0.2 * elapsed
+
+    def admitted(self) -> int:
+        with self._lock:
+            return self._admitted
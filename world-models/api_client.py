@@ -0,0 +1,123 @@
+"""
+Shared HTTP client for World Labs API calls.
+
+One requests.Session with a keep-alive connection pool is reused for every
+prepare_upload, worlds:generate and operations poll (and for signed uploads),
+so repeat calls skip the TCP+TLS handshake. Every request gets a timeout and
+is recorded as a telemetry span (named by the caller, "api" otherwise) with
+its HTTP status. Transient failures are retried per endpoint (keyed by that
+same name) with jittered backoff, and a shared circuit breaker fails calls
+fast while the API is degraded (see retry.py).
+
+Environment:
+  WORLD_LABS_POOL_SIZE          connections kept alive per host (default 32)
+  WORLD_LABS_CONNECT_TIMEOUT    seconds to establish a connection (default 10)
+  WORLD_LABS_READ_TIMEOUT       seconds to wait for a response (default 60)
+"""
+
+import os
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from retry import DEFAULT_RETRY_POLICIES, RETRYABLE_STATUSES, CircuitBreaker, retry_after_s
+from telemetry import span
+
+DEFAULT_POOL_SIZE = 32
+DEFAULT_TIMEOUT = (10, 60)
+
+
+def settings_from_env() -> dict:
+    """pool_size and timeout from the environment (shared with async_world.AsyncApiClient)."""
+    return {
+        "pool_size": int(os.environ.get("WORLD_LABS_POOL_SIZE", str(DEFAULT_POOL_SIZE))),
+        "timeout": (
+            float(os.environ.get("WORLD_LABS_CONNECT_TIMEOUT", str(DEFAULT_TIMEOUT[0]))),
+            float(os.environ.get("WORLD_LABS_READ_TIMEOUT", str(DEFAULT_TIMEOUT[1]))),
+        ),
+    }
+
+
+class ApiClient:
+    def __init__(
+        self,
+        api_base: str,
+        api_key: str,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        timeout=DEFAULT_TIMEOUT,
+        breaker: CircuitBreaker = None,
+    ):
+        self.api_base = api_base.rstrip("/")
+        self.api_key = api_key
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._rate_limits = {}
+        self.retry_policies = dict(DEFAULT_RETRY_POLICIES)
+        self.breaker = breaker or CircuitBreaker()
+
+    @classmethod
+    def from_env(cls, api_base: str, api_key: str) -> "ApiClient":
+        return cls(api_base, api_key, breaker=CircuitBreaker.from_env(), **settings_from_env())
+
+    def set_rate_limit(self, path: str, bucket):
+        """Throttle calls to path (e.g. "/worlds:generate") through a rate_limit.TokenBucket; None removes it."""
+        if bucket is None:
+            self._rate_limits.pop(path, None)
+        else:
+            self._rate_limits[path] = bucket
+
+    def request(self, method: str, path: str, headers=None, span_name: str = "api", **kwargs) -> requests.Response:
+        """Call an API path (e.g. "/worlds:generate") with the API key and default timeout.
+
+        Retries transient failures per retry_policies[span_name]. The last response is returned
+        even if it is an error; raises CircuitOpenError while the breaker is open.
+        """
+        policy = self.retry_policies.get(span_name) or self.retry_policies["api"]
+        all_headers = {"WLT-Api-Key": self.api_key}
+        all_headers.update(headers or {})
+        kwargs.setdefault("timeout", self.timeout)
+        started_at = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.before_call()
+            bucket = self._rate_limits.get(path)
+            if bucket is not None:
+                bucket.acquire()
+            try:
+                with span(span_name, method=method, attempt=attempt) as attrs:
+                    r = self.session.request(method, self.api_base + path, headers=all_headers, **kwargs)
+                    attrs["status"] = r.status_code
+            except requests.RequestException as exc:
+                self.breaker.record_failure()
+                delay = policy.next_delay(attempt, started_at) if policy.retries_exception(method, exc) else None
+                if delay is None:
+                    raise
+                reason = type(exc).__name__
+            else:
+                if r.status_code in RETRYABLE_STATUSES:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if not policy.retries_status(method, r.status_code):
+                    return r
+                delay = policy.next_delay(attempt, started_at, retry_after_s(r))
+                if delay is None:
+                    return r
+                reason = "HTTP %d" % r.status_code
+            print("%s %s failed (%s); retrying in %.1fs (attempt %d/%d)..."
+                  % (method, path, reason, delay, attempt + 1, policy.max_attempts))
+            time.sleep(delay)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def close(self):
+        self.session.close()
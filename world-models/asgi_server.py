@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+"""
+Asyncio (ASGI) variant of world_server.py for many concurrent generations.
+
+Serves the same contract as world_server.py (POST /generate-worldvr,
+GET /jobs/<job_id>, GET /generate-worldvr/<job_id>/events, GET /assets/<name>,
+GET /metrics; see its docstring and world_api.py) from a single event loop:
+  - the multipart body streams straight to a file in the request's workspace
+    (see workspace.py) while it is hashed, with disk writes done off the loop
+  - each job is an asyncio task: ffmpeg runs as an asyncio subprocess and
+    World Labs calls go through one httpx connection pool (see async_world.py)
+  - stage gates are awaited instead of blocking a thread (see admission.py)
+  - every pending generation is one sleeping coroutine, and every SSE watcher
+    one open stream, so one process holds thousands of each
+
+Jobs, idempotency, dedupe, admission control and resume-on-restart behave as
+in world_server.py. Differences: uploads are always spooled (no
+WORLD_SERVER_INGEST=stream) and long videos are encoded whole, without
+segment-parallel mode. Resumable signed upload URLs are uploaded from a
+worker thread.
+
+Requires starlette, uvicorn, httpx and python-multipart:
+  pip install starlette uvicorn httpx python-multipart
+  python asgi_server.py                  # listens on $PORT (default 8080)
+  uvicorn asgi_server:app --port 8080    # or under any ASGI server
+
+Environment: as world_server.py (WORLD_SERVER_MAX_UPLOAD_MB, admission, job
+store, workspace, World Labs client settings).
+"""
+
+import asyncio
+import hashlib
+import os
+import queue
+from contextlib import asynccontextmanager
+
+import uvicorn
+from python_multipart.exceptions import FormParserError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.applications import Starlette
+from starlette.requests import ClientDisconnect
+from starlette.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import world_api
+from admission import AdmissionController, QueueFull
+from async_world import create_video_world_variants, get_api, watch_operation
+from encode_scheduler import get_encode_scheduler
+from job_store import dedupe_key_for, default_store
+from jobs import SUBSCRIBER_QUEUE_SIZE, JobRegistry
+from telemetry import metrics
+from workspace import WorkspaceFull, get_workspaces
+from world_client import (
+    MAX_VIDEO_UPLOAD_MB,
+    MODE_VARIANTS,
+    cache_world_assets,
+    get_asset_cache,
+    load_env,
+    print_progress,
+)
+
+# The settings below, and those read by admission, the job store and the rest, may come from .env.
+load_env()
+
+MAX_UPLOAD_MB = int(os.environ.get("WORLD_SERVER_MAX_UPLOAD_MB", "1024"))
+
+# Built by lifespan(), so importing this module opens no store and starts no threads.
+jobs = None
+admission = None
+# Strong references to running job tasks (the event loop only keeps weak ones).
+_tasks = set()
+_operations_polling = 0
+
+
+class LoopQueue:
+    """Event sink for JobRegistry.subscribe that an asyncio stream can await.
+
+    put_nowait may be called from any thread; the event is handed to the loop's queue.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int = SUBSCRIBER_QUEUE_SIZE):
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self.maxsize = maxsize
+
+    def put_nowait(self, item):
+        if self._queue.qsize() >= self.maxsize:
+            raise queue.Full
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+
+    async def get(self):
+        return await self._queue.get()
+
+
+class UploadIngest:
+    """Streaming multipart parser: the "video" part goes to a file in workspace, other fields stay in memory."""
+
+    def __init__(self, max_bytes: int, workspace):
+        self.max_bytes = max_bytes
+        self.workspace = workspace
+        self.fields = {}
+        self.filename = None
+        self.temp_path = None
+        self.received = 0
+        self._sha256 = hashlib.sha256()
+        self._file = None
+        self._header_field = b""
+        self._header_value = b""
+        self._disposition = {}
+        self._in_video = False
+        self._part_data = None
+        self._to_write = []
+
+    @property
+    def input_sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+    async def read(self, request):
+        """Consume the request body; raises world_api.BadRequest for bodies the server cannot accept."""
+        content_length = request.headers.get("Content-Length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            raise world_api.BadRequest("Upload exceeds %d MB" % (self.max_bytes // (1024 * 1024)), 413)
+        content_type, params = parse_options_header(request.headers.get("Content-Type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            raise world_api.BadRequest("Expected multipart/form-data with a video file field")
+        parser = MultipartParser(
+            params[b"boundary"],
+            {
+                "on_part_begin": self._on_part_begin,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+                "on_headers_finished": self._on_headers_finished,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+            },
+        )
+        try:
+            async for chunk in request.stream():
+                self.received += len(chunk)
+                if self.received > self.max_bytes:
+                    raise world_api.BadRequest("Upload exceeds %d MB" % (self.max_bytes // (1024 * 1024)), 413)
+                parser.write(chunk)
+                if self._to_write:
+                    data = b"".join(self._to_write)
+                    self._to_write = []
+                    await asyncio.to_thread(self._write, data)
+            parser.finalize()
+        except FormParserError:
+            raise world_api.BadRequest("Malformed multipart body")
+        finally:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def discard(self):
+        self.workspace.close()
+
+    def _write(self, data: bytes):
+        self._sha256.update(data)
+        self._file.write(data)
+
+    def _on_part_begin(self):
+        self._disposition = {}
+        self._in_video = False
+        self._part_data = None
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        if self._header_field.lower() == b"content-disposition":
+            _, self._disposition = parse_options_header(self._header_value)
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        name = self._disposition.get(b"name", b"").decode("utf-8", "replace")
+        if name == "video" and self.temp_path is None:
+            self.filename = self._disposition.get(b"filename", b"").decode("utf-8", "replace")
+            ext = os.path.splitext(self.filename)[1].lower()
+            self.temp_path = self.workspace.file("upload" + (ext if ext[1:].isalnum() else ".mp4"))
+            self._file = open(self.temp_path, "wb")
+            self._in_video = True
+        elif name and b"filename" not in self._disposition:
+            self._part_data = (name, [])
+
+    def _on_part_data(self, data, start, end):
+        if self._in_video:
+            self._to_write.append(data[start:end])
+        elif self._part_data is not None:
+            self._part_data[1].append(data[start:end])
+
+    def _on_part_end(self):
+        self._in_video = False
+        if self._part_data is not None:
+            name, pieces = self._part_data
+            self.fields.setdefault(name, b"".join(pieces).decode("utf-8", "replace"))
+            self._part_data = None
+
+
+def json_response(shaped) -> JSONResponse:
+    """Starlette response for a world_api (body, status, headers) triple."""
+    body, status, headers = shaped
+    return JSONResponse(body, status_code=status, headers=headers)
+
+
+def spawn(coro):
+    task = asyncio.create_task(coro)
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+def progress_publisher(job):
+    return lambda operation_id, progress, op: jobs.publish(
+        job, "generating", operation_id=operation_id, progress=progress
+    )
+
+
+async def poll_to_completion(job, operation_id: str):
+    """Publish progress until operation_id finishes; returns the described world."""
+    global _operations_polling
+    _operations_polling += 1
+    try:
+        return await watch_operation(get_api(), operation_id, on_progress=progress_publisher(job))
+    finally:
+        _operations_polling -= 1
+
+
+async def complete_job(job, world: dict, on_stage=None):
+    """Mark job done with world, then cache its assets as the job's "assets" follow-up (see jobs.py)."""
+    follow_up = "assets" if get_asset_cache() is not None else None
+    await asyncio.to_thread(jobs.complete, job, world, follow_up)
+    if follow_up:
+        await download_assets(job, on_stage)
+
+
+async def download_assets(job, on_stage=None):
+    """Add local_assets (copies in the asset cache, served under /assets/) to a done job's result.
+
+    The downloads themselves run in a worker thread (downloader.py uses requests). Any failure is
+    recorded as local_assets_error instead: the world itself is already done.
+    """
+    world = job.result
+    try:
+        if world["assets"]:
+            if on_stage:
+                await on_stage("downloading", assets=len(world["assets"]))
+            else:
+                await asyncio.to_thread(jobs.publish, job, "downloading", assets=len(world["assets"]))
+        fields = {"local_assets": world_api.local_assets(await asyncio.to_thread(cache_world_assets, world))}
+    except Exception as exc:
+        print("Could not cache the assets of world %s: %s" % (world.get("world_id"), exc))
+        fields = {"local_assets_error": str(exc)}
+    await asyncio.to_thread(jobs.finish_follow_up, job, **fields)
+
+
+async def watch_draft(job, operation_id: str):
+    """Poll a draft-then-full draft alongside the full generation; publishes "draft_ready" when done."""
+    global _operations_polling
+    _operations_polling += 1
+    try:
+        draft = await watch_operation(get_api(), operation_id, on_progress=print_progress)
+    except Exception as exc:
+        # The full-quality world is still coming; a failed draft only loses the preview.
+        print("Draft generation %s failed: %s" % (operation_id, exc))
+    else:
+        await asyncio.to_thread(jobs.publish, job, "draft_ready", draft=draft)
+    finally:
+        _operations_polling -= 1
+
+
+async def run_job(ticket, job, ingest: UploadIngest, display_name: str, prompt, sampling: str, mode: str):
+    """The whole pipeline for one admitted job, each stage waiting for its admission gate."""
+
+    async def on_stage(stage, **detail):
+        await ticket.enter_async(stage, on_wait=lambda gate: jobs.publish(job, "queued", waiting_for=gate))
+        await asyncio.to_thread(jobs.publish, job, stage, **detail)
+
+    try:
+        await asyncio.to_thread(jobs.mark_running, job)
+        try:
+            operations = await create_video_world_variants(
+                get_api(),
+                ingest.temp_path,
+                display_name,
+                prompt,
+                mode,
+                ingest.input_sha256,
+                sampling=sampling,
+                on_stage=on_stage,
+            )
+        finally:
+            # The upload and its compressed output (written next to it) go with the workspace.
+            ingest.discard()
+        # The last variant (full, or the draft in draft mode) is the job's result.
+        operation_id = operations[MODE_VARIANTS[mode][-1]]
+        if "draft" in operations and operation_id != operations["draft"]:
+            await on_stage("generating", operation_id=operation_id, draft_operation_id=operations["draft"])
+            spawn(watch_draft(job, operations["draft"]))
+        else:
+            await on_stage("generating", operation_id=operation_id)
+        world = await poll_to_completion(job, operation_id)
+    except Exception as exc:
+        await asyncio.to_thread(jobs.fail, job, str(exc))
+    else:
+        # The ticket is kept until the downloads are over, so they wait for a download slot.
+        await complete_job(job, world, on_stage)
+    finally:
+        ingest.discard()
+        ticket.finish()
+
+
+async def resume_job(job):
+    """Pick a job back up whose process stopped before it finished (see JobRegistry.start_leases)."""
+    if job.finished:
+        # Only its asset downloads were left.
+        print("Resuming asset downloads of job %s" % job.id)
+        if get_asset_cache() is None:
+            await asyncio.to_thread(jobs.finish_follow_up, job)
+        else:
+            await download_assets(job)
+        return
+    if not job.operation_id:
+        # The uploaded video was in the stopped process's workspace; nothing to resume from.
+        await asyncio.to_thread(jobs.fail, job, "Server restarted before generation started; please resubmit")
+        return
+    print("Resuming job %s (operation %s)" % (job.id, job.operation_id))
+    if job.draft_operation_id and job.draft is None:
+        spawn(watch_draft(job, job.draft_operation_id))
+    await asyncio.to_thread(jobs.mark_running, job)
+    try:
+        world = await poll_to_completion(job, job.operation_id)
+    except Exception as exc:
+        await asyncio.to_thread(jobs.fail, job, str(exc))
+    else:
+        await complete_job(job, world)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global jobs, admission
+    loop = asyncio.get_running_loop()
+    jobs = JobRegistry(store=default_store())
+    admission = AdmissionController.from_env()
+    await asyncio.to_thread(get_workspaces().reap_orphans)
+    # Claimed jobs arrive on the lease thread; their tasks are started on the loop.
+    jobs.start_leases(lambda job: loop.call_soon_threadsafe(spawn, resume_job(job)))
+    yield
+    # Unfinished jobs stay in the job store; releasing their leases lets another worker, or the
+    # next start, resume those with an operation_id.
+    for task in list(_tasks):
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    await asyncio.to_thread(jobs.stop_leases)
+    await get_api().aclose()
+
+
+async def generate_worldvr(request):
+    # Shed load before reading the body while the World Labs API is failing.
+    retry_in = get_api().breaker.retry_in()
+    if retry_in > 0:
+        return json_response(world_api.degraded_response(retry_in))
+
+    client = world_api.client_identity(request.headers, request.client.host if request.client else None)
+    try:
+        ticket = admission.admit(client, world_api.priority_of(request.headers))
+    except QueueFull as exc:
+        return json_response(world_api.queue_full_response(exc))
+
+    started = False
+    try:
+        response, started = await accept_upload(request, ticket)
+        return response
+    finally:
+        if not started:
+            ticket.finish()
+
+
+async def accept_upload(request, ticket):
+    """Validate and store the upload, then start (or attach to) a job; returns (response, started)."""
+    content_length = request.headers.get("Content-Length")
+    max_bytes = MAX_UPLOAD_MB * 1024 * 1024
+    reserve = int(content_length) if content_length and content_length.isdigit() else max_bytes
+    try:
+        # Claim scratch space before the body is read, so a full disk quota rejects it cheaply.
+        workspace = get_workspaces().create("ingest", min(reserve, max_bytes) + MAX_VIDEO_UPLOAD_MB * 1024 * 1024)
+    except WorkspaceFull as exc:
+        return json_response(world_api.workspace_full_response(exc)), False
+    ingest = UploadIngest(max_bytes, workspace)
+    try:
+        await ingest.read(request)
+        if ingest.temp_path is None:
+            raise world_api.BadRequest("Missing file field: video")
+        world_api.check_video_filename(ingest.filename)
+        params = world_api.generate_params(request.headers, ingest.fields, request.query_params)
+    except world_api.BadRequest as exc:
+        ingest.discard()
+        return json_response(world_api.error_response(str(exc), exc.status)), False
+    except (ClientDisconnect, asyncio.CancelledError):
+        ingest.discard()
+        raise
+
+    prompt, display_name, sampling, mode = params["prompt"], params["name"], params["sampling"], params["mode"]
+    dedupe_key = dedupe_key_for(ingest.input_sha256, prompt, display_name, sampling, mode)
+    job, created = await asyncio.to_thread(
+        jobs.create_or_attach,
+        params["idempotency_key"],
+        dedupe_key,
+        input_sha256=ingest.input_sha256,
+        prompt=prompt,
+        name=display_name,
+        sampling=sampling,
+    )
+    if not created:
+        ingest.discard()
+        return json_response(world_api.attached_response(job, dedupe_key)), False
+
+    jobs.publish(job, "receiving", bytes=ingest.received)
+    spawn(run_job(ticket, job, ingest, display_name, prompt, sampling, mode))
+    return json_response(world_api.job_response(job, 202, queue_position=ticket.queue_position)), True
+
+
+async def get_asset(request):
+    cache = get_asset_cache()
+    entry = await asyncio.to_thread(cache.get, request.path_params["name"]) if cache is not None else None
+    if entry is None:
+        return PlainTextResponse("Not Found", status_code=404)
+    headers = world_api.asset_headers(entry)
+    if world_api.etag_matches(request.headers.get("if-none-match"), entry):
+        return Response(status_code=304, headers=headers)
+    # FileResponse answers Range requests (206, 416) and If-Range itself.
+    return FileResponse(entry["path"], media_type=entry["content_type"], headers=headers)
+
+
+async def get_job(request):
+    job_id = request.path_params["job_id"]
+    job = await asyncio.to_thread(jobs.get, job_id)
+    if job is None:
+        return json_response(world_api.unknown_job_response(job_id))
+    return JSONResponse(job.to_dict())
+
+
+async def job_events(request):
+    job_id = request.path_params["job_id"]
+    job = await asyncio.to_thread(jobs.get, job_id)
+    if job is None:
+        return json_response(world_api.unknown_job_response(job_id))
+    events = jobs.subscribe(job, LoopQueue(asyncio.get_running_loop()))
+
+    async def stream():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.get(), world_api.SSE_HEARTBEAT_S)
+                except asyncio.TimeoutError:
+                    # A job another worker runs only changes here when it is re-read from the store.
+                    await asyncio.to_thread(jobs.refresh, job)
+                    yield world_api.SSE_KEEPALIVE
+                    continue
+                if event is None:
+                    return
+                yield world_api.sse_event(event)
+        finally:
+            jobs.unsubscribe(job, events)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=world_api.SSE_HEADERS)
+
+
+async def prometheus_metrics(request):
+    """Per-stage span histograms plus current job, poll and encode load."""
+    gauges = world_api.metrics_gauges(
+        jobs,
+        admission,
+        get_api().breaker,
+        world_operations_polling=_operations_polling,
+        world_encode_slots_in_use=get_encode_scheduler().in_use(),
+        world_async_tasks=len(_tasks),
+    )
+    return PlainTextResponse(metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
+
+app = Starlette(
+    routes=[
+        Route("/generate-worldvr", generate_worldvr, methods=["POST"]),
+        Route("/jobs/{job_id}", get_job, methods=["GET"]),
+        Route("/generate-worldvr/{job_id}/events", job_events, methods=["GET"]),
+        Route("/assets/{name}", get_asset, methods=["GET", "HEAD"]),
+        Route("/metrics", prometheus_metrics, methods=["GET"]),
+    ],
+    lifespan=lifespan,
+)
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", "8080")))
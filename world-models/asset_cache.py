@@ -0,0 +1,170 @@
+"""
+Content-addressed local cache of downloaded world assets.
+
+Each asset is stored once, as <root>/<sha256[:2]>/<sha256><ext>, however many
+worlds or URLs point at it; a SQLite index next to the files maps a source
+key (world id + asset name) to its content hash and tracks last use. Once
+the files add up to more than max_bytes the least recently used ones are
+deleted. Files are immutable, so their sha256 doubles as a strong ETag when
+world_server.py / asgi_server.py serve them under /assets/<sha256><ext>.
+
+Environment:
+  WORLD_ASSET_CACHE=0             disable asset downloads and the cache
+  WORLD_ASSET_CACHE_DIR           cache directory (default ~/.cache/worldly/assets)
+  WORLD_ASSET_CACHE_MAX_MB        total size before LRU eviction (default 5120)
+"""
+
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from downloader import asset_extension
+from workspace import hand_off
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "worldly", "assets")
+DEFAULT_MAX_MB = 5120
+# "<sha256><ext>", the only names served from the cache.
+ASSET_FILE_NAME = re.compile(r"^([0-9a-f]{64})(\.[a-z0-9]{1,7})?$")
+
+
+class AssetCache:
+    def __init__(self, root: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, "tmp"), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS assets ("
+                " sha256 TEXT PRIMARY KEY,"
+                " ext TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " content_type TEXT,"
+                " created_at REAL NOT NULL,"
+                " last_used_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sources ("
+                " key TEXT PRIMARY KEY,"
+                " sha256 TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per call keeps this safe across threads and worker processes.
+        conn = sqlite3.connect(os.path.join(self.root, "index.sqlite3"), timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def file_path(self, sha256: str, ext: str = "") -> str:
+        return os.path.join(self.root, sha256[:2], sha256 + ext)
+
+    def lookup(self, key: str) -> Optional[dict]:
+        """Entry (sha256, ext, size, content_type, path) cached for a source key, or None."""
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT sha256 FROM sources WHERE key = ?", (key,)).fetchone()
+            return self._touch_locked(conn, row[0]) if row else None
+
+    def get(self, file_name: str) -> Optional[dict]:
+        """Entry for a served "<sha256><ext>" name, or None if it is unknown or malformed."""
+        match = ASSET_FILE_NAME.match(file_name)
+        if match is None:
+            return None
+        with self._lock, self._connect() as conn:
+            entry = self._touch_locked(conn, match.group(1))
+        if entry is None or entry["ext"] != (match.group(2) or ""):
+            return None
+        return entry
+
+    def _touch_locked(self, conn, sha256: str) -> Optional[dict]:
+        row = conn.execute(
+            "SELECT ext, size, content_type FROM assets WHERE sha256 = ?", (sha256,)
+        ).fetchone()
+        if row is None:
+            return None
+        ext, size, content_type = row
+        path = self.file_path(sha256, ext)
+        if not os.path.exists(path):
+            # Deleted behind our back (e.g. a cleaned cache directory); forget it.
+            conn.execute("DELETE FROM assets WHERE sha256 = ?", (sha256,))
+            conn.execute("DELETE FROM sources WHERE sha256 = ?", (sha256,))
+            return None
+        conn.execute("UPDATE assets SET last_used_at = ? WHERE sha256 = ?", (time.time(), sha256))
+        return {"sha256": sha256, "ext": ext, "size": size, "content_type": content_type, "path": path}
+
+    def fetch(self, key: str, url: str, downloader) -> dict:
+        """Entry for key, downloading url with downloader (an AssetDownloader) on a miss."""
+        entry = self.lookup(key)
+        if entry is not None:
+            return entry
+        fd, temp_path = tempfile.mkstemp(dir=os.path.join(self.root, "tmp"))
+        os.close(fd)
+        try:
+            downloaded = downloader.download(url, temp_path, name=key)
+            return self.put(key, temp_path, downloaded["sha256"], asset_extension(url), downloaded["content_type"])
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def put(self, key: str, path: str, sha256: str, ext: str = "", content_type: Optional[str] = None) -> dict:
+        """Move a verified file into the cache under its content hash; returns its entry."""
+        dest = self.file_path(sha256, ext)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        now = time.time()
+        with self._lock:
+            # Never replaces a published file: identical content from another world, URL or
+            # process that is already here is kept, and path is just dropped.
+            hand_off(path, dest)
+            size = os.path.getsize(dest)
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT INTO assets (sha256, ext, size, content_type, created_at, last_used_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT(sha256) DO UPDATE SET last_used_at = excluded.last_used_at",
+                    (sha256, ext, size, content_type, now, now),
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO sources (key, sha256, created_at) VALUES (?, ?, ?)", (key, sha256, now)
+                )
+                self._evict_locked(conn, keep=sha256)
+        return {"sha256": sha256, "ext": ext, "size": size, "content_type": content_type, "path": dest}
+
+    def _evict_locked(self, conn, keep: str):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM assets").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for sha256, ext, size in conn.execute(
+            "SELECT sha256, ext, size FROM assets WHERE sha256 != ? ORDER BY last_used_at", (keep,)
+        ).fetchall():
+            try:
+                os.remove(self.file_path(sha256, ext))
+            except FileNotFoundError:
+                pass
+            conn.execute("DELETE FROM assets WHERE sha256 = ?", (sha256,))
+            conn.execute("DELETE FROM sources WHERE sha256 = ?", (sha256,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def total_bytes(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COALESCE(SUM(size), 0) FROM assets").fetchone()[0]
+
+
+def default_asset_cache() -> Optional[AssetCache]:
+    """Cache configured from the environment, or None when disabled."""
+    if os.environ.get("WORLD_ASSET_CACHE", "1").lower() in ("0", "false", "no", "off"):
+        return None
+    return AssetCache(
+        root=os.environ.get("WORLD_ASSET_CACHE_DIR", DEFAULT_CACHE_DIR),
+        max_bytes=int(float(os.environ.get("WORLD_ASSET_CACHE_MAX_MB", str(DEFAULT_MAX_MB))) * 1024 * 1024),
+    )
@@ -0,0 +1,455 @@
+"""
+Asyncio versions of the World Labs pipeline steps, used by asgi_server.py.
+
+Same flow and fallbacks as world_client.py, without a thread per job:
+  - AsyncApiClient: one httpx.AsyncClient connection pool, with the same
+    per-endpoint retry policies, circuit breaker and telemetry spans as
+    api_client.ApiClient
+  - compress_video: runs video_prep.compression_steps (passthrough, remux,
+    capped-CRF encode, two-pass retry on overshoot) with asyncio subprocesses;
+    encodes still take core slots from the shared encode scheduler
+  - upload_file: streamed PUT to the signed URL, read from disk off the event
+    loop; resumable upload URLs are handed to uploader.SignedUploader in a
+    worker thread, since resuming needs its offset bookkeeping
+  - upload_video / start_world_generation: world_client's upload_steps and
+    generation_steps (prepare_upload, fallbacks), awaited (see steps.py);
+    create_video_world_variants starts one generation per mode variant
+  - watch_operation: one coroutine per operation, with the operation poller's
+    adaptive intervals and failure backoff
+
+Requires httpx (pip install httpx); only asgi_server.py imports this module.
+"""
+
+import asyncio
+import os
+import time
+from typing import Callable, Optional
+
+import httpx
+
+from api_client import DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT, settings_from_env
+from encode_scheduler import get_encode_scheduler
+from media_cache import MediaAssetCache
+from poller import (
+    MAX_INTERVAL_S,
+    MIN_INTERVAL_S,
+    next_interval,
+    operation_outcome,
+    operation_progress,
+    poll_failure_delay,
+)
+from retry import DEFAULT_RETRY_POLICIES, RETRYABLE_STATUSES, CircuitBreaker, retry_after_s
+from retry import is_transient as is_transient_sync
+from telemetry import span
+from uploader import CHUNK_SIZE, UPLOAD_TIMEOUT, SignedUploader
+from steps import run_steps_async
+from video_prep import (
+    DEFAULT_SAMPLING,
+    compression_steps,
+    ffmpeg_failure,
+    ffprobe_cmd,
+    missing_tool_error,
+    summarize_probe,
+)
+from world_client import (
+    DEFAULT_MODE,
+    GENERATION_MODES,
+    MAX_VIDEO_UPLOAD_FRAMES,
+    MAX_VIDEO_UPLOAD_MB,
+    MODE_VARIANTS,
+    VARIANT_MODELS,
+    MediaAssetRejected,
+    check_media_path,
+    default_client,
+    describe_world,
+    generation_steps,
+    get_media_cache,
+    get_uploader,
+    media_asset_of,
+    print_progress,
+    upload_params,
+    upload_steps,
+    video_world_prompt,
+)
+
+_api = None
+
+
+def never_sent(exc: Exception) -> bool:
+    """True when the connection was never established, so the server cannot have seen the request."""
+    return isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout))
+
+
+def is_transient(exc: Exception) -> bool:
+    """retry.is_transient for httpx errors (and CircuitOpenError)."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRYABLE_STATUSES
+    return isinstance(exc, httpx.TransportError) or is_transient_sync(exc)
+
+
+class AsyncApiClient:
+    """api_client.ApiClient on an httpx.AsyncClient; waits between retries without blocking the loop."""
+
+    def __init__(
+        self,
+        api_base: str,
+        api_key: str,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        timeout=DEFAULT_TIMEOUT,
+        breaker: CircuitBreaker = None,
+    ):
+        self.api_base = api_base.rstrip("/")
+        self.api_key = api_key
+        connect_s, read_s = timeout
+        self.http = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_s, connect=connect_s),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+        self.retry_policies = dict(DEFAULT_RETRY_POLICIES)
+        self.breaker = breaker or CircuitBreaker()
+
+    @classmethod
+    def from_env(cls, api_base: str, api_key: str) -> "AsyncApiClient":
+        return cls(api_base, api_key, breaker=CircuitBreaker.from_env(), **settings_from_env())
+
+    async def request(self, method: str, path: str, headers=None, span_name: str = "api", **kwargs) -> httpx.Response:
+        """ApiClient.request: retries per retry_policies[span_name]; returns the last response."""
+        policy = self.retry_policies.get(span_name) or self.retry_policies["api"]
+        all_headers = {"WLT-Api-Key": self.api_key}
+        all_headers.update(headers or {})
+        started_at = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.before_call()
+            try:
+                with span(span_name, method=method, attempt=attempt) as attrs:
+                    r = await self.http.request(method, self.api_base + path, headers=all_headers, **kwargs)
+                    attrs["status"] = r.status_code
+            except httpx.TransportError as exc:
+                self.breaker.record_failure()
+                retryable = policy.is_idempotent(method) or never_sent(exc)
+                delay = policy.next_delay(attempt, started_at) if retryable else None
+                if delay is None:
+                    raise
+                reason = type(exc).__name__
+            else:
+                if r.status_code in RETRYABLE_STATUSES:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if not policy.retries_status(method, r.status_code):
+                    return r
+                delay = policy.next_delay(attempt, started_at, retry_after_s(r))
+                if delay is None:
+                    return r
+                reason = "HTTP %d" % r.status_code
+            print("%s %s failed (%s); retrying in %.1fs (attempt %d/%d)..."
+                  % (method, path, reason, delay, attempt + 1, policy.max_attempts))
+            await asyncio.sleep(delay)
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", path, **kwargs)
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+def get_api() -> AsyncApiClient:
+    """Process-wide async client; create and use it from the server's event loop only."""
+    global _api
+    if _api is None:
+        _api = AsyncApiClient.from_env(default_client().api_base, default_client().api_key)
+    return _api
+
+
+async def run_ffmpeg(cmd: list, what: str = "Video compression") -> str:
+    """video_prep.run_ffmpeg as an asyncio subprocess; returns stdout. Killed if the task is cancelled."""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+    except FileNotFoundError:
+        raise missing_tool_error(cmd[0])
+    try:
+        stdout, stderr = await proc.communicate()
+    except asyncio.CancelledError:
+        proc.kill()
+        await proc.wait()
+        raise
+    stdout = stdout.decode("utf-8", "replace")
+    if proc.returncode != 0:
+        raise ffmpeg_failure(what, stderr.decode("utf-8", "replace"), stdout)
+    return stdout
+
+
+async def run_encode(cmd_for_threads, threads: int):
+    """video_prep.run_encode: hold core slots of the shared scheduler while ffmpeg runs."""
+    scheduler = get_encode_scheduler()
+    acquiring = asyncio.ensure_future(asyncio.to_thread(scheduler.acquire, threads))
+    try:
+        held = await asyncio.shield(acquiring)
+    except asyncio.CancelledError:
+        # The worker thread cannot be interrupted and still takes the slots; hand them back when it does.
+        acquiring.add_done_callback(release_acquired)
+        raise
+    try:
+        return await run_ffmpeg(cmd_for_threads(held))
+    finally:
+        scheduler.release(held)
+
+
+def release_acquired(acquiring: asyncio.Future):
+    if not acquiring.cancelled() and acquiring.exception() is None:
+        get_encode_scheduler().release(acquiring.result())
+
+
+async def compress_video(
+    input_path: str,
+    max_size_mb: int = MAX_VIDEO_UPLOAD_MB,
+    max_frames: int = MAX_VIDEO_UPLOAD_FRAMES,
+    sampling: str = DEFAULT_SAMPLING,
+    output_path: Optional[str] = None,
+) -> str:
+    """video_prep.compress_video_for_upload without segment-parallel mode; returns the path to upload."""
+    with span("compress", bytes_in=os.path.getsize(input_path), sampling=sampling) as attrs:
+        steps = compression_steps(input_path, max_size_mb, max_frames, sampling, output_path, attrs)
+        output_path = await run_steps_async(steps, run_compression_step)
+        attrs["bytes"] = os.path.getsize(output_path)
+        return output_path
+
+
+async def run_compression_step(step):
+    """Execute one video_prep.compression_steps step with asyncio subprocesses."""
+    if step[0] == "probe":
+        return summarize_probe(await run_ffmpeg(ffprobe_cmd(step[1]), what="ffprobe"), step[1])
+    if step[0] == "ffmpeg":
+        return await run_ffmpeg(step[1])
+    return await run_encode(step[1], step[2])
+
+
+async def file_chunks(path: str):
+    """The file's bytes in CHUNK_SIZE pieces, each read in a worker thread."""
+    with open(path, "rb") as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+async def upload_file(http: httpx.AsyncClient, path: str, upload_url: str, required_headers: dict,
+                      content_type: Optional[str] = None):
+    """SignedUploader.upload: each header strategy in turn until the signed PUT succeeds."""
+    content_type = content_type or "application/octet-stream"
+    if SignedUploader.is_resumable(required_headers):
+        await asyncio.to_thread(get_uploader().upload, path, upload_url, required_headers, content_type)
+        return
+
+    file_size = os.path.getsize(path)
+    timeout = httpx.Timeout(UPLOAD_TIMEOUT[1], connect=UPLOAD_TIMEOUT[0])
+    err_parts = []
+    for attempt, headers in enumerate(SignedUploader.header_strategies(required_headers, content_type), start=1):
+        headers["Content-Length"] = str(file_size)
+        with span("upload_attempt", attempt=attempt, resumable=False) as attrs:
+            try:
+                r = await http.put(upload_url, content=file_chunks(path), headers=headers, timeout=timeout)
+            except httpx.HTTPError as exc:
+                attrs["status"] = "error"
+                err_parts.append("attempt%d_error=%s" % (attempt, exc))
+                continue
+            attrs["status"] = r.status_code
+            if r.is_success:
+                attrs["bytes"] = file_size
+                print("Upload complete (HTTP %d)" % r.status_code)
+                return
+            err_parts.append("attempt%d_http=%d body=%s" % (attempt, r.status_code, r.text[:300]))
+    raise RuntimeError("Signed upload failed: " + " | ".join(err_parts))
+
+
+async def upload_video(
+    api: AsyncApiClient,
+    path: str,
+    input_sha256: Optional[str] = None,
+    compress: bool = True,
+    sampling: str = DEFAULT_SAMPLING,
+    on_stage: Optional[Callable] = None,
+) -> str:
+    """WorldClient.upload_media_file for a video; returns the media_asset id.
+
+    on_stage(stage, **detail) is awaited before compression and upload. input_sha256, when the
+    caller already hashed the file, saves re-reading it for the media cache key.
+    """
+    path = check_media_path(path, "video")
+
+    cache = get_media_cache()
+    cache_key = None
+    if cache is not None:
+        params = upload_params("video", compress, sampling)
+        if input_sha256:
+            cache_key = MediaAssetCache.key_for_sha256(input_sha256, "video", params)
+        else:
+            cache_key = await asyncio.to_thread(MediaAssetCache.key_for, path, "video", params)
+        cached_id = await asyncio.to_thread(default_client().reuse_cached_media, cache_key, path)
+        if cached_id:
+            if on_stage:
+                await on_stage("uploading", cached=True, media_asset_id=cached_id)
+            return cached_id
+
+    if compress:
+        if on_stage:
+            await on_stage("compressing")
+        path = await compress_video(path, sampling=sampling)
+
+    async def execute(step):
+        if step[0] == "prepare_upload":
+            prep = await api.post("/media-assets:prepare_upload", json=step[1], span_name="prepare_upload")
+            prep.raise_for_status()
+            return prep.json()
+        if step[0] == "stage":
+            if on_stage:
+                await on_stage(step[1], **step[2])
+            return None
+        return await upload_file(api.http, *step[1:])
+
+    media_asset_id = await run_steps_async(upload_steps(path, "video"), execute)
+    if cache is not None:
+        await asyncio.to_thread(cache.put, cache_key, media_asset_id)
+    return media_asset_id
+
+
+async def start_world_generation(
+    api: AsyncApiClient,
+    display_name: str,
+    world_prompt: dict,
+    using_default_video_prompt: bool = False,
+    on_stage: Optional[Callable] = None,
+    model: Optional[str] = None,
+) -> str:
+    """WorldClient.start_world_generation; returns the operation id."""
+    if on_stage:
+        await on_stage("generating")
+    cached_media = default_client().is_reused_media(media_asset_of(world_prompt))
+
+    async def execute(step):
+        if step[0] == "sleep":
+            await asyncio.sleep(step[1])
+            return None
+        r = await generate_request(api, step[1], step[2])
+        return r.status_code, r.text or r.reason_phrase, r.json() if r.is_success else None
+
+    steps = generation_steps(display_name, world_prompt, using_default_video_prompt, model, cached_media)
+    return await run_steps_async(steps, execute)
+
+
+async def generate_request(api: AsyncApiClient, payload: dict, attrs: dict) -> httpx.Response:
+    attrs["attempts"] += 1
+    return await api.post("/worlds:generate", json=payload, span_name="generate_request")
+
+
+async def create_video_world(
+    api: AsyncApiClient,
+    path: str,
+    display_name: str,
+    text_prompt: Optional[str],
+    input_sha256: Optional[str] = None,
+    compress: bool = True,
+    sampling: str = DEFAULT_SAMPLING,
+    on_stage: Optional[Callable] = None,
+) -> str:
+    """WorldClient.create_world for a video; returns the operation id."""
+    operations = await create_video_world_variants(
+        api, path, display_name, text_prompt, "full", input_sha256, compress, sampling, on_stage
+    )
+    return operations["full"]
+
+
+async def create_video_world_variants(
+    api: AsyncApiClient,
+    path: str,
+    display_name: str,
+    text_prompt: Optional[str],
+    mode: str = DEFAULT_MODE,
+    input_sha256: Optional[str] = None,
+    compress: bool = True,
+    sampling: str = DEFAULT_SAMPLING,
+    on_stage: Optional[Callable] = None,
+) -> dict:
+    """WorldClient.create_world_variants for a video; returns {variant: operation_id}.
+
+    A cached media asset id that worlds:generate rejects is dropped from the cache and the video
+    uploaded again, once.
+    """
+    if mode not in MODE_VARIANTS:
+        raise ValueError("mode must be one of %s" % ", ".join(GENERATION_MODES))
+    media_asset_id = await upload_video(api, path, input_sha256, compress, sampling, on_stage)
+    world_prompt, using_default_video_prompt = video_world_prompt(media_asset_id, text_prompt)
+    operations = {}
+    for variant in MODE_VARIANTS[mode]:
+        model = VARIANT_MODELS[variant]
+        try:
+            operations[variant] = await start_world_generation(
+                api, display_name, world_prompt, using_default_video_prompt, on_stage, model=model
+            )
+        except MediaAssetRejected as exc:
+            if await asyncio.to_thread(default_client().forget_rejected_media, exc.media_asset_id) is None:
+                raise
+            print("Cached media asset %s was rejected (%s); uploading it again..." % (exc.media_asset_id, exc))
+            media_asset_id = await upload_video(api, path, input_sha256, compress, sampling, on_stage)
+            world_prompt, using_default_video_prompt = video_world_prompt(media_asset_id, text_prompt)
+            operations[variant] = await start_world_generation(
+                api, display_name, world_prompt, using_default_video_prompt, on_stage, model=model
+            )
+    return operations
+
+
+async def fetch_operation(api: AsyncApiClient, operation_id: str) -> dict:
+    r = await api.get(f"/operations/{operation_id}", span_name="poll")
+    r.raise_for_status()
+    return r.json()
+
+
+async def watch_operation(
+    api: AsyncApiClient,
+    operation_id: str,
+    on_progress: Optional[Callable] = None,
+    min_interval: float = MIN_INTERVAL_S,
+    max_interval: float = MAX_INTERVAL_S,
+) -> dict:
+    """Poll operation_id until done, like OperationPoller; returns the described world.
+
+    on_progress(operation_id, description, op) is called (not awaited) after every poll.
+    """
+    interval = min_interval
+    last_progress = None
+    errors = 0
+    first_error_at = None
+    while True:
+        try:
+            op = await fetch_operation(api, operation_id)
+        except Exception as exc:
+            errors += 1
+            if first_error_at is None:
+                first_error_at = time.monotonic()
+            delay = poll_failure_delay(exc, errors, first_error_at, is_transient(exc))
+            if delay is None:
+                raise
+            print("Poll of %s failed (%s); retrying in %.1fs" % (operation_id, exc, delay))
+            await asyncio.sleep(delay)
+            continue
+        errors = 0
+        first_error_at = None
+
+        progress = operation_progress(op)
+        print_progress(operation_id, progress, op)
+        if on_progress:
+            on_progress(operation_id, progress, op)
+        if op.get("done", False):
+            return describe_world(operation_id, operation_outcome(op))
+
+        interval = next_interval(interval, progress != last_progress, min_interval, max_interval)
+        last_progress = progress
+        await asyncio.sleep(interval)
@@ -0,0 +1,203 @@
+"""
+Batch world generation from a manifest (create_world.py --batch).
+
+Manifest: JSONL (one object per line) or CSV with a header row. Fields:
+  type      text | video | image (required)
+  file      path to the video/image, relative to the manifest (video/image only)
+  prompt    optional text prompt
+  name      optional display name (default: "Generated World")
+  sampling  optional video frame sampling (default: uniform)
+  id        optional stable job id (default: derived from all of the fields above)
+
+Compression and upload run on a small pool ahead of generation, so the next
+jobs are prepared while earlier ones are still generating; at most
+`concurrency` generations are in flight at once. Image entries are all queued
+up front for downscaling in worker processes (see image_prep.py), so their
+uploads find them ready. Each finished job is appended to the results JSONL
+immediately, and a rerun skips ids already recorded there with status "done".
+"""
+
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from rate_limit import TokenBucket
+from video_prep import DEFAULT_SAMPLING
+from world_client import (
+    describe_world,
+    get_client,
+    get_poller,
+    prefetch_image,
+    prepare_world_prompt,
+    start_world_generation,
+)
+
+# API endpoints throttled by --rate-limit.
+RATE_LIMITED_PATHS = ("/worlds:generate", "/media-assets:prepare_upload")
+
+
+def load_manifest(path: str) -> list:
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, newline="") as f:
+        if path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    jobs = []
+    for line_no, row in enumerate(rows, start=1):
+        row = {k: v for k, v in row.items() if v not in (None, "")}
+        if row.get("type") not in ("text", "video", "image"):
+            raise ValueError("Manifest entry %d: type must be text, video, or image" % line_no)
+        if row["type"] in ("video", "image"):
+            if not row.get("file"):
+                raise ValueError("Manifest entry %d: file is required for %s" % (line_no, row["type"]))
+            row["file"] = os.path.join(base_dir, row["file"])
+        row.setdefault("name", "Generated World")
+        row.setdefault("sampling", DEFAULT_SAMPLING)
+        if not row.get("id"):
+            key = [row["type"], row.get("file"), row.get("prompt"), row["name"]]
+            if row["sampling"] != DEFAULT_SAMPLING:
+                # Appended only when set, so rows using the default keep the ids earlier runs recorded.
+                key.append(row["sampling"])
+            row["id"] = hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()[:16]
+        jobs.append(row)
+    return jobs
+
+
+def completed_job_ids(results_path: str) -> set:
+    done = set()
+    if not os.path.exists(results_path):
+        return done
+    with open(results_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # partial line from an interrupted run
+            if record.get("status") == "done":
+                done.add(record.get("id"))
+    return done
+
+
+class BatchRunner:
+    def __init__(self, jobs: list, results_path: str, concurrency: int = 4, prepare_workers: int = 2):
+        self.jobs = jobs
+        self.results_path = results_path
+        self.concurrency = concurrency
+        self.prepare_workers = prepare_workers
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._results_lock = threading.Lock()
+        self._remaining = 0
+        self._all_done = threading.Event()
+        self.failed = 0
+
+    def run(self) -> int:
+        """Run every job not already completed; returns the number of failures."""
+        done = completed_job_ids(self.results_path)
+        pending = [job for job in self.jobs if job["id"] not in done]
+        print(
+            "Batch: %d jobs, %d already done, %d to run (concurrency %d)"
+            % (len(self.jobs), len(self.jobs) - len(pending), len(pending), self.concurrency)
+        )
+        if not pending:
+            return 0
+
+        self._remaining = len(pending)
+        for job in pending:
+            if job["type"] == "image":
+                try:
+                    prefetch_image(job["file"])
+                except (OSError, ValueError) as exc:
+                    # The job itself reports the problem when it gets to its upload.
+                    print("[batch] %s: could not prefetch image (%s)" % (job["id"], exc))
+        with ThreadPoolExecutor(max_workers=self.prepare_workers, thread_name_prefix="batch-prepare") as pool:
+            for job in pending:
+                pool.submit(self._run_job, job)
+            self._all_done.wait()
+        return self.failed
+
+    def _run_job(self, job: dict):
+        started_at = time.time()
+        try:
+            world_prompt, using_default = prepare_world_prompt(
+                job["type"], job.get("file"), job.get("prompt"), sampling=job["sampling"]
+            )
+        except Exception as exc:
+            self._record(job, started_at, error=exc)
+            return
+
+        # Waiting here holds this prepare worker, which bounds how far preparation runs ahead.
+        self._slots.acquire()
+        try:
+            operation_id = start_world_generation(job["name"], world_prompt, using_default)
+        except Exception as exc:
+            self._slots.release()
+            self._record(job, started_at, error=exc)
+            return
+
+        def finished(future):
+            self._slots.release()
+            try:
+                world = describe_world(operation_id, future.result())
+            except Exception as exc:
+                self._record(job, started_at, error=exc, operation_id=operation_id)
+            else:
+                self._record(job, started_at, world=world)
+
+        try:
+            get_poller().submit(operation_id).add_done_callback(finished)
+        except Exception as exc:
+            self._slots.release()
+            self._record(job, started_at, error=exc, operation_id=operation_id)
+
+    def _record(self, job: dict, started_at: float, world=None, error=None, operation_id=None):
+        """Append the job's outcome to the results file; the job counts as finished even if that fails."""
+        status = "error" if error is not None else "done"
+        with self._results_lock:
+            try:
+                record = {"id": job["id"], "name": job["name"], "type": job["type"], "status": status}
+                if error is not None:
+                    record["error"] = str(error)
+                    if operation_id:
+                        record["operation_id"] = operation_id
+                else:
+                    record.update(world)
+                record["elapsed_s"] = round(time.time() - started_at, 1)
+                with open(self.results_path, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+                    f.flush()
+            finally:
+                # Otherwise run() would wait forever for this job.
+                if error is not None:
+                    self.failed += 1
+                self._remaining -= 1
+                print("[batch] %s %s (%d left)" % (job["id"], status, self._remaining))
+                if self._remaining == 0:
+                    self._all_done.set()
+
+
+def run_batch(
+    manifest_path: str,
+    results_path=None,
+    concurrency: int = 4,
+    rate_limit: float = 1.0,
+    prepare_workers: int = 2,
+) -> int:
+    """Run a manifest; rate_limit is the max calls/second to each of RATE_LIMITED_PATHS."""
+    results_path = results_path or os.path.splitext(manifest_path)[0] + ".results.jsonl"
+    client = get_client()
+    for path in RATE_LIMITED_PATHS:
+        client.set_rate_limit(path, TokenBucket(rate_limit, burst=max(1.0, rate_limit)))
+    try:
+        runner = BatchRunner(load_manifest(manifest_path), results_path, concurrency, prepare_workers)
+        failed = runner.run()
+    finally:
+        for path in RATE_LIMITED_PATHS:
+            client.set_rate_limit(path, None)
+    print("Batch finished: %d failed. Results: %s" % (failed, results_path))
+    return failed
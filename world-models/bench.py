@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+End-to-end latency/throughput benchmark against the local mock API.
+
+Starts mock_worldlabs.py, then drives either the CLI (one create_world.py
+process per job), world_server.py or asgi_server.py (POST /generate-worldvr,
+stage timings from the SSE stream) at a fixed concurrency, using assets/*.upload.mp4 as
+fixtures. Reports p50/p95/p99 per stage and jobs per minute.
+
+Usage:
+  python bench.py --target cli --jobs 8 --concurrency 4
+  python bench.py --target server --jobs 32 --concurrency 8 --failure-rate 0.02 --json bench.json
+  python bench.py --target server --mock-url http://127.0.0.1:8765   # reuse a running mock
+  python bench.py --target asgi --jobs 200 --concurrency 100 --generation-s 60
+  python bench.py --target server --jobs 2 --concurrency 2 --workspace-quota-mb 32 --check
+
+--check exits non-zero unless every job succeeds, e.g. to catch jobs that
+stall on a scratch-space quota only just large enough for the requests in
+flight (WORLD_WORKSPACE_QUOTA_MB, see workspace.py).
+
+CLI stages are delimited by the CLI's own progress lines:
+  prepare   process start -> "Preparing upload" (startup, probe, compression)
+  upload    -> "Starting world generation"
+  submit    -> "Operation ID"
+  generate  -> "Done!"
+Server stages are the job's SSE events (receiving, queued, compressing, uploading,
+generating), each measured until the next stage begins.
+"""
+
+import argparse
+import glob
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_FIXTURES = os.path.join(HERE, "assets", "*.upload.mp4")
+
+CLI_MARKERS = (
+    ("prepare", "Preparing upload"),
+    ("upload", "Starting world generation"),
+    ("submit", "Operation ID"),
+    ("generate", "Done!"),
+)
+SERVER_STAGES = ("request", "receiving", "queued", "compressing", "uploading", "generating")
+SERVER_SCRIPTS = {"server": "world_server.py", "asgi": "asgi_server.py"}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port: int, proc: subprocess.Popen, what: str, timeout_s: float = 30.0):
+    deadline = time.time() + timeout_s
+    while time.time() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError("%s exited with code %d during startup" % (what, proc.returncode))
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("%s did not start listening on port %d" % (what, port))
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return float("nan")
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def start_mock(args) -> tuple:
+    """Start mock_worldlabs.py in a subprocess; returns (process, api_base)."""
+    port = free_port()
+    cmd = [
+        sys.executable,
+        os.path.join(HERE, "mock_worldlabs.py"),
+        "--port", str(port),
+        "--latency", str(args.latency),
+        "--generation-s", str(args.generation_s),
+        "--failure-rate", str(args.failure_rate),
+        "--upload-race-rate", str(args.upload_race_rate),
+    ]
+    if args.resumable:
+        cmd.append("--resumable")
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_for_port(port, proc, "mock API")
+    return proc, "http://127.0.0.1:%d" % port
+
+
+def bench_env(mock_url: str, workspace_quota_mb: float = 0.0) -> dict:
+    env = dict(os.environ)
+    if workspace_quota_mb:
+        env["WORLD_WORKSPACE_QUOTA_MB"] = str(workspace_quota_mb)
+    env.update(
+        {
+            "WORLD_LABS_API_BASE": mock_url.rstrip("/") + "/marble/v1",
+            "WORLD_LABS_API_KEY": "bench",
+            "WORLD_MEDIA_CACHE": "0",
+            "PYTHONUNBUFFERED": "1",
+        }
+    )
+    return env
+
+
+def run_cli_job(fixture: str, env: dict) -> dict:
+    started = time.time()
+    marks = {}
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "create_world.py"), "--type", "video", "--file", fixture],
+        cwd=HERE,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+    tail = []
+    for line in proc.stdout:
+        tail = (tail + [line.rstrip()])[-5:]
+        for stage, marker in CLI_MARKERS:
+            if stage not in marks and line.startswith(marker):
+                marks[stage] = time.time()
+    proc.wait()
+    finished = time.time()
+
+    stages = {}
+    previous = started
+    for stage, _ in CLI_MARKERS:
+        if stage not in marks:
+            break
+        stages[stage] = marks[stage] - previous
+        previous = marks[stage]
+    ok = proc.returncode == 0 and "generate" in marks
+    return {
+        "fixture": os.path.basename(fixture),
+        "ok": ok,
+        "total": finished - started,
+        "stages": stages,
+        "error": None if ok else " | ".join(tail),
+    }
+
+
+def run_server_job(fixture: str, server_url: str, timeout_s: float) -> dict:
+    started = time.time()
+    with open(fixture, "rb") as f:
+        r = requests.post(
+            server_url + "/generate-worldvr",
+            files={"video": (os.path.basename(fixture), f, "video/mp4")},
+            # A unique name per job keeps the server from deduplicating repeated fixtures.
+            data={"name": "bench-%s" % uuid.uuid4().hex[:12]},
+            timeout=timeout_s,
+        )
+    accepted = time.time()
+    if r.status_code != 202:
+        return {"fixture": os.path.basename(fixture), "ok": False, "total": accepted - started,
+                "stages": {}, "error": "HTTP %d: %s" % (r.status_code, r.text[:200])}
+
+    events = []
+    with requests.get(server_url + r.json()["events_url"], stream=True, timeout=timeout_s) as stream:
+        stage = None
+        for line in stream.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                stage = line.split(":", 1)[1].strip()
+            elif line.startswith("data:") and stage:
+                events.append((stage, json.loads(line.split(":", 1)[1])))
+                if stage in ("done", "error"):
+                    break
+            # Heartbeats keep a stalled job's stream open, so bound the whole job too.
+            if time.time() - started > timeout_s:
+                events.append(("error", {"detail": {"error": "no result within %.0fs" % timeout_s}}))
+                break
+    finished = time.time()
+
+    stages = {"request": accepted - started}
+    first_seen = []
+    for stage, data in events:
+        if not first_seen or first_seen[-1][0] != stage:
+            first_seen.append((stage, data.get("at", finished)))
+    for (stage, at), (_, next_at) in zip(first_seen, first_seen[1:]):
+        stages[stage] = stages.get(stage, 0.0) + (next_at - at)
+
+    final = events[-1] if events else ("error", {"detail": {"error": "event stream ended early"}})
+    ok = final[0] == "done"
+    return {
+        "fixture": os.path.basename(fixture),
+        "ok": ok,
+        "total": finished - started,
+        "stages": stages,
+        "error": None if ok else str(final[1].get("detail", {}).get("error")),
+    }
+
+
+def run_jobs(job_fn, fixtures: list, jobs: int, concurrency: int) -> tuple:
+    results = []
+    lock = threading.Lock()
+
+    def one(i):
+        result = job_fn(fixtures[i % len(fixtures)])
+        with lock:
+            results.append(result)
+            print(
+                "[bench] %d/%d %s %s in %.1fs"
+                % (len(results), jobs, result["fixture"], "ok" if result["ok"] else "FAILED", result["total"])
+            )
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(jobs)))
+    return results, time.time() - started
+
+
+def summarize(results: list, wall_s: float, stage_names) -> dict:
+    ok = [r for r in results if r["ok"]]
+    summary = {
+        "jobs": len(results),
+        "succeeded": len(ok),
+        "failed": len(results) - len(ok),
+        "wall_s": round(wall_s, 2),
+        "jobs_per_min": round(len(ok) / wall_s * 60.0, 2) if wall_s else 0.0,
+        "stages": {},
+    }
+    for stage in list(stage_names) + ["total"]:
+        values = [r["total"] if stage == "total" else r["stages"].get(stage) for r in ok]
+        values = [v for v in values if v is not None]
+        if values:
+            summary["stages"][stage] = {
+                "n": len(values),
+                "p50": round(percentile(values, 50), 3),
+                "p95": round(percentile(values, 95), 3),
+                "p99": round(percentile(values, 99), 3),
+            }
+    summary["errors"] = sorted({r["error"] for r in results if not r["ok"]})[:10]
+    return summary
+
+
+def print_summary(summary: dict):
+    print("\n%-12s %6s %9s %9s %9s" % ("stage", "n", "p50 s", "p95 s", "p99 s"))
+    for stage, s in summary["stages"].items():
+        print("%-12s %6d %9.3f %9.3f %9.3f" % (stage, s["n"], s["p50"], s["p95"], s["p99"]))
+    print(
+        "\n%d/%d jobs succeeded in %.1fs (%.2f jobs/min)"
+        % (summary["succeeded"], summary["jobs"], summary["wall_s"], summary["jobs_per_min"])
+    )
+    for error in summary["errors"]:
+        print("  error:", error)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark create_world.py, world_server.py or asgi_server.py against a mock API."
+    )
+    parser.add_argument("--target", choices=["cli"] + sorted(SERVER_SCRIPTS), default="server")
+    parser.add_argument("--jobs", type=int, default=8, help="Total jobs to run")
+    parser.add_argument("--concurrency", type=int, default=4, help="Jobs in flight at once")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, help="Glob of input videos")
+    parser.add_argument("--json", dest="json_path", help="Also write the summary to this file")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Per-job timeout in seconds (server target)")
+    parser.add_argument(
+        "--workspace-quota-mb", type=float, default=0.0, help="WORLD_WORKSPACE_QUOTA_MB for the jobs (default: none)"
+    )
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 unless every job succeeds")
+
+    mock = parser.add_argument_group("mock API (ignored with --mock-url)")
+    mock.add_argument("--mock-url", help="Use an already running mock (e.g. http://127.0.0.1:8765)")
+    mock.add_argument("--latency", type=float, default=0.05)
+    mock.add_argument("--generation-s", type=float, default=5.0)
+    mock.add_argument("--failure-rate", type=float, default=0.0)
+    mock.add_argument("--upload-race-rate", type=float, default=0.0)
+    mock.add_argument("--resumable", action="store_true")
+    args = parser.parse_args()
+
+    fixtures = sorted(glob.glob(args.fixtures))
+    if not fixtures:
+        parser.error("no fixtures match %s" % args.fixtures)
+
+    processes = []
+    try:
+        if args.mock_url:
+            mock_url = args.mock_url
+        else:
+            mock_proc, mock_url = start_mock(args)
+            processes.append(mock_proc)
+        env = bench_env(mock_url, args.workspace_quota_mb)
+        print(
+            "Benchmarking %s: %d jobs at concurrency %d against %s"
+            % (args.target, args.jobs, args.concurrency, mock_url)
+        )
+
+        if args.target == "cli":
+            results, wall_s = run_jobs(lambda f: run_cli_job(f, env), fixtures, args.jobs, args.concurrency)
+            stage_names = [stage for stage, _ in CLI_MARKERS]
+        else:
+            port = free_port()
+            env["PORT"] = str(port)
+            script = SERVER_SCRIPTS[args.target]
+            server = subprocess.Popen(
+                [sys.executable, os.path.join(HERE, script)],
+                cwd=HERE,
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            processes.append(server)
+            wait_for_port(port, server, script)
+            server_url = "http://127.0.0.1:%d" % port
+            results, wall_s = run_jobs(
+                lambda f: run_server_job(f, server_url, args.timeout), fixtures, args.jobs, args.concurrency
+            )
+            stage_names = SERVER_STAGES
+    finally:
+        for proc in reversed(processes):
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    summary = summarize(results, wall_s, stage_names)
+    summary.update({"target": args.target, "concurrency": args.concurrency})
+    print_summary(summary)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(summary, f, indent=2)
+        print("Wrote", args.json_path)
+    if args.check and summary["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Parallel downloader for generated World Labs assets (splats, meshes, panoramas).
+
+A first GET for byte 0 learns the asset's size, whether the storage backend
+serves ranges, its ETag and any checksum it publishes. Large assets are then
+fetched as fixed-size ranges on several connections at once, each written
+at its offset in a preallocated file; every range is retried on its own with
+jittered backoff, and pinned to the first ETag (If-Match) so a replaced object
+fails the download instead of mixing versions. Backends without range support
+get one streamed GET, retried from the start (pinned the same way) when it
+fails or comes up short.
+
+The finished file is checked against the size, the MD5 the backend reports
+(x-goog-hash / Content-MD5) and, when the caller knows it, the expected
+sha256, before it is handed back.
+
+Environment:
+  WORLD_DOWNLOAD_PARALLEL   concurrent range requests per asset (default 4)
+  WORLD_DOWNLOAD_PART_MB    size of each range request (default 8)
+"""
+
+import base64
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from urllib.parse import urlparse
+
+import requests
+
+from media_cache import HASH_CHUNK_BYTES
+from retry import RETRYABLE_STATUSES, RetryPolicy, retry_after_s
+from telemetry import span
+from uploader import CHUNK_SIZE, UPLOAD_TIMEOUT, ProgressReporter
+
+DEFAULT_PARALLEL = 4
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+# (connect, read) timeout for each download request.
+DOWNLOAD_TIMEOUT = UPLOAD_TIMEOUT
+# Jittered backoff between attempts of one range (or of the whole single-stream download).
+DOWNLOAD_RETRY = RetryPolicy(max_attempts=5, base_s=0.5, max_s=10.0, budget_s=300.0, idempotent=True)
+
+
+def asset_urls(result: dict) -> dict:
+    """{name: url} for every downloadable asset in a finished operation, e.g. "splats.spz_urls.full_res".
+
+    Walks response["assets"], whose layout varies by model and world type, and keeps every
+    http(s) URL under the dotted path of keys leading to it.
+    """
+    urls = {}
+
+    def walk(prefix: str, value):
+        if isinstance(value, dict):
+            for key, child in value.items():
+                walk("%s.%s" % (prefix, key) if prefix else str(key), child)
+        elif isinstance(value, str) and value.startswith(("http://", "https://")):
+            urls[prefix] = value
+
+    walk("", ((result or {}).get("response") or {}).get("assets") or {})
+    return urls
+
+
+def asset_extension(url: str) -> str:
+    """File extension of an asset URL (".spz", ".glb", ...), or "" when it has no usable one."""
+    ext = os.path.splitext(urlparse(url).path)[1].lower()
+    return ext if 1 < len(ext) <= 8 and ext[1:].isalnum() else ""
+
+
+def reported_md5(headers) -> Optional[str]:
+    """Hex MD5 of the whole object from x-goog-hash (md5=<base64>) or Content-MD5, if present."""
+    values = [part.strip() for part in headers.get("x-goog-hash", "").split(",")]
+    encoded = next((v[4:] for v in values if v.startswith("md5=")), None) or headers.get("Content-MD5")
+    if not encoded:
+        return None
+    try:
+        return base64.b64decode(encoded).hex()
+    except ValueError:
+        return None
+
+
+def file_digests(path: str):
+    """(sha256, md5) hex digests of a file, read once."""
+    sha256, md5 = hashlib.sha256(), hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            sha256.update(chunk)
+            md5.update(chunk)
+    return sha256.hexdigest(), md5.hexdigest()
+
+
+class DownloadAttemptError(Exception):
+    def __init__(self, message: str, retryable: bool = True, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class AssetDownloader:
+    def __init__(
+        self,
+        session: Optional[requests.Session] = None,
+        parallel: int = DEFAULT_PARALLEL,
+        part_size: int = DEFAULT_PART_SIZE,
+    ):
+        self.session = session or requests.Session()
+        self.parallel = max(1, parallel)
+        self.part_size = max(CHUNK_SIZE, part_size)
+
+    @classmethod
+    def from_env(cls, session: Optional[requests.Session] = None) -> "AssetDownloader":
+        return cls(
+            session,
+            parallel=int(os.environ.get("WORLD_DOWNLOAD_PARALLEL", str(DEFAULT_PARALLEL))),
+            part_size=int(float(os.environ.get("WORLD_DOWNLOAD_PART_MB", "8")) * 1024 * 1024),
+        )
+
+    def download(
+        self, url: str, dest_path: str, expected_sha256: Optional[str] = None, name: Optional[str] = None
+    ) -> dict:
+        """Download url to dest_path and verify it; returns sha256, size and content_type.
+
+        name labels progress output (default: the file name). Raises RuntimeError when the
+        download fails or a checksum does not match (dest_path is removed in that case).
+        """
+        name = name or os.path.basename(dest_path)
+        with span("download", parallel=self.parallel) as attrs:
+            try:
+                info = self._download(url, dest_path, name, attrs)
+                sha256, md5 = file_digests(dest_path)
+                if info["size"] is not None and os.path.getsize(dest_path) != info["size"]:
+                    raise RuntimeError(
+                        "Download of %s is %d bytes, expected %d" % (name, os.path.getsize(dest_path), info["size"])
+                    )
+                if info["md5"] and md5 != info["md5"]:
+                    raise RuntimeError("Download of %s failed its MD5 check" % name)
+                if expected_sha256 and sha256 != expected_sha256:
+                    raise RuntimeError("Download of %s failed its sha256 check" % name)
+            except BaseException:
+                if os.path.exists(dest_path):
+                    os.remove(dest_path)
+                raise
+            attrs["bytes"] = os.path.getsize(dest_path)
+            attrs["verified"] = "md5" if info["md5"] else "size"
+        return {"sha256": sha256, "size": os.path.getsize(dest_path), "content_type": info["content_type"]}
+
+    def _download(self, url: str, dest_path: str, name: str, attrs: dict) -> dict:
+        r = self._with_retries(lambda: self._probe(url), "Download of %s" % name)
+        info = {
+            "size": None,
+            "md5": reported_md5(r.headers),
+            "content_type": r.headers.get("Content-Type", "application/octet-stream"),
+        }
+        pinned = {"If-Match": r.headers["ETag"]} if r.headers.get("ETag") else {}
+        if r.status_code == 200:
+            # No range support: the probe response already carries the whole body; retries GET it again.
+            attrs["parts"] = 1
+            if "Content-Encoding" in r.headers:
+                # requests decodes the body, so the stored size and MD5 no longer apply.
+                info["md5"] = None
+            elif r.headers.get("Content-Length"):
+                info["size"] = int(r.headers["Content-Length"])
+            responses = [r]
+
+            def fetch_whole():
+                response = responses.pop() if responses else self.session.get(
+                    url, headers=pinned, stream=True, timeout=DOWNLOAD_TIMEOUT
+                )
+                self._fetch_whole(response, dest_path, name, info["size"])
+
+            self._with_retries(fetch_whole, "Download of %s" % name)
+            return info
+
+        r.close()
+        info["size"] = int(r.headers["Content-Range"].rsplit("/", 1)[1])
+        parts = [
+            (start, min(start + self.part_size, info["size"]) - 1) for start in range(0, info["size"], self.part_size)
+        ]
+        attrs["parts"] = len(parts)
+        with open(dest_path, "wb") as f:
+            f.truncate(info["size"])
+        if not parts:
+            return info
+        progress = ProgressReporter(name, info["size"], verb="Downloaded")
+        progress_lock = threading.Lock()
+
+        def on_bytes(n: int):
+            with progress_lock:
+                progress(n)
+
+        def fetch(part):
+            self._with_retries(
+                lambda: self._fetch_range(url, dest_path, part, pinned, on_bytes),
+                "Download of %s bytes %d-%d" % (name, part[0], part[1]),
+            )
+
+        with ThreadPoolExecutor(max_workers=min(self.parallel, len(parts))) as pool:
+            # list() re-raises the first failed range.
+            list(pool.map(fetch, parts))
+        return info
+
+    def _probe(self, url: str) -> requests.Response:
+        r = self.session.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=DOWNLOAD_TIMEOUT)
+        total = r.headers.get("Content-Range", "").rpartition("/")[2]
+        if r.status_code == 200 or (r.status_code == 206 and total.isdigit()):
+            return r
+        r.close()
+        raise DownloadAttemptError(
+            "status=%s" % r.status_code, r.status_code in RETRYABLE_STATUSES, retry_after_s(r)
+        )
+
+    @staticmethod
+    def _fetch_whole(r: requests.Response, dest_path: str, name: str, size: Optional[int]):
+        """Stream a whole-object response to dest_path; size (if known) must match."""
+        try:
+            if r.status_code == 412:
+                raise DownloadAttemptError("asset changed during download (ETag mismatch)", retryable=False)
+            if r.status_code != 200:
+                raise DownloadAttemptError(
+                    "status=%s" % r.status_code, r.status_code in RETRYABLE_STATUSES, retry_after_s(r)
+                )
+            progress = ProgressReporter(name, size or 0, verb="Downloaded")
+            written = 0
+            with open(dest_path, "wb") as f:
+                for chunk in r.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+                    written += len(chunk)
+                    progress(len(chunk))
+            if size is not None and written != size:
+                raise DownloadAttemptError("short read: %d of %d bytes" % (written, size))
+        finally:
+            r.close()
+
+    def _fetch_range(self, url: str, dest_path: str, part, pinned: dict, on_bytes):
+        start, end = part
+        headers = dict(pinned, Range="bytes=%d-%d" % (start, end))
+        r = self.session.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT)
+        try:
+            if r.status_code == 412:
+                raise DownloadAttemptError("asset changed during download (ETag mismatch)", retryable=False)
+            if r.status_code != 206:
+                raise DownloadAttemptError(
+                    "status=%s" % r.status_code, r.status_code in RETRYABLE_STATUSES, retry_after_s(r)
+                )
+            if not r.headers.get("Content-Range", "").startswith("bytes %d-%d/" % (start, end)):
+                raise DownloadAttemptError("unexpected Content-Range %r" % r.headers.get("Content-Range"))
+            written = 0
+            with open(dest_path, "r+b") as f:
+                f.seek(start)
+                for chunk in r.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+                    written += len(chunk)
+                    on_bytes(len(chunk))
+            if written != end - start + 1:
+                raise DownloadAttemptError("short read: %d of %d bytes" % (written, end - start + 1))
+        finally:
+            r.close()
+
+    @staticmethod
+    def _with_retries(attempt_fn, what: str):
+        started_at = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return attempt_fn()
+            except DownloadAttemptError as exc:
+                delay = DOWNLOAD_RETRY.next_delay(attempt, started_at, exc.retry_after) if exc.retryable else None
+                error = exc
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as exc:
+                delay = DOWNLOAD_RETRY.next_delay(attempt, started_at)
+                error = exc
+            if delay is None:
+                raise RuntimeError("%s failed: %s" % (what, error))
+            print("%s failed (%s); retrying in %.1fs..." % (what, error, delay))
+            time.sleep(delay)
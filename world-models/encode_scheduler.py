@@ -0,0 +1,86 @@
+"""
+Process-wide cap on concurrent ffmpeg encoder threads.
+
+Every libx264 encode acquires as many core slots as the threads it runs with,
+so simultaneous /generate-worldvr requests and segment-parallel encodes share
+the machine instead of oversubscribing it. Requests wait in FIFO order.
+
+Environment:
+  WORLD_ENCODE_SLOTS      total core slots (default: os.cpu_count())
+  WORLD_ENCODE_THREADS    threads for a whole-file encode (default: min(8, slots))
+"""
+
+import itertools
+import os
+import threading
+from contextlib import contextmanager
+
+
+class EncodeScheduler:
+    def __init__(self, slots: int):
+        self.slots = max(1, slots)
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._tickets = itertools.count()
+        self._serving = 0
+        self._waiting = 0
+
+    def acquire(self, threads: int = 1) -> int:
+        """Block until `threads` core slots (clamped to the total) are free; returns the count held."""
+        threads = max(1, min(threads, self.slots))
+        with self._cond:
+            ticket = next(self._tickets)
+            self._waiting += 1
+            # FIFO: wait for our turn, then for enough free slots, so big encodes don't starve.
+            while ticket != self._serving or self._in_use + threads > self.slots:
+                self._cond.wait()
+            self._waiting -= 1
+            self._serving += 1
+            self._in_use += threads
+            self._cond.notify_all()
+        return threads
+
+    def try_acquire(self, threads: int = 1) -> int:
+        """Take `threads` core slots only if they are free now and nobody is queued; returns the count
+        held, or 0 without waiting."""
+        threads = max(1, min(threads, self.slots))
+        with self._cond:
+            if self._waiting or self._in_use + threads > self.slots:
+                return 0
+            self._in_use += threads
+        return threads
+
+    def release(self, threads: int):
+        with self._cond:
+            self._in_use -= threads
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, threads: int = 1):
+        """Hold `threads` core slots for the duration of the block; yields the count held."""
+        held = self.acquire(threads)
+        try:
+            yield held
+        finally:
+            self.release(held)
+
+    def in_use(self) -> int:
+        with self._cond:
+            return self._in_use
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_encode_scheduler() -> EncodeScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = EncodeScheduler(int(os.environ.get("WORLD_ENCODE_SLOTS", str(os.cpu_count() or 1))))
+        return _scheduler
+
+
+def whole_file_threads() -> int:
+    scheduler = get_encode_scheduler()
+    return int(os.environ.get("WORLD_ENCODE_THREADS", str(min(8, scheduler.slots))))
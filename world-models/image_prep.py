@@ -0,0 +1,306 @@
+"""
+Image preparation for World Labs uploads (Pillow), the still-image counterpart
+of video_prep.compress_video_for_upload.
+
+prepare_image_for_upload rotates the pixels to their EXIF orientation,
+downscales so the longest edge is at most max_edge, drops EXIF/XMP metadata
+(camera, GPS) and re-encodes to JPEG or WebP. A 40 MP phone or drone PNG
+becomes a few hundred KB instead of tens of MB. Images that are already
+JPEG/WebP, small enough and free of metadata are uploaded as they are.
+
+Decoding and encoding run in a pool of worker processes shared by the whole
+process, so a batch with many stills prepares them on every core at once
+(prefetch() queues them ahead of their upload); JPEG sources are decoded at
+reduced scale when they are far larger than max_edge. Workers write into the
+pool's own workspace (see workspace.py), and each caller gets the result
+hardlinked to its output_path, so concurrent runs on one source never share
+an output file.
+
+The workers are started with spawn, which re-imports the calling script's
+__main__ module in each of them: a script that prepares images must keep its
+top-level code under `if __name__ == "__main__":` (create_world.py and the
+servers do). If the workers cannot start (no such guard) or die, the pool is
+abandoned and images are prepared in the calling process from then on.
+
+Pillow is optional: without it images are uploaded untouched.
+
+Environment:
+  WORLD_IMAGE_MAX_EDGE    longest edge in pixels (default 2048)
+  WORLD_IMAGE_FORMAT      jpeg (default) or webp
+  WORLD_IMAGE_QUALITY     encoder quality, 1-100 (default 90)
+  WORLD_IMAGE_WORKERS     worker processes (default: os.cpu_count())
+"""
+
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Optional
+
+from telemetry import span
+from workspace import get_workspaces, link_or_copy
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional dependency
+    Image = None
+    ImageOps = None
+
+IMAGE_FORMATS = {"jpeg": ("JPEG", ".jpg"), "webp": ("WEBP", ".webp")}
+DEFAULT_IMAGE_FORMAT = "jpeg"
+# Longest edge sent for generation; larger stills add upload time without improving the world.
+DEFAULT_MAX_EDGE = 2048
+DEFAULT_QUALITY = 90
+# Background for transparent pixels when the output format (JPEG) has no alpha channel.
+FLATTEN_BACKGROUND = (255, 255, 255)
+
+
+def settings_from_env() -> dict:
+    """max_edge, fmt and quality for prepare_image_for_upload from the environment."""
+    fmt = os.environ.get("WORLD_IMAGE_FORMAT", DEFAULT_IMAGE_FORMAT).lower()
+    if fmt not in IMAGE_FORMATS:
+        raise ValueError("WORLD_IMAGE_FORMAT must be one of %s" % ", ".join(IMAGE_FORMATS))
+    return {
+        "max_edge": int(os.environ.get("WORLD_IMAGE_MAX_EDGE", str(DEFAULT_MAX_EDGE))),
+        "fmt": fmt,
+        "quality": int(os.environ.get("WORLD_IMAGE_QUALITY", str(DEFAULT_QUALITY))),
+    }
+
+
+def image_output_path(input_path: str, fmt: str = DEFAULT_IMAGE_FORMAT) -> str:
+    return os.path.splitext(input_path)[0] + ".upload" + IMAGE_FORMATS[fmt][1]
+
+
+def plan_image_upload(img, max_edge: int) -> Optional[str]:
+    """Why an opened image needs re-encoding, or None if it can be uploaded as-is."""
+    if img.format not in ("JPEG", "WEBP"):
+        return "%s source" % (img.format or "unknown")
+    if max(img.size) > max_edge:
+        return "%dx%d exceeds %d px" % (img.size[0], img.size[1], max_edge)
+    if len(img.getexif()) or "xmp" in img.info or "XML:com.adobe.xmp" in img.info:
+        return "metadata present"
+    return None
+
+
+def _prepare_image(input_path: str, output_path: str, max_edge: int, fmt: str, quality: int) -> dict:
+    """Worker-process half of prepare_image_for_upload; returns what was done."""
+    with Image.open(input_path) as img:
+        reason = plan_image_upload(img, max_edge)
+        if reason is None:
+            return {"action": "passthrough", "path": input_path, "width": img.size[0], "height": img.size[1]}
+        if img.format == "JPEG":
+            # Let the decoder downscale by 1/2, 1/4 or 1/8 while it still stays >= max_edge.
+            img.draft("RGB", (max_edge, max_edge))
+        icc_profile = img.info.get("icc_profile")
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        if img.mode == "CMYK":
+            # The embedded profile describes CMYK ink, not the RGB pixels we are about to write.
+            icc_profile = None
+        pil_format = IMAGE_FORMATS[fmt][0]
+        has_alpha = img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+        if has_alpha and pil_format == "JPEG":
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, FLATTEN_BACKGROUND)
+            img.paste(rgba, mask=rgba.getchannel("A"))
+        elif has_alpha:
+            img = img.convert("RGBA")
+        elif img.mode not in ("RGB", "L") or pil_format == "WEBP":
+            img = img.convert("RGB")
+
+        # No exif=/xmp= arguments: the output carries pixels and the colour profile only.
+        options = {"quality": quality, "icc_profile": icc_profile}
+        if pil_format == "JPEG":
+            options.update(optimize=True, progressive=True)
+        else:
+            options.update(method=4)
+        img.save(output_path, pil_format, **{k: v for k, v in options.items() if v is not None})
+        width, height = img.size
+        return {"action": "encode", "reason": reason, "path": output_path, "width": width, "height": height}
+
+
+class ImagePrepPool:
+    """Worker processes for image preparation, shared by every caller in the process.
+
+    Requests are keyed by file identity and settings, so a prefetch() and the later
+    prepare() of the same image share one piece of work. The encoded file stays in the
+    pool's workspace until the last prepare() waiting for it has linked it out. Once the
+    worker processes have failed, prepare() does the work itself (see the module docstring).
+    """
+
+    def __init__(self, workers: int):
+        self.workers = max(1, workers)
+        self._executor = None
+        self._workspace = None
+        self._pending = {}  # key -> [future, prepare() calls waiting for it]
+        self._counter = 0
+        self._in_process = False
+        self._lock = threading.Lock()
+
+    def _key(self, input_path: str, max_edge: int, fmt: str, quality: int):
+        st = os.stat(input_path)
+        return (os.path.abspath(input_path), st.st_mtime_ns, st.st_size, max_edge, fmt, quality)
+
+    def submit(self, input_path: str, max_edge: int, fmt: str, quality: int) -> Optional[Future]:
+        """Start the work on input_path; None once images are prepared in-process (nothing to start)."""
+        key = self._key(input_path, max_edge, fmt, quality)
+        with self._lock:
+            entry = self._submit_locked(key, input_path, max_edge, fmt, quality)
+        return entry[0] if entry else None
+
+    def _submit_locked(self, key, input_path: str, max_edge: int, fmt: str, quality: int) -> Optional[list]:
+        entry = self._pending.get(key)
+        if entry is None and not self._in_process:
+            if self._executor is None:
+                # spawn, not fork: the servers and the poller have threads running.
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context("spawn"))
+                self._workspace = get_workspaces().create("image-prep")
+            self._counter += 1
+            output_path = self._workspace.file(
+                "%d-%s" % (self._counter, os.path.basename(image_output_path(input_path, fmt)))
+            )
+            try:
+                future = self._executor.submit(_prepare_image, input_path, output_path, max_edge, fmt, quality)
+            except BrokenProcessPool:
+                self._fall_back_locked()
+                return None
+            entry = [future, 0]
+            self._pending[key] = entry
+        return entry
+
+    def _fall_back_locked(self):
+        """Abandon the worker processes after the pool broke; prepare() works in-process from now on."""
+        if self._in_process:
+            return
+        self._in_process = True
+        print(
+            "Image worker processes failed (is the calling script missing an `if __name__ == \"__main__\":` "
+            "guard?); preparing images in this process instead."
+        )
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def prepare(self, input_path: str, max_edge: int, fmt: str, quality: int, output_path: str) -> dict:
+        """Wait for (or start) the work on input_path; an encoded result is linked to output_path."""
+        key = self._key(input_path, max_edge, fmt, quality)
+        with self._lock:
+            entry = self._submit_locked(key, input_path, max_edge, fmt, quality)
+            if entry is not None:
+                entry[1] += 1
+        if entry is None:
+            return self._prepare_in_process(input_path, max_edge, fmt, quality, output_path)
+        try:
+            try:
+                result = entry[0].result()
+            except BrokenProcessPool:
+                with self._lock:
+                    self._fall_back_locked()
+                return self._prepare_in_process(input_path, max_edge, fmt, quality, output_path)
+            if result["action"] == "encode":
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+                link_or_copy(result["path"], output_path)
+                result = dict(result, path=output_path)
+            return result
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1] and self._pending.get(key) is entry:
+                    del self._pending[key]
+                    self._discard_output(entry[0])
+
+    @staticmethod
+    def _prepare_in_process(input_path: str, max_edge: int, fmt: str, quality: int, output_path: str) -> dict:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return _prepare_image(input_path, output_path, max_edge, fmt, quality)
+
+    @staticmethod
+    def _discard_output(future: Future):
+        try:
+            result = future.result()
+        except Exception:
+            return
+        if result["action"] == "encode" and os.path.exists(result["path"]):
+            os.remove(result["path"])
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            workspace, self._workspace = self._workspace, None
+            self._pending.clear()
+        if executor is not None:
+            executor.shutdown()
+        if workspace is not None:
+            workspace.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_image_pool() -> ImagePrepPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ImagePrepPool(int(os.environ.get("WORLD_IMAGE_WORKERS", str(os.cpu_count() or 1))))
+        return _pool
+
+
+def prefetch(
+    input_path: str,
+    max_edge: int = DEFAULT_MAX_EDGE,
+    fmt: str = DEFAULT_IMAGE_FORMAT,
+    quality: int = DEFAULT_QUALITY,
+):
+    """Start preparing an image in the background; a later prepare_image_for_upload picks it up."""
+    if Image is not None:
+        get_image_pool().submit(input_path, max_edge, fmt, quality)
+
+
+def prepare_image_for_upload(
+    input_path: str,
+    max_edge: int = DEFAULT_MAX_EDGE,
+    fmt: str = DEFAULT_IMAGE_FORMAT,
+    quality: int = DEFAULT_QUALITY,
+    output_path: Optional[str] = None,
+) -> str:
+    """Return an upload-ready image: upright, at most max_edge px, metadata-free JPEG/WebP.
+
+    Images that already qualify (and every image when Pillow is not installed) are returned
+    as-is; others are written to output_path (default "<input>.upload.jpg" / ".webp").
+    """
+    if fmt not in IMAGE_FORMATS:
+        raise ValueError("fmt must be one of %s" % ", ".join(IMAGE_FORMATS))
+    with span("image_prep", bytes_in=os.path.getsize(input_path), format=fmt) as attrs:
+        if Image is None:
+            print("Pillow is not installed (pip install Pillow); uploading %s as-is." % os.path.basename(input_path))
+            attrs["action"] = "passthrough"
+            attrs["bytes"] = attrs["bytes_in"]
+            return input_path
+        try:
+            result = get_image_pool().prepare(
+                input_path, max_edge, fmt, quality, output_path or image_output_path(input_path, fmt)
+            )
+        except (OSError, Image.DecompressionBombError) as exc:
+            raise RuntimeError("Image preparation failed for %s: %s" % (os.path.basename(input_path), exc))
+        attrs["action"] = result["action"]
+        attrs["bytes"] = os.path.getsize(result["path"])
+        if result["action"] == "passthrough":
+            print("Image already upload-ready (%dx%d); skipping preparation." % (result["width"], result["height"]))
+        else:
+            print(
+                "Prepared image for upload (%s): %dx%d %s, %.2f MB -> %.2f MB"
+                % (
+                    result["reason"],
+                    result["width"],
+                    result["height"],
+                    IMAGE_FORMATS[fmt][0],
+                    attrs["bytes_in"] / (1024 * 1024),
+                    attrs["bytes"] / (1024 * 1024),
+                )
+            )
+        return result["path"]
@@ -0,0 +1,229 @@
+"""
+Durable record of world_server jobs, so a restart does not lose paid-for generations.
+
+Each job row holds its inputs (content hash, prompt, name, sampling), the
+media_asset_id and operation_id once known, and the final status/result.
+draft-then-full jobs also record the draft's operation id and, once ready,
+the draft world; a done job whose follow-up work (asset downloads) is still
+outstanding names it in follow_up. Rows also back request deduplication: by
+Idempotency-Key, and by dedupe_key = hash(content hash, prompt, name,
+sampling, mode).
+
+Unfinished jobs (follow-ups included) are leased to the process running them
+(owner, lease_until). Every server process renews its leases and claims
+unfinished jobs whose lease ran out (or was released at a clean exit) with one
+atomic UPDATE, so when several workers share the file each orphaned job is
+resumed by exactly one of them, and never while its owner is still alive.
+
+Environment:
+  WORLD_JOB_STORE=0             disable the store (jobs live in memory only)
+  WORLD_JOB_STORE_PATH          SQLite file (default ~/.cache/worldly/jobs.sqlite3)
+  WORLD_JOB_STORE_TTL_S         how long finished jobs are kept (default 604800, 7 days)
+  WORLD_JOB_LEASE_S             how long a job stays with a process that stops renewing it (default 60)
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+DEFAULT_STORE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "worldly", "jobs.sqlite3")
+DEFAULT_TTL_S = 7 * 24 * 60 * 60
+DEFAULT_LEASE_S = 60.0
+
+# Columns added after the first release (name -> type); older databases get them via ALTER TABLE.
+ADDED_COLUMNS = {
+    "draft_operation_id": "TEXT", "draft": "TEXT", "owner": "TEXT", "lease_until": "REAL", "follow_up": "TEXT"
+}
+# Jobs still needing a process: running, or done with a follow-up (e.g. asset downloads) outstanding.
+UNFINISHED = "(status NOT IN ('done', 'error') OR follow_up IS NOT NULL)"
+# Columns holding JSON documents.
+JSON_COLUMNS = ("result", "draft")
+
+COLUMNS = (
+    "id",
+    "idempotency_key",
+    "dedupe_key",
+    "input_sha256",
+    "prompt",
+    "name",
+    "sampling",
+    "media_asset_id",
+    "operation_id",
+    "draft_operation_id",
+    "draft",
+    "owner",
+    "lease_until",
+    "follow_up",
+    "status",
+    "result",
+    "error",
+    "created_at",
+    "updated_at",
+)
+
+
+def dedupe_key_for(input_sha256: str, prompt: Optional[str], name: str, sampling: str, mode: str = "full") -> str:
+    """Requests with the same key would produce the same world."""
+    material = [input_sha256, prompt, name, sampling]
+    if mode != "full":
+        # Appended only for non-default modes, so keys stored before modes existed still match.
+        material.append(mode)
+    material = json.dumps(material)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class JobStore:
+    def __init__(self, path: str = DEFAULT_STORE_PATH, ttl_s: float = DEFAULT_TTL_S, lease_s: float = DEFAULT_LEASE_S):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.lease_s = lease_s
+        self._lock = threading.Lock()
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " idempotency_key TEXT UNIQUE,"
+                " dedupe_key TEXT,"
+                " input_sha256 TEXT,"
+                " prompt TEXT,"
+                " name TEXT,"
+                " sampling TEXT,"
+                " media_asset_id TEXT,"
+                " operation_id TEXT,"
+                " draft_operation_id TEXT,"
+                " draft TEXT,"
+                " owner TEXT,"
+                " lease_until REAL,"
+                " follow_up TEXT,"
+                " status TEXT NOT NULL,"
+                " result TEXT,"
+                " error TEXT,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in ADDED_COLUMNS.items():
+                if column not in existing:
+                    conn.execute("ALTER TABLE jobs ADD COLUMN %s %s" % (column, column_type))
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_dedupe_key ON jobs (dedupe_key)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per call keeps this safe across threads and worker processes.
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _row_to_record(row) -> Optional[dict]:
+        if row is None:
+            return None
+        record = dict(zip(COLUMNS, row))
+        for column in JSON_COLUMNS:
+            if record[column]:
+                record[column] = json.loads(record[column])
+        return record
+
+    def _select(self, where: str, params: tuple) -> list:
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT %s FROM jobs WHERE %s ORDER BY created_at DESC" % (", ".join(COLUMNS), where), params
+            ).fetchall()
+        return [self._row_to_record(row) for row in rows]
+
+    def insert(self, job_id: str, status: str, created_at: float, **fields):
+        now = time.time()
+        record = {"id": job_id, "status": status, "created_at": created_at, "updated_at": now}
+        record.update(fields)
+        names = [c for c in COLUMNS if c in record]
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (%s) VALUES (%s)" % (", ".join(names), ", ".join("?" for _ in names)),
+                tuple(record[c] for c in names),
+            )
+            conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'error') AND updated_at < ?", (now - self.ttl_s,)
+            )
+
+    def update(self, job_id: str, **fields):
+        for column in JSON_COLUMNS:
+            if fields.get(column) is not None:
+                fields[column] = json.dumps(fields[column])
+        fields["updated_at"] = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET %s WHERE id = ?" % ", ".join("%s = ?" % k for k in fields),
+                tuple(fields.values()) + (job_id,),
+            )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        found = self._select("id = ?", (job_id,))
+        return found[0] if found else None
+
+    def find_by_idempotency_key(self, idempotency_key: str) -> Optional[dict]:
+        found = self._select("idempotency_key = ?", (idempotency_key,))
+        return found[0] if found else None
+
+    def find_by_dedupe_key(self, dedupe_key: str) -> Optional[dict]:
+        """Newest job with this dedupe key that has not failed."""
+        found = self._select("dedupe_key = ? AND status != 'error'", (dedupe_key,))
+        return found[0] if found else None
+
+    def unfinished(self) -> list:
+        return self._select(UNFINISHED, ())
+
+    def claim_unfinished(self, owner: str) -> list:
+        """Lease every unfinished job no live process holds to owner; returns their records.
+
+        Select and update run in one write transaction, so concurrent callers never claim the same job.
+        """
+        now = time.time()
+        where = UNFINISHED + " AND (owner IS NULL OR lease_until IS NULL OR lease_until < ?)"
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT %s FROM jobs WHERE %s ORDER BY created_at" % (", ".join(COLUMNS), where), (now,)
+            ).fetchall()
+            records = [self._row_to_record(row) for row in rows]
+            conn.executemany(
+                "UPDATE jobs SET owner = ?, lease_until = ? WHERE id = ?",
+                [(owner, now + self.lease_s, record["id"]) for record in records],
+            )
+        for record in records:
+            record["owner"], record["lease_until"] = owner, now + self.lease_s
+        return records
+
+    def renew_leases(self, owner: str):
+        """Extend the lease on every unfinished job owner holds."""
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE owner = ? AND " + UNFINISHED, (time.time() + self.lease_s, owner)
+            )
+
+    def release_leases(self, owner: str):
+        """Give owner's unfinished jobs back, so another process claims them without waiting for the lease."""
+        with self._lock, self._connect() as conn:
+            conn.execute("UPDATE jobs SET owner = NULL, lease_until = NULL WHERE owner = ? AND " + UNFINISHED, (owner,))
+
+
+def default_store() -> Optional[JobStore]:
+    """Store configured from the environment, or None when disabled."""
+    if os.environ.get("WORLD_JOB_STORE", "1").lower() in ("0", "false", "no", "off"):
+        return None
+    return JobStore(
+        path=os.environ.get("WORLD_JOB_STORE_PATH", DEFAULT_STORE_PATH),
+        ttl_s=float(os.environ.get("WORLD_JOB_STORE_TTL_S", str(DEFAULT_TTL_S))),
+        lease_s=float(os.environ.get("WORLD_JOB_LEASE_S", str(DEFAULT_LEASE_S))),
+    )
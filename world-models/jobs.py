@@ -0,0 +1,512 @@
+"""
+In-memory job registry for background world generation.
+
+Each job runs on a shared thread pool so HTTP handlers can return immediately
+with a job id instead of holding a worker for the whole generation.
+
+A job function may return a concurrent.futures.Future (e.g. from the shared
+operation poller); the job then stays "running" until that future resolves,
+without holding a pool thread while it waits.
+
+A job may also have a follow-up: work that runs once it is done (the
+servers download the world's assets), without holding back its result. The
+job is "done" as soon as the generation is; the follow-up then publishes its
+own stages and ends with one more event, named after it, carrying the
+updated result. A failed follow-up does not fail the job.
+
+Jobs also carry a stage event log (received, compressing, uploading,
+generating, draft_ready, done/error, then any follow-up's). publish()
+appends to it and fans each event out to every subscriber queue, so any
+number of watchers share the single upstream poll per operation.
+
+Given a job_store.JobStore, the registry also persists each job's inputs,
+media_asset_id, operation_id and outcome, and finds existing jobs by
+Idempotency-Key or dedupe key. Jobs this process created or claimed are
+"owned" and leased to it in the store; start_leases() keeps those leases
+fresh and claims jobs whose owner stopped (see job_store.py), so after a
+restart, or when one of several workers dies, each unfinished job is resumed
+by one process. Jobs owned by another process are re-read from the store
+whenever they are looked up, so every worker reports their current state.
+
+asgi_server.py drives jobs from asyncio tasks instead of run(): it calls
+mark_running/complete/fail/finish_follow_up itself and subscribes with a loop-aware sink.
+
+Job status values: "queued" -> "running" -> "done" | "error"
+"""
+
+import atexit
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+from telemetry import record_span
+
+# Finished jobs are kept around this long so clients can still fetch the result.
+FINISHED_JOB_TTL_S = 60 * 60
+# Per-subscriber backlog; a watcher that falls this far behind is dropped.
+SUBSCRIBER_QUEUE_SIZE = 256
+# Job fields loaded from store records.
+RECORD_FIELDS = (
+    "status", "result", "error", "created_at", "updated_at", "idempotency_key", "dedupe_key",
+    "media_asset_id", "operation_id", "draft_operation_id", "draft", "follow_up",
+)
+
+
+def chain(future: Future, fn, executor=None) -> Future:
+    """Future that resolves to fn(future.result()), propagating errors from either step.
+
+    fn runs in whichever thread completes future, or on executor when given (for slow steps
+    that must not hold up e.g. the operation poller's thread).
+    """
+    chained = Future()
+    chained.set_running_or_notify_cancel()
+
+    def call(result):
+        try:
+            chained.set_result(fn(result))
+        except Exception as exc:
+            chained.set_exception(exc)
+
+    def done(f):
+        try:
+            result = f.result()
+        except Exception as exc:
+            chained.set_exception(exc)
+            return
+        if executor is None:
+            call(result)
+        else:
+            executor.submit(call, result)
+
+    future.add_done_callback(done)
+    return chained
+
+
+class Job:
+    def __init__(self, job_id: str):
+        self.id = job_id
+        self.status = "queued"
+        self.stage = "queued"
+        self.progress = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.events = []
+        self.subscribers = []
+        self.idempotency_key = None
+        self.dedupe_key = None
+        self.media_asset_id = None
+        self.operation_id = None
+        # draft-then-full: the fast draft generation, delivered before the final result.
+        self.draft_operation_id = None
+        self.draft = None
+        # Name of the follow-up still running after the job is done (see JobRegistry.run), if any.
+        self.follow_up = None
+        # Whether the done/error event has been logged.
+        self.ended = False
+        # Whether this process runs the job; other jobs are only mirrored from the store.
+        self.owned = False
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "error")
+
+    def to_dict(self) -> dict:
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+        if self.operation_id:
+            data["operation_id"] = self.operation_id
+        if self.draft is not None:
+            data["draft"] = self.draft
+        if self.progress:
+            data["progress"] = self.progress
+        if self.result is not None:
+            data["result"] = self.result
+        if self.error is not None:
+            data["error"] = self.error
+        return data
+
+
+class JobRegistry:
+    """Tracks jobs by id and runs them on a bounded background thread pool."""
+
+    def __init__(self, max_workers: int = 256, finished_ttl_s: float = FINISHED_JOB_TTL_S, store=None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="world-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        # Serializes find-then-create so concurrent duplicates attach to one job.
+        self._create_lock = threading.Lock()
+        self._finished_ttl_s = finished_ttl_s
+        self._store = store
+        # Lease holder name in the store for jobs this process runs.
+        self.owner = "%s-%d-%s" % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self._leases_stop = None
+
+    def create(self, idempotency_key: Optional[str] = None, dedupe_key: Optional[str] = None, **fields) -> Job:
+        """Register a new queued job without starting it (see run).
+
+        fields (input_sha256, prompt, name, sampling) are only persisted to the store.
+        """
+        job = Job(uuid.uuid4().hex)
+        job.idempotency_key = idempotency_key
+        job.dedupe_key = dedupe_key
+        job.owned = True
+        with self._lock:
+            self._prune_locked()
+            self._jobs[job.id] = job
+        if self._store is not None:
+            self._store.insert(
+                job.id,
+                job.status,
+                job.created_at,
+                idempotency_key=idempotency_key,
+                dedupe_key=dedupe_key,
+                owner=self.owner,
+                lease_until=time.time() + self._store.lease_s,
+                **fields,
+            )
+        return job
+
+    def create_or_attach(self, idempotency_key: Optional[str] = None, dedupe_key: Optional[str] = None, **fields):
+        """Existing job for idempotency_key (any status) or dedupe_key (not failed), else a new one.
+
+        Returns (job, created).
+        """
+        with self._create_lock:
+            job = self.find(idempotency_key, dedupe_key)
+            if job is not None:
+                return job, False
+            return self.create(idempotency_key, dedupe_key, **fields), True
+
+    def find(self, idempotency_key: Optional[str] = None, dedupe_key: Optional[str] = None) -> Optional[Job]:
+        if idempotency_key:
+            with self._lock:
+                job = next((j for j in self._jobs.values() if j.idempotency_key == idempotency_key), None)
+            if job is not None:
+                return self.refresh(job)
+            if self._store is not None:
+                record = self._store.find_by_idempotency_key(idempotency_key)
+                if record:
+                    return self.restore(record)
+        if dedupe_key:
+            with self._lock:
+                matches = [j for j in self._jobs.values() if j.dedupe_key == dedupe_key and j.status != "error"]
+            # Another worker may have failed them since they were loaded.
+            matches = [j for j in map(self.refresh, matches) if j.status != "error"]
+            if matches:
+                return max(matches, key=lambda j: j.created_at)
+            if self._store is not None:
+                record = self._store.find_by_dedupe_key(dedupe_key)
+                if record:
+                    return self.restore(record)
+        return None
+
+    def restore(self, record: dict, claimed: bool = False) -> Job:
+        """Load a job from a store record, or update the copy already in memory if this process does not own it.
+
+        claimed: this process has just leased the job to resume it (see claim_unfinished); it becomes
+        owned, and queued unless only its follow-up is left, since whatever was running it has stopped.
+        """
+        with self._lock:
+            job = self._jobs.get(record["id"])
+            if job is None:
+                job = self._jobs[record["id"]] = Job(record["id"])
+            elif job.owned:
+                return job
+            self._apply_record_locked(job, record)
+            if claimed and (job.follow_up or not job.finished):
+                job.owned = True
+                if not job.finished:
+                    job.status = "queued"
+            return job
+
+    def refresh(self, job: Job) -> Job:
+        """Re-read a job another process runs from the store, so its status is current."""
+        if job.owned or (job.finished and not job.follow_up) or self._store is None:
+            return job
+        record = self._store.get(job.id)
+        if record:
+            with self._lock:
+                if not job.owned:
+                    self._apply_record_locked(job, record)
+        return job
+
+    def _apply_record_locked(self, job: Job, record: dict):
+        follow_up = job.follow_up if job.ended else None
+        for key in RECORD_FIELDS:
+            setattr(job, key, record[key])
+        if job.finished and not job.ended:
+            self._end_locked(job)
+        elif follow_up and not job.follow_up:
+            self._end_follow_up_locked(job, follow_up)
+        elif job.operation_id and job.stage in ("queued", "receiving"):
+            job.stage = "generating"
+
+    def claim_unfinished(self) -> list:
+        """Lease the unfinished jobs no live process holds (e.g. after a restart) and return them to resume.
+
+        Jobs this process is already running (say its lease lapsed while renewal was failing) are kept,
+        not returned: they must not be resumed a second time.
+        """
+        if self._store is None:
+            return []
+        claimed = []
+        for record in self._store.claim_unfinished(self.owner):
+            with self._lock:
+                job = self._jobs.get(record["id"])
+                if job is not None and job.owned:
+                    continue
+            claimed.append(self.restore(record, claimed=True))
+        return claimed
+
+    def start_leases(self, on_claimed):
+        """Resume orphaned jobs now and whenever an owner stops renewing, in a background thread.
+
+        Claims unfinished jobs nobody holds and calls on_claimed(job) for each, then every third of the
+        store's lease renews this process's leases and claims again. At exit the leases are released
+        so another process can take over right away. A no-op without a store.
+        """
+        if self._store is None or self._leases_stop is not None:
+            return
+        self._leases_stop = threading.Event()
+
+        def loop(stop):
+            while True:
+                try:
+                    self._store.renew_leases(self.owner)
+                    for job in self.claim_unfinished():
+                        on_claimed(job)
+                except Exception as exc:
+                    print("Job lease renewal failed: %s" % exc)
+                if stop.wait(self._store.lease_s / 3):
+                    return
+
+        threading.Thread(target=loop, args=(self._leases_stop,), name="job-leases", daemon=True).start()
+        atexit.register(self.stop_leases)
+
+    def stop_leases(self):
+        """Stop renewing and release this process's leases (unfinished jobs go to the next claimant)."""
+        if self._leases_stop is None or self._leases_stop.is_set():
+            return
+        self._leases_stop.set()
+        self._store.release_leases(self.owner)
+
+    def mark_running(self, job: Job):
+        self._set(job, status="running")
+
+    def complete(self, job: Job, result, follow_up: Optional[str] = None):
+        """Mark job done with result; follow_up names work still to come (see finish_follow_up)."""
+        self._set(job, status="done", result=result, follow_up=follow_up)
+
+    def finish_follow_up(self, job: Job, **result_fields):
+        """End a done job's follow-up: merge result_fields into its result and publish the follow-up's event."""
+        with self._lock:
+            follow_up, job.follow_up = job.follow_up, None
+            if not follow_up:
+                return
+            job.result = dict(job.result or {}, **result_fields)
+            job.updated_at = time.time()
+            self._end_follow_up_locked(job, follow_up)
+        if self._store is not None:
+            self._store.update(job.id, result=job.result, follow_up=None)
+
+    def fail(self, job: Job, error: str):
+        self._set(job, status="error", error=error)
+
+    def run(self, job: Job, fn, *args, cleanup=None, follow_up=None, **kwargs) -> Job:
+        """Run fn(*args, **kwargs) in the background; its return value (or the value of the
+        Future it returns) becomes the job result.
+
+        cleanup, if given, is called once fn returns or raises. follow_up, if given, is a
+        (name, follow_fn) pair: once the job is done, follow_fn(result) returns a dict (or a Future
+        of one) of fields to add to the result, published as a `name` event (see finish_follow_up).
+        """
+        self._executor.submit(self._run, job, fn, args, kwargs, cleanup, follow_up)
+        return job
+
+    def follow(self, job: Job, follow_up):
+        """Run a done job's follow_up (see run), e.g. one whose process stopped before finishing it."""
+        name, follow_fn = follow_up
+        try:
+            fields = follow_fn(job.result)
+        except Exception as exc:
+            print("Follow-up %s of job %s failed: %s" % (name, job.id, exc))
+            fields = {}
+        if isinstance(fields, Future):
+            fields.add_done_callback(lambda f: self._follow_done(job, name, f))
+        else:
+            self.finish_follow_up(job, **fields)
+
+    def _follow_done(self, job: Job, name: str, future: Future):
+        exc = future.exception()
+        if exc is not None:
+            print("Follow-up %s of job %s failed: %s" % (name, job.id, exc))
+        self.finish_follow_up(job, **(future.result() if exc is None else {}))
+
+    def submit(self, fn, *args, cleanup=None, **kwargs) -> Job:
+        return self.run(self.create(), fn, *args, cleanup=cleanup, **kwargs)
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return self.refresh(job)
+        if self._store is not None:
+            record = self._store.get(job_id)
+            if record:
+                job = self.restore(record)
+        return job
+
+    def active_count(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if not job.finished)
+
+    def publish(self, job: Job, stage: str, **detail):
+        """Record a stage event and push it to every subscriber. Repeats of the last event, and
+        events for finished jobs (other than their follow-up's), are dropped.
+
+        A media_asset_id, operation_id, draft_operation_id or draft (world) in detail is saved
+        on the job (and in the store).
+        """
+        learned = {
+            key: detail[key]
+            for key in ("media_asset_id", "operation_id", "draft_operation_id", "draft")
+            if detail.get(key) and getattr(job, key) != detail[key]
+        }
+        if learned:
+            with self._lock:
+                for key, value in learned.items():
+                    setattr(job, key, value)
+            if self._store is not None:
+                self._store.update(job.id, **learned)
+        with self._lock:
+            if job.finished and not job.follow_up:
+                # e.g. a draft that finished after the full world; the event log ended with done.
+                return
+            if job.events and job.events[-1]["stage"] == stage and job.events[-1]["detail"] == detail:
+                return
+            event = {"stage": stage, "detail": detail, "at": time.time()}
+            job.events.append(event)
+            job.stage = stage
+            if "progress" in detail:
+                job.progress = detail["progress"]
+            job.updated_at = event["at"]
+            self._fan_out_locked(job, event)
+
+    def subscribe(self, job: Job, q=None):
+        """Queue that receives every past and future event of job, then None after the last one.
+
+        q may be any object with put_nowait() that raises queue.Full when the watcher lags
+        (default: a new queue.Queue).
+        """
+        if q is None:
+            q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            for event in job.events[-SUBSCRIBER_QUEUE_SIZE + 1:]:
+                q.put_nowait(event)
+            if job.finished and not job.follow_up:
+                q.put_nowait(None)
+            else:
+                job.subscribers.append(q)
+        return q
+
+    def unsubscribe(self, job: Job, q):
+        with self._lock:
+            if q in job.subscribers:
+                job.subscribers.remove(q)
+
+    def _fan_out_locked(self, job: Job, event: dict):
+        for q in list(job.subscribers):
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                job.subscribers.remove(q)
+        if job.finished and not job.follow_up:
+            for q in job.subscribers:
+                try:
+                    q.put_nowait(None)
+                except queue.Full:
+                    pass
+            job.subscribers = []
+
+    def _end_locked(self, job: Job):
+        """Append the done/error event of a job that just finished and tell every subscriber."""
+        event = {"stage": job.status, "detail": {}, "at": job.updated_at}
+        if job.status == "done":
+            event["detail"]["result"] = job.result
+        else:
+            event["detail"]["error"] = job.error
+        job.events.append(event)
+        job.stage = job.status
+        job.ended = True
+        self._fan_out_locked(job, event)
+
+    def _end_follow_up_locked(self, job: Job, follow_up: str):
+        """Append the event ending a follow-up, with the updated result, and close every subscriber."""
+        event = {"stage": follow_up, "detail": {"result": job.result}, "at": job.updated_at}
+        job.events.append(event)
+        job.stage = job.status
+        self._fan_out_locked(job, event)
+
+    def _set(self, job: Job, **fields):
+        with self._lock:
+            for key, value in fields.items():
+                setattr(job, key, value)
+            job.updated_at = time.time()
+            if job.finished:
+                self._end_locked(job)
+        if self._store is not None:
+            self._store.update(job.id, status=job.status, result=job.result, error=job.error, follow_up=job.follow_up)
+        if job.finished:
+            record_span("job", job.created_at, job.updated_at - job.created_at, {"status": job.status})
+
+    def _run(self, job: Job, fn, args, kwargs, cleanup, follow_up):
+        self._set(job, status="running")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as exc:
+            self._set(job, status="error", error=str(exc))
+        else:
+            if isinstance(result, Future):
+                result.add_done_callback(lambda f: self._finish(job, f, follow_up))
+            else:
+                self._done(job, result, follow_up)
+        finally:
+            if cleanup:
+                try:
+                    cleanup()
+                except Exception:
+                    pass
+
+    def _finish(self, job: Job, future: Future, follow_up):
+        exc = future.exception()
+        if exc is not None:
+            self._set(job, status="error", error=str(exc))
+        else:
+            self._done(job, future.result(), follow_up)
+
+    def _done(self, job: Job, result, follow_up):
+        self.complete(job, result, follow_up[0] if follow_up else None)
+        if follow_up:
+            self.follow(job, follow_up)
+
+    def _prune_locked(self):
+        cutoff = time.time() - self._finished_ttl_s
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.finished and job.updated_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
@@ -0,0 +1,122 @@
+"""
+Persistent, content-addressed cache of uploaded World Labs media assets.
+
+Maps sha256(source file) + upload parameters (including the API root and a
+hash of the API key: media assets belong to one account) -> media_asset_id so
+repeat requests against the same clip skip compression and upload entirely.
+When worlds:generate rejects a cached id (expired or deleted upstream),
+world_client invalidates the entry and uploads the file again.
+Entries expire after a TTL and the least recently used ones are evicted
+once the cache holds more than max_entries.
+
+Environment:
+  WORLD_MEDIA_CACHE=0               disable the cache
+  WORLD_MEDIA_CACHE_PATH            SQLite file (default ~/.cache/worldly/media_assets.sqlite3)
+  WORLD_MEDIA_CACHE_TTL_S           entry lifetime in seconds (default 86400)
+  WORLD_MEDIA_CACHE_MAX_ENTRIES     maximum number of entries (default 1000)
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "worldly", "media_assets.sqlite3")
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaAssetCache:
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl_s: float = 24 * 60 * 60, max_entries: int = 1000):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS media_assets ("
+                " key TEXT PRIMARY KEY,"
+                " media_asset_id TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_used_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per call keeps this safe across threads and worker processes.
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def key_for(path: str, kind: str, params: dict) -> str:
+        """Cache key: content hash of the source file plus everything that changes the upload."""
+        return MediaAssetCache.key_for_sha256(file_sha256(path), kind, params)
+
+    @staticmethod
+    def key_for_sha256(sha256: str, kind: str, params: dict) -> str:
+        """key_for() when the file's content hash is already known."""
+        material = json.dumps({"sha256": sha256, "kind": kind, "params": params}, sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT media_asset_id, created_at FROM media_assets WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            media_asset_id, created_at = row
+            if now - created_at > self.ttl_s:
+                conn.execute("DELETE FROM media_assets WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE media_assets SET last_used_at = ? WHERE key = ?", (now, key))
+            return media_asset_id
+
+    def put(self, key: str, media_asset_id: str):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO media_assets (key, media_asset_id, created_at, last_used_at)"
+                " VALUES (?, ?, ?, ?)",
+                (key, media_asset_id, now, now),
+            )
+            conn.execute("DELETE FROM media_assets WHERE created_at < ?", (now - self.ttl_s,))
+            conn.execute(
+                "DELETE FROM media_assets WHERE key NOT IN ("
+                " SELECT key FROM media_assets ORDER BY last_used_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+    def invalidate(self, key: str):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM media_assets WHERE key = ?", (key,))
+
+
+def default_cache() -> Optional[MediaAssetCache]:
+    """Cache configured from the environment, or None when disabled."""
+    if os.environ.get("WORLD_MEDIA_CACHE", "1").lower() in ("0", "false", "no", "off"):
+        return None
+    return MediaAssetCache(
+        path=os.environ.get("WORLD_MEDIA_CACHE_PATH", DEFAULT_CACHE_PATH),
+        ttl_s=float(os.environ.get("WORLD_MEDIA_CACHE_TTL_S", str(24 * 60 * 60))),
+        max_entries=int(os.environ.get("WORLD_MEDIA_CACHE_MAX_ENTRIES", "1000")),
+    )
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the World Labs Marble API, for load tests and benchmarks.
+
+Implements the endpoints create_world.py uses:
+  POST /marble/v1/media-assets:prepare_upload
+  PUT  /upload/<media_asset_id>                 (signed upload target)
+  POST /upload/<media_asset_id>, PUT /upload-session/<id>   (with --resumable)
+  POST /marble/v1/worlds:generate
+  GET  /marble/v1/operations/<operation_id>
+  GET  /files/<world_id>/<asset>                (generated assets; Range, ETag, x-goog-hash)
+
+Latencies, failure rates and the "has not been uploaded yet" race are
+configurable so client retry and polling behaviour can be exercised without
+spending real quota.
+
+Usage:
+  python mock_worldlabs.py --port 8765 --generation-s 20 --failure-rate 0.02
+  WORLD_LABS_API_BASE=http://127.0.0.1:8765/marble/v1 WORLD_LABS_API_KEY=mock \\
+      python create_world.py --type video --file assets/church.upload.mp4
+"""
+
+import argparse
+import base64
+import hashlib
+import io
+import random
+import threading
+import time
+import uuid
+
+from flask import Flask, jsonify, request, send_file
+
+API_PREFIX = "/marble/v1"
+# Model name create_world.py sends for draft generations.
+DRAFT_MODEL = "Marble 0.1-mini"
+MAX_UPLOAD_BYTES = 100 * 1024 * 1024
+
+# Asset files of every finished world, relative to --asset-mb.
+ASSET_FILES = {"100k.spz": 0.1, "full_res.spz": 1.0, "collider.glb": 0.25}
+PROGRESS_STEPS = (
+    "Queued",
+    "Reconstructing scene",
+    "Generating world",
+    "Optimizing splats",
+    "Finalizing",
+)
+
+
+class MockConfig:
+    def __init__(
+        self,
+        latency_s: float = 0.05,
+        jitter_s: float = 0.02,
+        generation_s: float = 10.0,
+        failure_rate: float = 0.0,
+        upload_race_rate: float = 0.0,
+        upload_race_window_s: float = 2.0,
+        resumable: bool = False,
+        draft_fraction: float = 0.25,
+        asset_mb: float = 4.0,
+    ):
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.generation_s = generation_s
+        self.failure_rate = failure_rate
+        self.upload_race_rate = upload_race_rate
+        self.upload_race_window_s = upload_race_window_s
+        self.resumable = resumable
+        self.draft_fraction = draft_fraction
+        self.asset_mb = asset_mb
+
+
+def create_app(config: MockConfig = None) -> Flask:
+    config = config or MockConfig()
+    app = Flask(__name__)
+    lock = threading.Lock()
+    assets = {}  # media_asset_id -> {"uploaded_at": float | None, "bytes": int}
+    operations = {}  # operation_id -> {"started_at": float, "world_id": str}
+    counters = {"requests": 0, "failures": 0, "races": 0, "asset_requests": 0}
+
+    def simulate(api_call: bool = True):
+        """Sleep for the configured latency; maybe return an injected 503."""
+        with lock:
+            counters["requests"] += 1
+        time.sleep(max(0.0, config.latency_s + random.uniform(-config.jitter_s, config.jitter_s)))
+        if api_call and random.random() < config.failure_rate:
+            with lock:
+                counters["failures"] += 1
+            return jsonify({"error": "injected failure"}), 503
+        return None
+
+    def check_key():
+        if not request.headers.get("WLT-Api-Key"):
+            return jsonify({"error": "missing WLT-Api-Key"}), 401
+        return None
+
+    @app.post(API_PREFIX + "/media-assets:prepare_upload")
+    def prepare_upload():
+        failure = check_key() or simulate()
+        if failure:
+            return failure
+        body = request.get_json(force=True)
+        asset_id = uuid.uuid4().hex
+        with lock:
+            assets[asset_id] = {"uploaded_at": None, "bytes": 0}
+        required_headers = {"x-goog-content-length-range": "0,%d" % MAX_UPLOAD_BYTES}
+        if config.resumable:
+            required_headers["x-goog-resumable"] = "start"
+        return jsonify(
+            {
+                "media_asset": {"id": asset_id, "file_name": body.get("file_name"), "kind": body.get("kind")},
+                "upload_info": {
+                    "upload_url": request.host_url.rstrip("/") + "/upload/" + asset_id,
+                    "required_headers": required_headers,
+                },
+            }
+        )
+
+    def mark_uploaded(asset_id: str, size: int):
+        with lock:
+            assets[asset_id].update({"uploaded_at": time.time(), "bytes": size})
+
+    @app.put("/upload/<asset_id>")
+    def upload(asset_id):
+        if asset_id not in assets:
+            return "unknown upload", 404
+        failure = simulate(api_call=False)
+        if failure:
+            return failure
+        size = 0
+        for chunk in iter(lambda: request.stream.read(1024 * 1024), b""):
+            size += len(chunk)
+        mark_uploaded(asset_id, size)
+        return "", 200
+
+    @app.post("/upload/<asset_id>")
+    def start_resumable(asset_id):
+        if asset_id not in assets:
+            return "unknown upload", 404
+        return "", 201, {"Location": request.host_url.rstrip("/") + "/upload-session/" + asset_id}
+
+    @app.put("/upload-session/<asset_id>")
+    def resumable_chunk(asset_id):
+        asset = assets.get(asset_id)
+        if asset is None:
+            return "unknown session", 404
+        content_range = request.headers.get("Content-Range", "")
+        received = asset["bytes"]
+        if content_range.startswith("bytes */"):
+            if asset["uploaded_at"]:
+                return "", 200
+            return "", 308, ({"Range": "bytes=0-%d" % (received - 1)} if received else {})
+        total = int(content_range.rsplit("/", 1)[1])
+        for chunk in iter(lambda: request.stream.read(1024 * 1024), b""):
+            received += len(chunk)
+        asset["bytes"] = received
+        if received >= total:
+            mark_uploaded(asset_id, received)
+            return "", 200
+        return "", 308, {"Range": "bytes=0-%d" % (received - 1)}
+
+    @app.post(API_PREFIX + "/worlds:generate")
+    def generate():
+        failure = check_key() or simulate()
+        if failure:
+            return failure
+        payload = request.get_json(force=True)
+        world_prompt = payload.get("world_prompt") or {}
+        source = world_prompt.get("video_prompt") or world_prompt.get("image_prompt")
+        if source:
+            asset = assets.get(source.get("media_asset_id"))
+            if asset is None or asset["uploaded_at"] is None:
+                return jsonify({"error": "Media asset has not been uploaded yet"}), 400
+            recent = time.time() - asset["uploaded_at"] < config.upload_race_window_s
+            if recent and random.random() < config.upload_race_rate:
+                with lock:
+                    counters["races"] += 1
+                return jsonify({"error": "Media asset has not been uploaded yet"}), 400
+        draft = payload.get("model") == DRAFT_MODEL
+        operation_id = uuid.uuid4().hex
+        with lock:
+            operations[operation_id] = {
+                "started_at": time.time(),
+                "world_id": uuid.uuid4().hex,
+                "generation_s": config.generation_s * (config.draft_fraction if draft else 1.0),
+            }
+        return jsonify({"operation_id": operation_id, "done": False})
+
+    @app.get(API_PREFIX + "/operations/<operation_id>")
+    def get_operation(operation_id):
+        failure = check_key() or simulate()
+        if failure:
+            return failure
+        op = operations.get(operation_id)
+        if op is None:
+            return jsonify({"error": "operation not found"}), 404
+        fraction = (time.time() - op["started_at"]) / op["generation_s"] if op["generation_s"] else 1.0
+        done = fraction >= 1.0
+        step = PROGRESS_STEPS[min(int(fraction * len(PROGRESS_STEPS)), len(PROGRESS_STEPS) - 1)]
+        body = {
+            "operation_id": operation_id,
+            "done": done,
+            "metadata": {"progress": {"description": step}, "world_id": op["world_id"]},
+        }
+        if done:
+            body["response"] = {
+                "id": op["world_id"],
+                "world_marble_url": "https://marble.worldlabs.ai/world/%s" % op["world_id"],
+            }
+            if config.asset_mb:
+                files = request.host_url + "files/" + op["world_id"] + "/"
+                body["response"]["assets"] = {
+                    "splats": {"spz_urls": {"100k": files + "100k.spz", "full_res": files + "full_res.spz"}},
+                    "mesh": {"collider_mesh_url": files + "collider.glb"},
+                }
+        return jsonify(body)
+
+    @app.get("/files/<world_id>/<name>")
+    def asset_file(world_id, name):
+        if name not in ASSET_FILES or not config.asset_mb:
+            return jsonify({"error": "not found"}), 404
+        # Deterministic content, so every range request of a download sees the same object.
+        size = int(ASSET_FILES[name] * config.asset_mb * 1024 * 1024)
+        data = random.Random(world_id + name).randbytes(size)
+        with lock:
+            counters["asset_requests"] += 1
+        md5 = hashlib.md5(data)
+        response = send_file(
+            io.BytesIO(data), mimetype="application/octet-stream", conditional=True, etag=md5.hexdigest()
+        )
+        response.headers["x-goog-hash"] = "md5=" + base64.b64encode(md5.digest()).decode("ascii")
+        return response
+
+    @app.get("/_stats")
+    def stats():
+        with lock:
+            return jsonify(dict(counters, assets=len(assets), operations=len(operations)))
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock of the World Labs Marble API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="Base latency per request in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02, help="Uniform +/- latency jitter in seconds")
+    parser.add_argument("--generation-s", type=float, default=10.0, help="Seconds until an operation is done")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Probability of an injected 503 per API call")
+    parser.add_argument(
+        "--upload-race-rate",
+        type=float,
+        default=0.0,
+        help='Probability that worlds:generate says "has not been uploaded yet" right after an upload',
+    )
+    parser.add_argument("--upload-race-window", type=float, default=2.0, help="Seconds after upload the race applies")
+    parser.add_argument("--resumable", action="store_true", help="Hand out resumable (x-goog-resumable) upload URLs")
+    parser.add_argument(
+        "--draft-fraction",
+        type=float,
+        default=0.25,
+        help="Draft-model (%s) generations take this fraction of --generation-s" % DRAFT_MODEL,
+    )
+    parser.add_argument(
+        "--asset-mb", type=float, default=4.0, help="Size of each world's full-res splat asset in MB (0: no assets)"
+    )
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency_s=args.latency,
+        jitter_s=args.jitter,
+        generation_s=args.generation_s,
+        failure_rate=args.failure_rate,
+        upload_race_rate=args.upload_race_rate,
+        upload_race_window_s=args.upload_race_window,
+        resumable=args.resumable,
+        draft_fraction=args.draft_fraction,
+        asset_mb=args.asset_mb,
+    )
+    print("Mock World Labs API at http://%s:%d%s" % (args.host, args.port, API_PREFIX))
+    create_app(config).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Multiplexed poller for World Labs long-running operations.
+
+A single background thread keeps every outstanding operation id in one
+priority queue ordered by next poll time, so N concurrent generations cost
+one thread instead of N sleeping ones. Intervals adapt per operation: polls
+start fast, reset to fast whenever the progress description changes, and
+back off geometrically while progress is stalled.
+
+Callers get a concurrent.futures.Future that resolves to the final operation
+dict (or raises if the operation failed), plus optional progress callbacks.
+
+A transient poll failure (connection error, 429/5xx, open circuit breaker)
+does not fail the operation: it is polled again after a jittered backoff
+(honouring Retry-After) until retry.POLL_RETRY's time budget for consecutive
+failures runs out.
+
+The interval and retry decisions are plain functions (operation_progress,
+next_interval, poll_failure_delay, operation_outcome) so async_world.py's
+coroutine poller behaves the same way.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from retry import POLL_RETRY, CircuitOpenError, is_transient, retry_after_s
+
+MIN_INTERVAL_S = 2.0
+MAX_INTERVAL_S = 30.0
+BACKOFF = 1.5
+
+
+def operation_progress(op: dict) -> str:
+    return ((op.get("metadata") or {}).get("progress") or {}).get("description", "")
+
+
+def operation_outcome(op: dict) -> dict:
+    """op itself once it finished successfully; raises if the operation failed."""
+    if op.get("error"):
+        raise RuntimeError("Operation failed: %s" % op["error"])
+    return op
+
+
+def next_interval(interval: float, progress_changed: bool, min_interval: float, max_interval: float,
+                  backoff: float = BACKOFF) -> float:
+    """Poll again fast after a progress change, otherwise back off towards max_interval."""
+    if progress_changed:
+        return min(min_interval, max_interval)
+    return min(interval * backoff, max_interval)
+
+
+def poll_failure_delay(exc: Exception, errors: int, first_error_at: float, transient: bool) -> Optional[float]:
+    """Seconds before re-polling after the errors-th consecutive failure, or None to give up."""
+    if not transient:
+        return None
+    if isinstance(exc, CircuitOpenError):
+        retry_after = exc.retry_after_s
+    else:
+        retry_after = retry_after_s(getattr(exc, "response", None))
+    return POLL_RETRY.next_delay(errors, first_error_at, retry_after)
+
+
+class _Tracked:
+    def __init__(self, operation_id: str, future: Future, on_progress, max_interval: float, min_interval: float):
+        self.operation_id = operation_id
+        self.future = future
+        self.on_progress = on_progress
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.last_progress = None
+        self.errors = 0
+        self.first_error_at = None
+
+
+class OperationPoller:
+    def __init__(
+        self,
+        fetch: Callable[[str], dict],
+        min_interval: float = MIN_INTERVAL_S,
+        max_interval: float = MAX_INTERVAL_S,
+        backoff: float = BACKOFF,
+    ):
+        """fetch(operation_id) returns the current operation dict or raises."""
+        self._fetch = fetch
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def submit(
+        self,
+        operation_id: str,
+        on_progress: Optional[Callable[[str, str, dict], None]] = None,
+        max_interval: Optional[float] = None,
+    ) -> Future:
+        """Track operation_id until done. on_progress(operation_id, description, op) runs on each poll."""
+        future = Future()
+        future.set_running_or_notify_cancel()
+        tracked = _Tracked(
+            operation_id,
+            future,
+            on_progress,
+            max_interval or self.max_interval,
+            min(self.min_interval, max_interval or self.max_interval),
+        )
+        with self._cond:
+            self._ensure_thread_locked()
+            # First poll right away: the operation may already be done (e.g. after a restart).
+            heapq.heappush(self._heap, (time.monotonic(), next(self._seq), tracked))
+            self._cond.notify()
+        return future
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _ensure_thread_locked(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped = False
+            self._thread = threading.Thread(target=self._loop, name="operation-poller", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if self._heap:
+                        due = self._heap[0][0] - time.monotonic()
+                        if due <= 0:
+                            break
+                        self._cond.wait(due)
+                    else:
+                        self._cond.wait()
+                if self._stopped:
+                    return
+                _, _, tracked = heapq.heappop(self._heap)
+            next_at = self._poll_once(tracked)
+            if next_at is not None:
+                with self._cond:
+                    heapq.heappush(self._heap, (next_at, next(self._seq), tracked))
+
+    def _poll_once(self, tracked: _Tracked) -> Optional[float]:
+        """Poll one operation; returns when to poll it next, or None once its future is resolved."""
+        try:
+            op = self._fetch(tracked.operation_id)
+        except Exception as exc:
+            return self._poll_failed(tracked, exc)
+        tracked.errors = 0
+        tracked.first_error_at = None
+
+        progress = operation_progress(op)
+        if tracked.on_progress:
+            try:
+                tracked.on_progress(tracked.operation_id, progress, op)
+            except Exception:
+                pass
+
+        if op.get("done", False):
+            try:
+                tracked.future.set_result(operation_outcome(op))
+            except RuntimeError as exc:
+                tracked.future.set_exception(exc)
+            return None
+
+        tracked.interval = next_interval(
+            tracked.interval, progress != tracked.last_progress, self.min_interval, tracked.max_interval, self.backoff
+        )
+        tracked.last_progress = progress
+        return time.monotonic() + tracked.interval
+
+    def _poll_failed(self, tracked: _Tracked, exc: Exception) -> Optional[float]:
+        now = time.monotonic()
+        tracked.errors += 1
+        if tracked.first_error_at is None:
+            tracked.first_error_at = now
+        delay = poll_failure_delay(exc, tracked.errors, tracked.first_error_at, is_transient(exc))
+        if delay is None:
+            tracked.future.set_exception(exc)
+            return None
+        print("Poll of %s failed (%s); retrying in %.1fs" % (tracked.operation_id, exc, delay))
+        return now + delay
@@ -0,0 +1,33 @@
+"""
+Token-bucket rate limiting for World Labs endpoints.
+
+A bucket holds up to `burst` tokens and refills at `rate` tokens per second;
+acquire() blocks until a token is available. Buckets are attached to
+ApiClient paths (e.g. "/worlds:generate") with ApiClient.set_rate_limit.
+"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float = 1.0):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait_s = (tokens - self._tokens) / self.rate
+            time.sleep(wait_s)
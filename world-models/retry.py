@@ -0,0 +1,202 @@
+"""
+Retry policy and circuit breaker shared by every World Labs call.
+
+RetryPolicy computes "full jitter" exponential backoff,
+  delay = uniform(0, min(max_s, base_s * 2 ** (attempt - 1)))
+so workers that failed together do not retry together. A Retry-After header
+sets a floor on the delay. Each policy has an attempt cap and a time budget
+for its whole retry sequence. Non-idempotent calls (worlds:generate) are only
+retried when the request cannot have been processed: connection never
+established, 429, or 503.
+
+CircuitBreaker counts consecutive upstream failures (connection errors, 429,
+5xx). After `failure_threshold` of them it opens and calls fail fast with
+CircuitOpenError for `reset_timeout_s`. Then one probe call is let through
+(half-open): a success closes the breaker and a failure re-opens it. The
+server also sheds new jobs with 503 while the breaker is open.
+
+Environment:
+  WORLD_LABS_BREAKER_THRESHOLD   consecutive failures that open the breaker (default 5)
+  WORLD_LABS_BREAKER_RESET_S     seconds the breaker stays open before a probe (default 30)
+"""
+
+import email.utils
+import os
+import random
+import threading
+import time
+from typing import Optional
+
+# Statuses that mean "try again later" rather than "this request is wrong".
+RETRYABLE_STATUSES = (408, 425, 429, 500, 502, 503, 504)
+# Statuses that guarantee the request was not acted on, so even a POST may be resent.
+NOT_PROCESSED_STATUSES = (429, 503)
+
+
+class CircuitOpenError(RuntimeError):
+    def __init__(self, retry_after_s: float):
+        super().__init__("World Labs API circuit breaker is open; retry in %.0fs" % retry_after_s)
+        self.retry_after_s = retry_after_s
+
+
+def retry_after_s(response) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), if any."""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def never_sent(exc: Exception) -> bool:
+    """True when the connection was never established, so the server cannot have seen the request."""
+    # requests is imported here, not at module level: it is slow to import and this module is
+    # loaded by everything, while only a call that already failed gets this far.
+    import requests
+    from urllib3.exceptions import NewConnectionError
+
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    reason = getattr(exc.args[0], "reason", None) if exc.args else None
+    return isinstance(exc, requests.ConnectionError) and isinstance(reason, NewConnectionError)
+
+
+def is_transient(exc: Exception) -> bool:
+    """Whether an exception from an API call is worth retrying later."""
+    import requests
+
+    if isinstance(exc, CircuitOpenError):
+        return True
+    if isinstance(exc, requests.HTTPError):
+        return exc.response is not None and exc.response.status_code in RETRYABLE_STATUSES
+    return isinstance(exc, (requests.ConnectionError, requests.Timeout))
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_attempts: int = 4,
+        base_s: float = 1.0,
+        max_s: float = 20.0,
+        budget_s: float = 60.0,
+        idempotent: Optional[bool] = None,
+    ):
+        """idempotent=None infers it from the HTTP method (GET/HEAD/PUT/DELETE are)."""
+        self.max_attempts = max_attempts
+        self.base_s = base_s
+        self.max_s = max_s
+        self.budget_s = budget_s
+        self.idempotent = idempotent
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full-jitter backoff after the given (1-based) attempt, at least retry_after."""
+        jittered = random.uniform(0, min(self.max_s, self.base_s * 2 ** (attempt - 1)))
+        return max(jittered, retry_after or 0.0)
+
+    def next_delay(self, attempt: int, started_at: float, retry_after: Optional[float] = None) -> Optional[float]:
+        """Delay before attempt + 1, or None once attempts or the time budget are used up.
+
+        started_at is the time.monotonic() of the first attempt.
+        """
+        if attempt >= self.max_attempts:
+            return None
+        delay = self.delay(attempt, retry_after)
+        if time.monotonic() - started_at + delay > self.budget_s:
+            return None
+        return delay
+
+    def is_idempotent(self, method: str) -> bool:
+        if self.idempotent is not None:
+            return self.idempotent
+        return method.upper() in ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+
+    def retries_status(self, method: str, status: int) -> bool:
+        if self.is_idempotent(method):
+            return status in RETRYABLE_STATUSES
+        return status in NOT_PROCESSED_STATUSES
+
+    def retries_exception(self, method: str, exc: Exception) -> bool:
+        import requests
+
+        if self.is_idempotent(method):
+            return isinstance(exc, (requests.ConnectionError, requests.Timeout))
+        return never_sent(exc)
+
+
+# Per-endpoint policies, keyed by the ApiClient span name of the call.
+DEFAULT_RETRY_POLICIES = {
+    "prepare_upload": RetryPolicy(max_attempts=4, base_s=1.0, max_s=10.0, budget_s=60.0, idempotent=True),
+    "generate_request": RetryPolicy(max_attempts=4, base_s=2.0, max_s=20.0, budget_s=120.0, idempotent=False),
+    # The operation poller reschedules failed polls itself instead of blocking its thread.
+    "poll": RetryPolicy(max_attempts=1),
+    "api": RetryPolicy(max_attempts=3, base_s=1.0, max_s=10.0, budget_s=30.0),
+}
+# Consecutive poll failures of one operation are tolerated for this long.
+POLL_RETRY = RetryPolicy(max_attempts=1000, base_s=2.0, max_s=60.0, budget_s=10 * 60.0)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout_s: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "CircuitBreaker":
+        return cls(
+            failure_threshold=int(os.environ.get("WORLD_LABS_BREAKER_THRESHOLD", "5")),
+            reset_timeout_s=float(os.environ.get("WORLD_LABS_BREAKER_RESET_S", "30")),
+        )
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.reset_timeout_s:
+                return "open"
+            return "half_open"
+
+    def retry_in(self) -> float:
+        """Seconds until calls are allowed again; 0 when closed or ready for a probe."""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_timeout_s - time.monotonic())
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now."""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self.reset_timeout_s - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpenError(remaining)
+            if self._probe_in_flight:
+                raise CircuitOpenError(1.0)
+            self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probe_in_flight or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probe_in_flight:
+                    print("World Labs API degraded (%d consecutive failures); failing fast for %.0fs"
+                          % (self._failures, self.reset_timeout_s))
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
@@ -0,0 +1,45 @@
+"""
+Drivers for pipeline step generators.
+
+Pipeline logic that both the blocking code and the asyncio server need (see
+video_prep.compression_steps and world_client.generation_steps) is written
+once, as a generator: it yields a step tuple describing the I/O to do next,
+is sent that step's result (or has its exception thrown in), and returns the
+final value. run_steps executes the steps in the calling thread;
+run_steps_async awaits them, so the decisions, retries and messages cannot
+drift apart between the two.
+"""
+
+
+def run_steps(steps, execute):
+    """Drive a step generator with execute(step); returns the generator's return value."""
+    result, error = None, None
+    while True:
+        try:
+            step = steps.throw(error) if error is not None else steps.send(result)
+        except StopIteration as done:
+            return done.value
+        result, error = None, None
+        try:
+            result = execute(step)
+        except Exception as exc:
+            error = exc
+
+
+async def run_steps_async(steps, execute):
+    """run_steps with an async execute(step), awaited on the running loop."""
+    result, error = None, None
+    try:
+        while True:
+            try:
+                step = steps.throw(error) if error is not None else steps.send(result)
+            except StopIteration as done:
+                return done.value
+            result, error = None, None
+            try:
+                result = await execute(step)
+            except Exception as exc:
+                error = exc
+    finally:
+        # On cancellation, let the generator's own cleanup (spans, finally blocks) run now.
+        steps.close()
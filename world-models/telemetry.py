@@ -0,0 +1,136 @@
+"""
+Per-stage timing spans, Prometheus metrics and JSON traces.
+
+Wrap a stage in span(name, **attrs); the yielded dict can be updated with
+more attributes (e.g. "status" = HTTP status, "bytes" = payload size) before
+the block exits. An exception escaping the block marks the span "error".
+Every finished span is:
+  - observed in world_span_duration_seconds{span, status} (histogram)
+  - added to world_span_bytes_total{span} when it carries "bytes"
+  - appended to the JSON trace, if one was started with start_trace()
+
+Spans currently emitted:
+  compress         compress_video_for_upload (bytes_in, bytes, action)
+  image_prep       prepare_image_for_upload (bytes_in, bytes, action, format)
+  prepare_upload   POST media-assets:prepare_upload
+  upload_attempt   each signed-upload header strategy (bytes, resumable)
+  generate_request each POST worlds:generate, retries included
+  generate         the whole worlds:generate step with its retry loops (attempts)
+  poll             each GET operations/{id}
+  download         each generated asset fetched into the asset cache (bytes, parts, verified)
+  job              a world_server job from creation to done/error
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; spans range from millisecond API calls to multi-minute encodes and jobs.
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200)
+
+
+class Metrics:
+    """Thread-safe span histograms and byte counters rendered in Prometheus text format."""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._durations = {}  # (span, status) -> [bucket counts..., sum, count]
+        self._bytes = {}  # span -> total bytes
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, status: str, duration_s: float, nbytes=None):
+        with self._lock:
+            series = self._durations.get((name, status))
+            if series is None:
+                series = self._durations[(name, status)] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if duration_s <= bound:
+                    series[i] += 1
+            series[-2] += duration_s
+            series[-1] += 1
+            if nbytes:
+                self._bytes[name] = self._bytes.get(name, 0) + int(nbytes)
+
+    def render(self, gauges=None) -> str:
+        """Prometheus exposition text; gauges maps extra metric names to current values."""
+        lines = [
+            "# HELP world_span_duration_seconds Duration of each pipeline stage.",
+            "# TYPE world_span_duration_seconds histogram",
+        ]
+        with self._lock:
+            durations = {key: list(series) for key, series in self._durations.items()}
+            byte_totals = dict(self._bytes)
+        for (name, status), series in sorted(durations.items()):
+            labels = 'span="%s",status="%s"' % (name, status)
+            for bound, count in zip(self.buckets, series):
+                lines.append('world_span_duration_seconds_bucket{%s,le="%g"} %d' % (labels, bound, count))
+            lines.append('world_span_duration_seconds_bucket{%s,le="+Inf"} %d' % (labels, series[-1]))
+            lines.append("world_span_duration_seconds_sum{%s} %.6f" % (labels, series[-2]))
+            lines.append("world_span_duration_seconds_count{%s} %d" % (labels, series[-1]))
+
+        lines.append("# HELP world_span_bytes_total Bytes processed or transferred per stage.")
+        lines.append("# TYPE world_span_bytes_total counter")
+        for name, total in sorted(byte_totals.items()):
+            lines.append('world_span_bytes_total{span="%s"} %d' % (name, total))
+
+        typed = set()
+        for name, value in sorted((gauges or {}).items()):
+            # Names may carry labels, e.g. 'world_stage_in_use{stage="encode"}'.
+            base = name.split("{", 1)[0]
+            if base not in typed:
+                typed.add(base)
+                lines.append("# TYPE %s gauge" % base)
+            lines.append("%s %s" % (name, value))
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+_trace = None
+_trace_lock = threading.Lock()
+
+
+def start_trace():
+    """Start collecting every finished span for write_trace()."""
+    global _trace
+    with _trace_lock:
+        _trace = []
+
+
+def write_trace(path: str):
+    with _trace_lock:
+        spans = list(_trace or [])
+    with open(path, "w") as f:
+        json.dump({"spans": spans}, f, indent=2)
+
+
+def record_span(name: str, started_at: float, duration_s: float, attrs: dict):
+    """Record a span measured elsewhere (started_at is epoch seconds)."""
+    status = str(attrs.get("status", "ok"))
+    metrics.observe(name, status, duration_s, attrs.get("bytes"))
+    with _trace_lock:
+        if _trace is not None:
+            entry = {
+                "name": name,
+                "start": round(started_at, 6),
+                "duration_s": round(duration_s, 6),
+                "thread": threading.current_thread().name,
+            }
+            entry.update(attrs)
+            entry["status"] = status
+            _trace.append(entry)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    started_at = time.time()
+    t0 = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as exc:
+        attrs.setdefault("status", "error")
+        attrs.setdefault("error", str(exc)[:200])
+        raise
+    finally:
+        attrs.setdefault("status", "ok")
+        record_span(name, started_at, time.perf_counter() - t0, attrs)
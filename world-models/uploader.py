@@ -0,0 +1,213 @@
+"""
+In-process uploader for World Labs signed upload URLs.
+
+Streams the file from disk in chunks over a shared requests.Session (no curl
+subprocess, no reading the whole file into memory) and reports throughput as
+it goes. When the signed URL is a resumable-upload URL (x-goog-resumable:
+start), an interrupted transfer is resumed from the last byte the storage
+backend acknowledged instead of being re-sent from byte zero.
+
+Header strategies are tried in order, mirroring the documented flow:
+  1) required_headers only (strict docs flow)
+  2) required_headers + Content-Type, for strict storage backends
+"""
+
+import os
+import time
+from typing import Callable, Optional
+
+import requests
+
+from retry import RetryPolicy, retry_after_s
+from telemetry import span
+
+CHUNK_SIZE = 1024 * 1024
+# (connect, read) timeout for each upload request.
+UPLOAD_TIMEOUT = (10, 300)
+MAX_RESUME_ATTEMPTS = 5
+# Jittered backoff between resumes of an interrupted resumable upload.
+RESUME_RETRY = RetryPolicy(base_s=1.0, max_s=30.0)
+
+
+class FileChunkReader:
+    """File-like body that streams path[offset:] and reports progress as it is read."""
+
+    def __init__(self, path: str, offset: int = 0, on_bytes: Optional[Callable[[int], None]] = None):
+        self._file = open(path, "rb")
+        self._file.seek(offset)
+        self._remaining = os.path.getsize(path) - offset
+        self._on_bytes = on_bytes
+
+    def __len__(self):
+        return self._remaining
+
+    def read(self, size: int = -1) -> bytes:
+        if self._remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > CHUNK_SIZE:
+            size = CHUNK_SIZE
+        chunk = self._file.read(min(size, self._remaining))
+        self._remaining -= len(chunk)
+        if chunk and self._on_bytes:
+            self._on_bytes(len(chunk))
+        return chunk
+
+    def close(self):
+        self._file.close()
+
+
+class ProgressReporter:
+    """Prints bytes sent and bytes-per-second at most once per interval."""
+
+    def __init__(self, file_name: str, total: int, interval_s: float = 1.0, verb: str = "Uploaded"):
+        self.file_name = file_name
+        self.verb = verb
+        self.total = total
+        self.interval_s = interval_s
+        self.sent = 0
+        self._rate_base = 0
+        self.started_at = time.monotonic()
+        self._last_report = 0.0
+
+    def reset_to(self, offset: int):
+        """Restart the count at offset (after a resume) so the rate only reflects new bytes."""
+        self.sent = offset
+        self._rate_base = offset
+        self.started_at = time.monotonic()
+
+    def __call__(self, n: int):
+        self.sent += n
+        now = time.monotonic()
+        if now - self._last_report >= self.interval_s or self.sent >= self.total:
+            self._last_report = now
+            print(
+                "%s %.2f/%.2f MB of %s (%.2f MB/s)"
+                % (
+                    self.verb,
+                    self.sent / (1024 * 1024),
+                    self.total / (1024 * 1024),
+                    self.file_name,
+                    self.bytes_per_second() / (1024 * 1024),
+                )
+            )
+
+    def bytes_per_second(self) -> float:
+        elapsed = time.monotonic() - self.started_at
+        return (self.sent - self._rate_base) / elapsed if elapsed > 0 else 0.0
+
+
+class SignedUploader:
+    def __init__(self, session: Optional[requests.Session] = None, max_resume_attempts: int = MAX_RESUME_ATTEMPTS):
+        self.session = session or requests.Session()
+        self.max_resume_attempts = max_resume_attempts
+
+    @staticmethod
+    def header_strategies(required_headers: dict, content_type: str):
+        yield dict(required_headers)
+        fallback = dict(required_headers)
+        fallback["Content-Type"] = content_type
+        yield fallback
+
+    @staticmethod
+    def is_resumable(headers: dict) -> bool:
+        return any(k.lower() == "x-goog-resumable" for k in headers)
+
+    def upload(self, path: str, upload_url: str, required_headers: dict, content_type: Optional[str] = None):
+        """Upload path to upload_url, trying each header strategy until one succeeds."""
+        content_type = content_type or "application/octet-stream"
+        file_name = os.path.basename(path)
+        err_parts = []
+        for attempt, headers in enumerate(self.header_strategies(required_headers, content_type), start=1):
+            file_size = os.path.getsize(path)
+            progress = ProgressReporter(file_name, file_size)
+            resumable = self.is_resumable(headers)
+            with span("upload_attempt", attempt=attempt, resumable=resumable) as attrs:
+                try:
+                    if resumable:
+                        attrs["status"] = self._upload_resumable(path, upload_url, headers, progress)
+                    else:
+                        attrs["status"] = self._upload_single(path, upload_url, headers, progress)
+                    attrs["bytes"] = file_size
+                    return
+                except UploadAttemptError as exc:
+                    attrs["status"] = exc.status or "error"
+                    if exc.status:
+                        err_parts.append("attempt%d_status=%s" % (attempt, exc.status))
+                    if exc.body:
+                        err_parts.append("attempt%d_body=%s" % (attempt, exc.body))
+                except requests.RequestException as exc:
+                    attrs["status"] = "error"
+                    err_parts.append("attempt%d_error=%s" % (attempt, exc))
+                attrs["bytes"] = progress.sent
+        raise RuntimeError("Signed upload failed: " + " | ".join(err_parts))
+
+    def _upload_single(self, path: str, url: str, headers: dict, progress: ProgressReporter) -> int:
+        body = FileChunkReader(path, on_bytes=progress)
+        try:
+            r = self.session.put(url, data=body, headers=headers, timeout=UPLOAD_TIMEOUT)
+        finally:
+            body.close()
+        if not r.ok:
+            raise UploadAttemptError(r.status_code, r.text)
+        return r.status_code
+
+    def _upload_resumable(self, path: str, url: str, headers: dict, progress: ProgressReporter) -> int:
+        """Returns the final HTTP status."""
+        total = os.path.getsize(path)
+        start = self.session.post(url, headers=headers, timeout=UPLOAD_TIMEOUT)
+        if start.status_code not in (200, 201) or "Location" not in start.headers:
+            raise UploadAttemptError(start.status_code, start.text)
+        session_url = start.headers["Location"]
+        put_headers = {k: v for k, v in headers.items() if k.lower() != "x-goog-resumable"}
+
+        offset = 0
+        r = None
+        for resume in range(self.max_resume_attempts + 1):
+            if resume:
+                time.sleep(RESUME_RETRY.delay(resume, retry_after_s(r)))
+                offset = self._query_offset(session_url, total)
+                if offset is None:
+                    return 200
+                print("Resuming upload of %s at byte %d/%d..." % (os.path.basename(path), offset, total))
+            progress.reset_to(offset)
+            chunk_headers = dict(put_headers)
+            if total:
+                chunk_headers["Content-Range"] = "bytes %d-%d/%d" % (offset, total - 1, total)
+            body = FileChunkReader(path, offset=offset, on_bytes=progress)
+            try:
+                r = self.session.put(session_url, data=body, headers=chunk_headers, timeout=UPLOAD_TIMEOUT)
+            except (requests.ConnectionError, requests.Timeout):
+                r = None
+                continue
+            finally:
+                body.close()
+            if r.status_code in (200, 201):
+                return r.status_code
+            if r.status_code in (308, 429) or r.status_code >= 500:
+                continue
+            raise UploadAttemptError(r.status_code, r.text)
+        raise UploadAttemptError(None, "upload interrupted %d times; giving up" % (self.max_resume_attempts + 1))
+
+    def _query_offset(self, session_url: str, total: int) -> Optional[int]:
+        """Ask the backend how much it has; None means the upload already completed."""
+        r = self.session.put(
+            session_url,
+            headers={"Content-Range": "bytes */%d" % total, "Content-Length": "0"},
+            timeout=UPLOAD_TIMEOUT,
+        )
+        if r.status_code in (200, 201):
+            return None
+        if r.status_code != 308:
+            raise UploadAttemptError(r.status_code, r.text)
+        # Range: bytes=0-<last byte received>; absent when nothing has been persisted yet.
+        received = r.headers.get("Range")
+        if not received:
+            return 0
+        return int(received.rsplit("-", 1)[1]) + 1
+
+
+class UploadAttemptError(Exception):
+    def __init__(self, status, body):
+        super().__init__("status=%s body=%s" % (status, body))
+        self.status = status
+        self.body = (body or "").strip()
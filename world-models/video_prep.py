@@ -0,0 +1,572 @@
+"""
+Video preparation for World Labs uploads (ffmpeg).
+
+compress_video_for_upload prepares a file on disk: ffprobe first, then pass
+through, remux with -c copy, or encode to a bitrate derived from the duration
+and the size cap (never -fs, which silently truncates). StreamingVideoCompressor
+is the pipelined ingest variant: bytes are fed to ffmpeg's stdin while they
+are still arriving, so encoding overlaps the network receive and only the
+compressed output is ever written to disk. Streaming input must be readable
+without seeking (MP4/MOV with the moov atom up front, i.e. "fast start", or
+fragmented MP4, or MKV).
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from encode_scheduler import get_encode_scheduler, whole_file_threads
+from steps import run_steps
+from telemetry import span
+
+
+# Fraction of the size cap the encoder aims for, leaving room for container overhead
+# and rate-control overshoot.
+SIZE_TARGET_FRACTION = 0.92
+# Quality ceiling: never spend more bits than CRF 30 would, even when the cap allows it.
+ENCODE_CRF = "30"
+# Two-pass retry target, as a fraction of the single-pass bitrate that overshot the cap.
+TWO_PASS_BITRATE_FRACTION = 0.85
+SAMPLING_STRATEGIES = ("uniform", "head", "fps", "motion")
+DEFAULT_SAMPLING = "uniform"
+# Output rate for --sampling fps.
+SAMPLING_FPS = 10
+# Shortest segment worth encoding on its own in segment-parallel mode.
+MIN_SEGMENT_S = 4.0
+# Streaming encodes are paced by the network, so they need few cores.
+STREAMING_ENCODE_THREADS = 2
+
+
+def missing_tool_error(tool: str) -> RuntimeError:
+    return RuntimeError(
+        "%s is required for auto-compression but was not found. "
+        "Install ffmpeg or provide a pre-compressed video." % tool
+    )
+
+
+def ffmpeg_failure(what: str, stderr: str, stdout: str = "") -> RuntimeError:
+    return RuntimeError(
+        "%s failed: %s" % (what, stderr.strip() or stdout.strip() or "unknown ffmpeg error")
+    )
+
+
+def run_ffmpeg(cmd: list, what: str = "Video compression") -> subprocess.CompletedProcess:
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+    except FileNotFoundError:
+        raise missing_tool_error(cmd[0])
+    if proc.returncode != 0:
+        raise ffmpeg_failure(what, proc.stderr, proc.stdout)
+    return proc
+
+
+def ffprobe_cmd(path: str) -> list:
+    return ["ffprobe", "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path]
+
+
+def probe_video(path: str) -> dict:
+    """Summarize the first video stream of path with ffprobe."""
+    proc = run_ffmpeg(ffprobe_cmd(path), what="ffprobe")
+    return summarize_probe(proc.stdout, path)
+
+
+def summarize_probe(ffprobe_json: str, path: str) -> dict:
+    """The fields plan_video_upload needs, from ffprobe's JSON output for path."""
+    data = json.loads(ffprobe_json or "{}")
+    streams = data.get("streams") or []
+    video = next((st for st in streams if st.get("codec_type") == "video"), None)
+    if video is None:
+        raise RuntimeError("No video stream found in %s" % os.path.basename(path))
+    fmt = data.get("format") or {}
+
+    fps = _parse_rate(video.get("avg_frame_rate")) or _parse_rate(video.get("r_frame_rate"))
+    duration = _to_float(video.get("duration")) or _to_float(fmt.get("duration"))
+    frames = _to_int(video.get("nb_frames"))
+    if not frames and duration and fps:
+        frames = int(round(duration * fps))
+    return {
+        "codec": video.get("codec_name"),
+        "pix_fmt": video.get("pix_fmt"),
+        "width": _to_int(video.get("width")),
+        "height": _to_int(video.get("height")),
+        "fps": fps,
+        "duration": duration,
+        "frames": frames,
+        "size": _to_int(fmt.get("size")) or os.path.getsize(path),
+        "has_audio": any(st.get("codec_type") == "audio" for st in streams),
+        "extra_streams": len(streams) > 1,
+    }
+
+
+def sampling_filter(strategy: str, info: dict, max_frames: int):
+    """ffmpeg -vf chain that picks which frames to keep, or None to keep frames in order.
+
+    head:    the first max_frames frames (everything after them is dropped)
+    uniform: evenly spaced frames across the whole clip when it has more than max_frames
+    fps:     at most SAMPLING_FPS frames per second, thinned further if still over max_frames
+    motion:  uniform thinning, then mpdecimate drops near-duplicate frames (static shots)
+    """
+    if strategy not in SAMPLING_STRATEGIES:
+        raise ValueError("sampling must be one of %s" % (SAMPLING_STRATEGIES,))
+    duration = info.get("duration") or 0
+    src_fps = info.get("fps") or 0
+    if strategy == "head" or duration <= 0:
+        return None
+
+    # Highest output rate that keeps the whole clip within max_frames.
+    coverage_fps = max_frames / duration
+    if strategy == "fps":
+        target_fps = min(SAMPLING_FPS, coverage_fps)
+    else:
+        target_fps = coverage_fps
+
+    filters = []
+    if not src_fps or target_fps < src_fps:
+        filters.append("fps=%.4f" % target_fps)
+    if strategy == "motion":
+        filters.extend(["mpdecimate", "setpts=N/FRAME_RATE/TB"])
+    return ",".join(filters) or None
+
+
+def plan_video_upload(info: dict, ext: str, max_size_mb: int, max_frames: int, sampling: str = "uniform") -> dict:
+    """Decide how to make a probed video upload-safe.
+
+    Returns {"action": "passthrough" | "remux" | "encode", "reason": str} plus, for encode,
+    "bitrate" (bits/s or None) and "vf" (frame sampling filter or None).
+    """
+    max_size_bytes = max_size_mb * 1024 * 1024
+    vf = sampling_filter(sampling, info, max_frames)
+    within_limits = (
+        info["size"] <= max_size_bytes
+        and info["frames"]
+        and info["frames"] <= max_frames
+        and info["codec"] == "h264"
+        and info["pix_fmt"] == "yuv420p"
+    )
+    if within_limits and (vf is None or sampling == "uniform"):
+        if ext == "mp4" and not info["extra_streams"]:
+            return {"action": "passthrough", "reason": "already an H.264 MP4 within limits"}
+        return {"action": "remux", "reason": "H.264 within limits; rewrapping as video-only MP4"}
+
+    # Encode only the frames that will be kept, at the bitrate that fills the size budget.
+    # Sampled output still spans the whole clip; head sampling keeps only its first frames.
+    duration = info["duration"] or 0
+    if vf is None and info["fps"] and info["frames"] and info["frames"] > max_frames:
+        duration = max_frames / info["fps"]
+    reason = "re-encoding to fit %d MB with %s sampling" % (max_size_mb, sampling)
+    if duration <= 0:
+        return {"action": "encode", "reason": "unknown duration; quality-targeted encode", "bitrate": None, "vf": vf}
+    bitrate = int(max_size_bytes * 8 * SIZE_TARGET_FRACTION / duration)
+    return {"action": "encode", "reason": reason, "bitrate": bitrate, "vf": vf}
+
+
+def encode_cmd(
+    input_spec: str,
+    output_path: str,
+    max_frames: int,
+    bitrate=None,
+    pass_num=None,
+    passlog=None,
+    vf=None,
+    threads=None,
+) -> list:
+    """libx264 encode capped by frame count (when given) and, when bitrate is given, by bitrate."""
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", input_spec, "-an"]
+    if vf:
+        # -vsync rather than -fps_mode (ffmpeg 5.1+): ffmpeg 4.x, still common on LTS distros, lacks the latter.
+        cmd.extend(["-vf", vf, "-vsync", "vfr"])
+    cmd.extend(["-c:v", "libx264", "-preset", "medium", "-pix_fmt", "yuv420p"])
+    if threads:
+        cmd.extend(["-threads", str(threads)])
+    if pass_num is None:
+        # Capped CRF: CRF quality, but the VBV cap keeps large inputs under the size budget.
+        cmd.extend(["-crf", ENCODE_CRF])
+        if bitrate:
+            cmd.extend(["-maxrate", str(bitrate), "-bufsize", str(bitrate * 2)])
+    else:
+        cmd.extend(["-b:v", str(bitrate), "-pass", str(pass_num), "-passlogfile", passlog])
+    if max_frames:
+        cmd.extend(["-frames:v", str(max_frames)])
+    if pass_num == 1:
+        cmd.extend(["-f", "null", os.devnull])
+    else:
+        cmd.extend(["-movflags", "+faststart", output_path])
+    return cmd
+
+
+def remux_cmd(input_path: str, output_path: str) -> list:
+    """Stream-copy the first video stream into a fast-start MP4 (no re-encode)."""
+    return [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", input_path,
+        "-map", "0:v:0", "-an", "-c", "copy", "-movflags", "+faststart", output_path,
+    ]
+
+
+def upload_output_path(input_path: str) -> str:
+    return os.path.splitext(input_path)[0] + ".upload.mp4"
+
+
+def streaming_encode_cmd(output_path: str, max_frames: int, sampling: str, threads=None) -> list:
+    """Quality-targeted encode of stdin, whose duration is unknown until it ends.
+
+    Only rate-based sampling can be applied on the fly; uniform thinning to max_frames happens
+    afterwards on the (much smaller) compressed output if it is still needed.
+    """
+    if sampling not in SAMPLING_STRATEGIES:
+        raise ValueError("sampling must be one of %s" % (SAMPLING_STRATEGIES,))
+    vf = None
+    if sampling == "fps":
+        vf = "fps=%d" % SAMPLING_FPS
+    elif sampling == "motion":
+        vf = "mpdecimate,setpts=N/FRAME_RATE/TB"
+    return encode_cmd("pipe:0", output_path, max_frames if sampling == "head" else None, vf=vf, threads=threads)
+
+
+def run_encode(cmd_for_threads, threads: int):
+    """Run the encode built by cmd_for_threads(n) while holding n core slots of the scheduler."""
+    with get_encode_scheduler().slot(threads) as held:
+        return run_ffmpeg(cmd_for_threads(held))
+
+
+def split_at_keyframes(input_path: str, segment_dir: str, segment_s: float, max_frames=None) -> list:
+    """Stream-copy the video into segments that start on keyframes; returns their paths in order."""
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", input_path, "-map", "0:v:0", "-an"]
+    if max_frames:
+        cmd.extend(["-frames:v", str(max_frames)])
+    cmd.extend(
+        [
+            "-c",
+            "copy",
+            "-f",
+            "segment",
+            "-segment_time",
+            "%.3f" % segment_s,
+            "-reset_timestamps",
+            "1",
+            os.path.join(segment_dir, "src_%04d.mkv"),
+        ]
+    )
+    run_ffmpeg(cmd, what="Video segmenting")
+    return sorted(
+        os.path.join(segment_dir, name) for name in os.listdir(segment_dir) if name.startswith("src_")
+    )
+
+
+def encode_segments_parallel(input_path: str, output_path: str, plan: dict, info: dict, max_frames: int, sampling: str):
+    """Encode keyframe-aligned segments concurrently (one core slot each) and concatenate them.
+
+    Sampling filters and the bitrate cap are rate-based, so applying them per segment keeps the
+    whole-clip frame and size budgets; the concat step re-applies the frame cap as a guard.
+    """
+    slots = get_encode_scheduler().slots
+    duration = info.get("duration") or 0
+    if sampling == "head" and info.get("fps"):
+        duration = min(duration, max_frames / info["fps"])
+    segment_s = max(MIN_SEGMENT_S, duration / slots)
+    segment_dir = tempfile.mkdtemp(prefix="segments-", dir=os.path.dirname(output_path))
+    try:
+        # Head sampling keeps the first max_frames frames, so only those are split off.
+        sources = split_at_keyframes(
+            input_path, segment_dir, segment_s, max_frames if sampling == "head" else None
+        )
+        print("Encoding %d segments in parallel..." % len(sources))
+        outputs = [os.path.splitext(src)[0].replace("src_", "enc_") + ".mp4" for src in sources]
+        with ThreadPoolExecutor(max_workers=min(slots, len(sources))) as pool:
+            futures = [
+                pool.submit(
+                    run_encode,
+                    lambda n, src=src, out=out: encode_cmd(
+                        src, out, None, bitrate=plan["bitrate"], vf=plan["vf"], threads=n
+                    ),
+                    1,
+                )
+                for src, out in zip(sources, outputs)
+            ]
+            for future in futures:
+                future.result()
+
+        list_path = os.path.join(segment_dir, "segments.txt")
+        with open(list_path, "w") as f:
+            for out in outputs:
+                f.write("file '%s'\n" % out.replace("'", "'\\''"))
+        run_ffmpeg(
+            [
+                "ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                "-i", list_path, "-c", "copy", "-frames:v", str(max_frames),
+                "-movflags", "+faststart", output_path,
+            ],
+            what="Segment concatenation",
+        )
+    finally:
+        shutil.rmtree(segment_dir, ignore_errors=True)
+
+
+def check_compressed_output(output_path: str, max_size_mb: int) -> str:
+    if not os.path.isfile(output_path):
+        raise RuntimeError("Video compression failed: output file not created")
+
+    output_size = os.path.getsize(output_path)
+    if output_size > max_size_mb * 1024 * 1024:
+        raise RuntimeError(
+            "Compressed video still too large: %.2f MB > %d MB"
+            % (output_size / (1024 * 1024), max_size_mb)
+        )
+
+    print(
+        "Compressed video: %s (%.2f MB)"
+        % (os.path.basename(output_path), output_size / (1024 * 1024))
+    )
+    return output_path
+
+
+def compress_video_for_upload(
+    input_path: str,
+    max_size_mb: int,
+    max_frames: int,
+    sampling: str = DEFAULT_SAMPLING,
+    parallel=None,
+    output_path=None,
+) -> str:
+    """Return an upload-safe MP4 capped by size and frame count.
+
+    Inputs already within the limits are returned as-is or remuxed with -c copy; others get a
+    bitrate-targeted encode (capped CRF, then two-pass if that overshoots) that never truncates.
+    sampling picks which frames survive the max_frames cap (see sampling_filter). parallel
+    (default: WORLD_ENCODE_PARALLEL) splits long inputs at keyframes and encodes the segments
+    concurrently. output_path (default "<input>.upload.mp4") should be in a job's workspace
+    (see workspace.py) whenever another run could be preparing the same input.
+    """
+    with span("compress", bytes_in=os.path.getsize(input_path), sampling=sampling) as attrs:
+        output_path = _compress_video_for_upload(
+            input_path, max_size_mb, max_frames, sampling, parallel, output_path, attrs
+        )
+        attrs["bytes"] = os.path.getsize(output_path)
+        return output_path
+
+
+def _compress_video_for_upload(input_path, max_size_mb, max_frames, sampling, parallel, output_path, attrs):
+    if parallel is None:
+        parallel = os.environ.get("WORLD_ENCODE_PARALLEL", "0").lower() in ("1", "true", "yes", "on")
+    steps = compression_steps(input_path, max_size_mb, max_frames, sampling, output_path, attrs, parallel)
+    return run_steps(steps, _run_compression_step)
+
+
+def _run_compression_step(step):
+    if step[0] == "probe":
+        return probe_video(step[1])
+    if step[0] == "ffmpeg":
+        return run_ffmpeg(step[1])
+    if step[0] == "encode":
+        return run_encode(step[1], step[2])
+    return encode_segments_parallel(*step[1:])
+
+
+def compression_steps(input_path, max_size_mb, max_frames, sampling, output_path, attrs, parallel=False):
+    """compress_video_for_upload's plan and commands, as a step generator (see steps.py).
+
+    Shared with the asyncio server (async_world.compress_video). Yields:
+      ("probe", path)                          -> the probe summary (summarize_probe)
+      ("ffmpeg", cmd)                          -> run ffmpeg
+      ("encode", cmd_for_threads, threads)     -> run_encode: ffmpeg while holding encode slots
+      ("segments", input_path, output_path, plan, info, max_frames, sampling)
+                                               -> encode_segments_parallel (only when parallel)
+    and returns the path to upload.
+    """
+    input_path = os.path.abspath(input_path)
+    output_path = os.path.abspath(output_path or upload_output_path(input_path))
+    ext = os.path.splitext(input_path)[1].lstrip(".").lower()
+    max_size_bytes = max_size_mb * 1024 * 1024
+
+    info = {}
+    try:
+        info = yield ("probe", input_path)
+        plan = plan_video_upload(info, ext, max_size_mb, max_frames, sampling)
+    except RuntimeError as exc:
+        print("Could not probe video (%s); falling back to a full re-encode." % exc)
+        plan = {"action": "encode", "reason": "probe unavailable", "bitrate": None, "vf": None}
+    attrs["action"] = plan["action"]
+
+    if plan["action"] == "passthrough":
+        print("Video already upload-safe (%s); skipping compression." % plan["reason"])
+        return input_path
+
+    if plan["action"] == "remux":
+        print("Remuxing video for upload (%s)..." % plan["reason"])
+        yield ("ffmpeg", remux_cmd(input_path, output_path))
+        return check_compressed_output(output_path, max_size_mb)
+
+    bitrate = plan["bitrate"]
+    vf = plan["vf"]
+    print(
+        "Auto-compressing video for upload (<=%d MB, <=%d frames, %s sampling%s)..."
+        % (max_size_mb, max_frames, sampling, ", %d kbps cap" % (bitrate // 1000) if bitrate else "")
+    )
+    if parallel and (info.get("duration") or 0) >= 2 * MIN_SEGMENT_S:
+        yield ("segments", input_path, output_path, plan, info, max_frames, sampling)
+    else:
+        yield (
+            "encode",
+            lambda n: encode_cmd(input_path, output_path, max_frames, bitrate=bitrate, vf=vf, threads=n),
+            whole_file_threads(),
+        )
+
+    if bitrate and os.path.getsize(output_path) > max_size_bytes:
+        # VBV overshoot: one bounded two-pass ABR retry a little under the budget.
+        bitrate = int(bitrate * TWO_PASS_BITRATE_FRACTION)
+        print("Single-pass encode overshot the cap; running two-pass at %d kbps..." % (bitrate // 1000))
+        attrs["action"] = "encode_two_pass"
+        passlog = os.path.splitext(output_path)[0] + ".passlog"
+        try:
+            for pass_num in (1, 2):
+                yield (
+                    "encode",
+                    lambda n: encode_cmd(input_path, output_path, max_frames, bitrate, pass_num, passlog, vf, n),
+                    whole_file_threads(),
+                )
+        finally:
+            remove_passlogs(passlog)
+
+    return check_compressed_output(output_path, max_size_mb)
+
+
+def remove_passlogs(passlog: str):
+    for suffix in ("-0.log", "-0.log.mbtree"):
+        if os.path.exists(passlog + suffix):
+            os.remove(passlog + suffix)
+
+
+def _parse_rate(rate):
+    try:
+        num, den = (rate or "").split("/")
+        return float(num) / float(den) if float(den) else None
+    except ValueError:
+        return None
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class StreamingVideoCompressor:
+    """Writable sink that pipes incoming video bytes straight into ffmpeg.
+
+    Usable as a werkzeug upload stream: write() forwards each chunk, seek() is
+    a no-op (there is nothing to rewind), and finish() closes ffmpeg's stdin and
+    returns the compressed output path.
+    """
+
+    def __init__(
+        self, output_path: str, max_size_mb: int, max_frames: int, sampling: str = DEFAULT_SAMPLING, slots: int = 0
+    ):
+        self.output_path = output_path
+        self.max_size_mb = max_size_mb
+        self.max_frames = max_frames
+        self.sampling = sampling
+        self.bytes_received = 0
+        self._sha256 = hashlib.sha256()
+        self._stdin_closed = False
+        # slots already taken by the caller (e.g. with try_acquire) are released with the encode.
+        self._slots = slots or get_encode_scheduler().acquire(STREAMING_ENCODE_THREADS)
+        ffmpeg_cmd = streaming_encode_cmd(output_path, max_frames, sampling, threads=self._slots)
+        print(
+            "Streaming video into ffmpeg for upload (<=%d MB, <=%d frames, %s sampling)..."
+            % (max_size_mb, max_frames, sampling)
+        )
+        try:
+            self.proc = subprocess.Popen(
+                ffmpeg_cmd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+            )
+        except FileNotFoundError:
+            self._release_slots()
+            raise RuntimeError(
+                "ffmpeg is required for auto-compression but was not found. "
+                "Install ffmpeg or provide a pre-compressed video."
+            )
+
+    def _release_slots(self):
+        if self._slots:
+            get_encode_scheduler().release(self._slots)
+            self._slots = 0
+
+    def write(self, data: bytes) -> int:
+        self.bytes_received += len(data)
+        self._sha256.update(data)
+        if not self._stdin_closed:
+            try:
+                self.proc.stdin.write(data)
+            except BrokenPipeError:
+                # ffmpeg exited early; keep draining the request and report the error in finish().
+                self._stdin_closed = True
+        return len(data)
+
+    @property
+    def input_sha256(self) -> str:
+        """Hash of the original (uncompressed) bytes written so far."""
+        return self._sha256.hexdigest()
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return 0
+
+    def _close_stdin(self):
+        if not self._stdin_closed:
+            self._stdin_closed = True
+            try:
+                self.proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    def finish(self) -> str:
+        """Signal end of input, wait for ffmpeg and validate the output."""
+        self._close_stdin()
+        stderr = self.proc.stderr.read().decode("utf-8", "replace")
+        self.proc.wait()
+        self._release_slots()
+        if self.proc.returncode != 0:
+            raise RuntimeError(
+                "Video compression failed: %s (streamed input must not require seeking; "
+                "use a fast-start MP4/MOV)" % (stderr.strip() or "unknown ffmpeg error")
+            )
+        if not os.path.isfile(self.output_path):
+            raise RuntimeError("Video compression failed: output file not created")
+        # The duration was unknown while streaming; now that the output is on disk, thin it to
+        # max_frames and size-target it if needed (a no-op passthrough when it already fits).
+        resized = compress_video_for_upload(
+            self.output_path,
+            self.max_size_mb,
+            self.max_frames,
+            "head" if self.sampling == "head" else "uniform",
+        )
+        if resized != self.output_path:
+            os.replace(resized, self.output_path)
+        return check_compressed_output(self.output_path, self.max_size_mb)
+
+    def abort(self):
+        self._close_stdin()
+        self.proc.kill()
+        self.proc.wait()
+        self._release_slots()
+        if os.path.exists(self.output_path):
+            try:
+                os.remove(self.output_path)
+            except OSError:
+                pass
+
+    def close(self):
+        pass
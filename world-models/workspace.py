@@ -0,0 +1,361 @@
+"""
+Per-job scratch directories for uploads, compressed outputs and other
+intermediate files.
+
+Every job (server request, CLI upload, image preparation) gets its own
+directory under one root, so concurrent runs on the same source never share
+a file name, and closing the workspace removes everything the job wrote. No
+cleanup code has to guess output paths.
+
+Layout:
+  <root>/<pid>-<token>.lock      held (flock) by the owning process while it runs
+  <root>/<pid>-<token>.reserved  bytes of the quota that process holds
+  <root>/<pid>-<token>/<label>-<n>/...
+  <root>/quota.lock              flock serializing quota checks across processes
+
+A process that crashes releases its lock with it. reap_orphans() (run at
+server startup) deletes every owner directory whose lock is free, and so
+reclaims the disk of killed workers without touching live ones. Workspaces
+reserve the bytes they expect to write against a quota shared by every live
+process using the root (each records its reservations in its .reserved file,
+and a check sums them under quota.lock), so N server workers together stay
+within it; when it is used up the servers answer 503 (WorkspaceFull) and CLI
+uploads wait, instead of filling the disk under sustained load. Without flock
+(Windows) the quota applies to each process separately.
+
+Files move between owners with hand_off() / link_or_copy(): a hardlink on the
+same filesystem, a copy only across filesystems. Keep the root on the same filesystem as the
+destinations that matter (e.g. on tmpfs, spooled uploads and their
+compressed outputs stay in RAM until they are deleted).
+
+Environment:
+  WORLD_WORKSPACE_DIR         root directory (default: <system temp dir>/worldly-work)
+  WORLD_WORKSPACE_TMPFS=1     default the root to /dev/shm/worldly-work (RAM-backed) when available
+  WORLD_WORKSPACE_QUOTA_MB    bytes all processes sharing the root may reserve at once (default 0: unlimited)
+"""
+
+import atexit
+import errno
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to checking whether the owner pid is alive
+    fcntl = None
+
+TMPFS_DIR = "/dev/shm"
+ROOT_NAME = "worldly-work"
+QUOTA_LOCK_NAME = "quota.lock"
+# How often a create(wait=True) rechecks a quota that other processes may have freed.
+QUOTA_RECHECK_S = 1.0
+
+
+class WorkspaceFull(RuntimeError):
+    def __init__(self, message: str, retry_after_s: float = 30.0):
+        super().__init__(message)
+        self.retry_after_s = retry_after_s
+
+
+def link_or_copy(src: str, dest: str) -> bool:
+    """Give src a second name at dest (a hardlink; a copy across filesystems) without overwriting.
+
+    Returns False, leaving everything as it was, if dest already exists.
+    """
+    try:
+        os.link(src, dest)
+        return True
+    except FileExistsError:
+        return False
+    except OSError as exc:
+        if exc.errno not in (errno.EXDEV, errno.EPERM, errno.ENOTSUP, errno.EMLINK):
+            raise
+    # Different filesystem (or no hardlinks): copy next to dest, then publish by rename.
+    partial = "%s.%s.partial" % (dest, uuid.uuid4().hex[:8])
+    shutil.copyfile(src, partial)
+    if os.path.exists(dest):
+        os.remove(partial)
+        return False
+    os.replace(partial, dest)
+    return True
+
+
+def hand_off(src: str, dest: str) -> bool:
+    """Move src to dest without copying when both are on one filesystem; src is gone afterwards.
+
+    Never overwrites: if dest already exists (e.g. identical content published by another
+    process) src is just removed and False is returned.
+    """
+    moved = link_or_copy(src, dest)
+    os.remove(src)
+    return moved
+
+
+def _tree_bytes(path: str) -> int:
+    total = 0
+    for dirpath, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Workspace:
+    def __init__(self, manager: "WorkspaceManager", path: str, reserved: int):
+        self.manager = manager
+        self.path = path
+        self.reserved = reserved
+        self._closed = False
+
+    def file(self, name: str) -> str:
+        """Path for a new file in this workspace (nothing is created)."""
+        return os.path.join(self.path, name)
+
+    def adopt(self, src: str, name: Optional[str] = None) -> str:
+        """Move a file into this workspace (rename, not copy); returns its new path."""
+        dest = self.file(name or os.path.basename(src))
+        if os.path.exists(dest):
+            os.remove(dest)
+        hand_off(src, dest)
+        return dest
+
+    def bytes_used(self) -> int:
+        return _tree_bytes(self.path)
+
+    def close(self):
+        """Delete the workspace and everything in it; safe to call more than once."""
+        if self._closed:
+            return
+        self._closed = True
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.manager._release(self.reserved)
+
+    def __enter__(self) -> "Workspace":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class WorkspaceManager:
+    def __init__(self, root: str, quota_bytes: int = 0):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self._cond = threading.Condition()
+        self._reserved = 0
+        self._active = 0
+        self._counter = itertools.count(1)
+        self._owner_dir = None
+        self._owner_pid = None
+        self._owner_lock = None
+
+    @classmethod
+    def from_env(cls) -> "WorkspaceManager":
+        root = os.environ.get("WORLD_WORKSPACE_DIR")
+        if not root:
+            tmpfs = os.environ.get("WORLD_WORKSPACE_TMPFS", "0").lower() in ("1", "true", "yes", "on")
+            base = TMPFS_DIR if tmpfs and os.path.isdir(TMPFS_DIR) else tempfile.gettempdir()
+            root = os.path.join(base, ROOT_NAME)
+        return cls(root, quota_bytes=int(float(os.environ.get("WORLD_WORKSPACE_QUOTA_MB", "0")) * 1024 * 1024))
+
+    def _owner(self) -> str:
+        """This process's directory under root, created (with its held lock) on first use."""
+        if self._owner_pid != os.getpid():
+            os.makedirs(self.root, exist_ok=True)
+            name = "%d-%s" % (os.getpid(), uuid.uuid4().hex[:8])
+            self._owner_lock = open(os.path.join(self.root, name + ".lock"), "w")
+            if fcntl is not None:
+                fcntl.flock(self._owner_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self._owner_dir = os.path.join(self.root, name)
+            self._owner_pid = os.getpid()
+            # A forked child starts with none of its parent's reservations.
+            self._reserved = 0
+            os.makedirs(self._owner_dir)
+            atexit.register(self._remove_owner, self._owner_dir, self._owner_lock)
+        return self._owner_dir
+
+    @staticmethod
+    def _remove_owner(owner_dir: str, owner_lock):
+        """At a clean exit, delete this process's directory (crashes are left to reap_orphans)."""
+        if owner_lock.closed or os.getpid() != int(os.path.basename(owner_dir).split("-", 1)[0]):
+            return
+        shutil.rmtree(owner_dir, ignore_errors=True)
+        for path in (owner_dir + ".reserved", owner_lock.name):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        owner_lock.close()
+
+    def _quota_lock(self):
+        """Open file whose exclusive flock serializes quota accounting across processes (None without flock)."""
+        if fcntl is None:
+            return None
+        f = open(os.path.join(self.root, QUOTA_LOCK_NAME), "a")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def _others_reserved(self) -> int:
+        """Bytes reserved by the other live processes sharing root (call holding the quota lock)."""
+        if fcntl is None:
+            return 0
+        total = 0
+        for entry in os.listdir(self.root):
+            if not entry.endswith(".reserved"):
+                continue
+            name = entry[: -len(".reserved")]
+            lock_path = os.path.join(self.root, name + ".lock")
+            if os.path.join(self.root, name) == self._owner_dir or not os.path.exists(lock_path):
+                continue
+            if self._owner_is_gone(lock_path, name):
+                continue
+            try:
+                with open(os.path.join(self.root, entry)) as f:
+                    total += int(f.read().strip() or 0)
+            except (OSError, ValueError):
+                pass
+        return total
+
+    def _record_reserved(self):
+        """Publish this process's reservations for the others' quota checks (call holding the quota lock)."""
+        if fcntl is not None:
+            with open(self._owner_dir + ".reserved", "w") as f:
+                f.write(str(self._reserved))
+
+    def _try_reserve(self, reserve_bytes: int):
+        """Reserve reserve_bytes if the shared quota allows; returns (reserved, bytes reserved in total)."""
+        self._owner()
+        quota_lock = self._quota_lock()
+        try:
+            used = self._others_reserved() + self._reserved
+            if used + reserve_bytes > self.quota_bytes:
+                return False, used
+            self._reserved += reserve_bytes
+            self._record_reserved()
+            return True, used + reserve_bytes
+        finally:
+            if quota_lock is not None:
+                quota_lock.close()
+
+    def create(self, label: str = "job", reserve_bytes: int = 0, wait: bool = False) -> Workspace:
+        """New empty workspace holding reserve_bytes of the quota until it is closed.
+
+        When the quota cannot cover reserve_bytes right now, raises WorkspaceFull, or with
+        wait=True blocks until workspaces close, here or in other processes (servers reject,
+        CLI jobs queue).
+        """
+        with self._cond:
+            if self.quota_bytes:
+                while True:
+                    reserved, used = self._try_reserve(reserve_bytes)
+                    if reserved:
+                        break
+                    if not wait or reserve_bytes > self.quota_bytes:
+                        raise WorkspaceFull(
+                            "Scratch space is full (%.0f of %.0f MB reserved); retry later"
+                            % (used / (1024 * 1024), self.quota_bytes / (1024 * 1024))
+                        )
+                    # Local closes notify; other processes' are only seen by checking again.
+                    self._cond.wait(QUOTA_RECHECK_S)
+            self._active += 1
+            try:
+                path = os.path.join(self._owner(), "%s-%d" % (label, next(self._counter)))
+                os.makedirs(path)
+            except BaseException:
+                self._active -= 1
+                self._unreserve_locked(reserve_bytes)
+                raise
+        return Workspace(self, path, reserve_bytes)
+
+    def _release(self, reserved: int):
+        with self._cond:
+            self._active -= 1
+            self._unreserve_locked(reserved)
+            self._cond.notify_all()
+
+    def _unreserve_locked(self, reserved: int):
+        if not self.quota_bytes or not reserved:
+            return
+        quota_lock = self._quota_lock()
+        try:
+            self._reserved -= reserved
+            self._record_reserved()
+        finally:
+            if quota_lock is not None:
+                quota_lock.close()
+
+    def reserved_bytes(self) -> int:
+        with self._cond:
+            return self._reserved
+
+    def active(self) -> int:
+        with self._cond:
+            return self._active
+
+    def reap_orphans(self) -> int:
+        """Delete owner directories left by processes that are gone; returns bytes reclaimed."""
+        if not os.path.isdir(self.root):
+            return 0
+        reclaimed = 0
+        for entry in os.listdir(self.root):
+            if not entry.endswith(".lock"):
+                continue
+            name = entry[: -len(".lock")]
+            lock_path = os.path.join(self.root, entry)
+            owner_dir = os.path.join(self.root, name)
+            if owner_dir == self._owner_dir or not self._owner_is_gone(lock_path, name):
+                continue
+            reclaimed += _tree_bytes(owner_dir)
+            shutil.rmtree(owner_dir, ignore_errors=True)
+            for path in (owner_dir + ".reserved", lock_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        if reclaimed:
+            print("Reclaimed %.1f MB of scratch space left by stopped workers" % (reclaimed / (1024 * 1024)))
+        return reclaimed
+
+    @staticmethod
+    def _owner_is_gone(lock_path: str, name: str) -> bool:
+        if fcntl is None:
+            pid = name.split("-", 1)[0]
+            return pid.isdigit() and not _pid_alive(int(pid))
+        try:
+            with open(lock_path, "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        except OSError:
+            return False
+        return True
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_workspaces() -> WorkspaceManager:
+    """Process-wide workspace manager configured from the environment."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = WorkspaceManager.from_env()
+        return _manager
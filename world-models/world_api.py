@@ -0,0 +1,161 @@
+"""
+Request validation and response shaping for the /generate-worldvr contract.
+
+Shared by world_server.py (Flask, threads) and asgi_server.py (Starlette,
+asyncio) so both servers accept the same fields and headers and answer with
+the same bodies, status codes and headers. Helpers that build a response
+return (body, status, headers); each server wraps that in its own response
+type.
+"""
+
+import hashlib
+import json
+import math
+from typing import Optional
+
+from admission import DEFAULT_PRIORITY, QueueFull
+from video_prep import DEFAULT_SAMPLING, SAMPLING_STRATEGIES
+from workspace import WorkspaceFull, get_workspaces
+from world_client import DEFAULT_MODE, GENERATION_MODES
+
+DEFAULT_DISPLAY_NAME = "Generated World"
+SSE_HEARTBEAT_S = 15
+# Comment line that keeps proxies from closing an idle event stream.
+SSE_KEEPALIVE = ": keep-alive\n\n"
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+# Cached assets are named by their content hash, so clients may keep them forever.
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class BadRequest(ValueError):
+    """A /generate-worldvr request the server cannot accept; status is the HTTP code to answer with."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def error_response(message: str, status: int, headers: Optional[dict] = None):
+    return {"error": message}, status, headers or {}
+
+
+def retry_after_header(seconds: float) -> dict:
+    return {"Retry-After": str(int(math.ceil(seconds)))}
+
+
+def degraded_response(retry_in: float):
+    """503 while the World Labs circuit breaker is open (sent before the upload is read)."""
+    return error_response("World Labs API is degraded; retry later", 503, retry_after_header(retry_in))
+
+
+def workspace_full_response(exc: WorkspaceFull):
+    """503 when the scratch-space quota cannot hold another upload (sent before it is read)."""
+    return error_response(str(exc), 503, retry_after_header(exc.retry_after_s))
+
+
+def queue_full_response(exc: QueueFull):
+    body = {"error": str(exc), "queue_position": exc.queue_position, "retry_after_s": round(exc.retry_after_s)}
+    return body, exc.status, retry_after_header(exc.retry_after_s)
+
+
+def client_identity(headers, remote_addr: Optional[str]) -> str:
+    """Fairness key: the caller's API key (hashed) or X-Client-Id, else its address."""
+    api_key = headers.get("X-Api-Key") or headers.get("Authorization")
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    return headers.get("X-Client-Id") or remote_addr or "anonymous"
+
+
+def priority_of(headers) -> str:
+    return headers.get("X-Priority", DEFAULT_PRIORITY)
+
+
+def check_video_filename(filename: Optional[str]):
+    if not filename:
+        raise BadRequest("No video file provided")
+
+
+def generate_params(headers, form, args) -> dict:
+    """idempotency_key, prompt, name, sampling and mode of a request; raises BadRequest if invalid.
+
+    form and args are the multipart fields and query parameters (any mapping with .get()).
+    """
+    sampling = form.get("sampling") or args.get("sampling") or DEFAULT_SAMPLING
+    if sampling not in SAMPLING_STRATEGIES:
+        raise BadRequest("sampling must be one of %s" % ", ".join(SAMPLING_STRATEGIES))
+    mode = form.get("mode") or args.get("mode") or DEFAULT_MODE
+    if mode not in GENERATION_MODES:
+        raise BadRequest("mode must be one of %s" % ", ".join(GENERATION_MODES))
+    return {
+        "idempotency_key": headers.get("Idempotency-Key") or None,
+        "prompt": form.get("prompt"),
+        "name": form.get("name", DEFAULT_DISPLAY_NAME),
+        "sampling": sampling,
+        "mode": mode,
+    }
+
+
+def job_urls(job_id: str):
+    """(status_url, events_url) for a job."""
+    return "/jobs/%s" % job_id, "/generate-worldvr/%s/events" % job_id
+
+
+def job_response(job, status: int, **extra):
+    status_url, events_url = job_urls(job.id)
+    body = job.to_dict()
+    body["status_url"] = status_url
+    body["events_url"] = events_url
+    body.update(extra)
+    return body, status, {"Location": status_url}
+
+
+def attached_response(job, dedupe_key: str):
+    """Answer for a request that matched an existing job (see JobRegistry.create_or_attach)."""
+    if job.dedupe_key != dedupe_key:
+        return error_response("Idempotency-Key was already used for a different request", 422)
+    return job_response(job, 200 if job.finished else 202, deduplicated=True)
+
+
+def unknown_job_response(job_id: str):
+    return error_response("Unknown job: %s" % job_id, 404)
+
+
+def local_assets(entries: dict) -> dict:
+    """Job-result view of asset cache entries: {name: {url, sha256, size}}, url served by /assets/."""
+    return {
+        name: {"url": "/assets/" + entry["sha256"] + entry["ext"], "sha256": entry["sha256"], "size": entry["size"]}
+        for name, entry in entries.items()
+    }
+
+
+def asset_headers(entry: dict) -> dict:
+    """Headers for a cached asset: the content hash is a strong ETag and the file never changes."""
+    return {"ETag": '"%s"' % entry["sha256"], "Cache-Control": ASSET_CACHE_CONTROL}
+
+
+def etag_matches(if_none_match: Optional[str], entry: dict) -> bool:
+    """Whether an If-None-Match header already names this asset (answer 304)."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/").strip('"') == entry["sha256"] for tag in tags)
+
+
+def sse_event(event: dict) -> str:
+    return "event: %s\ndata: %s\n\n" % (event["stage"], json.dumps(event))
+
+
+def metrics_gauges(jobs, admission, breaker, **extra) -> dict:
+    """Gauges both servers export next to the span histograms; extra adds server-specific ones."""
+    gauges = {
+        "world_jobs_active": jobs.active_count(),
+        "world_upstream_circuit_open": 0 if breaker.state == "closed" else 1,
+        "world_admission_jobs": admission.admitted(),
+        "world_workspaces_active": get_workspaces().active(),
+        "world_workspace_reserved_bytes": get_workspaces().reserved_bytes(),
+    }
+    for name, gate in admission.gates.items():
+        gauges['world_stage_in_use{stage="%s"}' % name] = gate.in_use()
+        gauges['world_stage_waiting{stage="%s"}' % name] = gate.waiting()
+    gauges.update(extra)
+    return gauges
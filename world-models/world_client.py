@@ -0,0 +1,858 @@
+"""
+Library API for World Labs world generation from text, video or image input.
+
+WorldClient uploads media (compressing videos and preparing images first),
+starts generations and waits for them. The pieces it needs (API client, signed
+uploader, asset downloader, operation poller, media and asset caches) are
+created on first use, and nothing is resolved at import: the module loads
+without credentials and without requests or Pillow, and WORLD_LABS_API_KEY is
+only required by the first API call.
+
+    client = WorldClient(api_key="...")       # or WorldClient() to read the environment
+    operation_id = client.create_world("video", "clip.mov", "My world", None)
+    world = describe_world(operation_id, client.poll_until_done(operation_id))
+
+The module-level functions (upload_media_file, create_world_variants,
+get_client, get_poller, ...) act on default_client(), the process-wide
+instance configured from the environment, shared by create_world.py (the CLI),
+batch.py and the servers. A forked worker gets a new default client, so
+pre-fork servers can import this module in the parent without handing the
+parent's poller thread or connections to their workers.
+
+Built-in prompts are in prompts/*.txt, read by load_prompt() when first used.
+
+Environment (read on first use, after loading a .env file from the working directory):
+  WORLD_LABS_API_KEY    API key, required for API calls (never commit it)
+  WORLD_LABS_API_BASE   API root (default https://api.worldlabs.ai/marble/v1); point it
+                        at mock_worldlabs.py to run against a local stand-in
+"""
+
+import collections
+import functools
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+from contextlib import nullcontext
+from typing import Callable, Optional
+
+from media_cache import default_cache
+from poller import OperationPoller
+from retry import RETRYABLE_STATUSES, RetryPolicy
+from steps import run_steps
+from telemetry import span
+from video_prep import DEFAULT_SAMPLING, compress_video_for_upload
+from workspace import get_workspaces
+
+DEFAULT_API_BASE = "https://api.worldlabs.ai/marble/v1"
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+
+# Allowed extensions per kind (World Labs recommended formats)
+VIDEO_EXTENSIONS = {"mp4", "mov", "mkv"}
+IMAGE_EXTENSIONS = {"jpg", "jpeg", "png", "webp"}
+MAX_VIDEO_UPLOAD_MB = 10
+MAX_VIDEO_UPLOAD_FRAMES = 1800
+# Generation modes: which variants (fast draft model, default full-quality model) to generate.
+# draft-then-full starts both from the same upload; the draft is ready in a fraction of the time.
+DRAFT_MODEL = "Marble 0.1-mini"
+MODE_VARIANTS = {"draft": ("draft",), "full": ("full",), "draft-then-full": ("draft", "full")}
+GENERATION_MODES = tuple(MODE_VARIANTS)
+DEFAULT_MODE = "full"
+# worlds:generate "model" per variant; None leaves the API's default (full-quality) model.
+VARIANT_MODELS = {"draft": DRAFT_MODEL, "full": None}
+# worlds:generate retries while a fresh upload is not yet visible ("has not been uploaded yet").
+UPLOAD_VISIBILITY_RETRY = RetryPolicy(max_attempts=7, base_s=2.0, max_s=12.0, budget_s=60.0)
+# worlds:generate error text meaning the media asset is gone (expired, deleted, never uploaded).
+MEDIA_REJECTED_MARKERS = ("not found", "expired", "deleted", "has not been uploaded yet")
+# How many media asset ids served from the media cache each client remembers, for re-uploading.
+REUSED_MEDIA_REMEMBERED = 1024
+
+_env_loaded = False
+_env_lock = threading.Lock()
+
+
+def load_env():
+    """Load .env into os.environ once (variables that are already set win)."""
+    global _env_loaded
+    with _env_lock:
+        if not _env_loaded:
+            from dotenv import load_dotenv
+
+            load_dotenv()
+            _env_loaded = True
+
+
+@functools.lru_cache(maxsize=None)
+def load_prompt(name: str) -> str:
+    """Built-in prompt prompts/<name>.txt: "world" (default text prompt) or "video" (default video guidance)."""
+    with open(os.path.join(PROMPTS_DIR, name + ".txt"), encoding="utf-8") as f:
+        return f.read().strip()
+
+
+class WorldClient:
+    """World Labs generation pipeline with its own configuration, connections and caches."""
+
+    def __init__(self, api_key: Optional[str] = None, api_base: Optional[str] = None):
+        """api_key and api_base default to WORLD_LABS_API_KEY / WORLD_LABS_API_BASE, read when first needed."""
+        self._api_key = api_key
+        self._api_base = api_base
+        self._lock = threading.RLock()
+        self._api = None
+        self._uploader = None
+        self._downloader = None
+        self._poller = None
+        self._media_cache = None
+        self._media_cache_loaded = False
+        self._asset_cache = None
+        self._asset_cache_loaded = False
+        # media_asset_id served from the media cache -> (cache key, upload_media_file kwargs)
+        self._reused_media = collections.OrderedDict()
+
+    @property
+    def api_base(self) -> str:
+        with self._lock:
+            if self._api_base is None:
+                load_env()
+                self._api_base = os.environ.get("WORLD_LABS_API_BASE", DEFAULT_API_BASE)
+            return self._api_base
+
+    @property
+    def api_key(self) -> str:
+        with self._lock:
+            if self._api_key is None:
+                load_env()
+                self._api_key = os.environ.get("WORLD_LABS_API_KEY")
+                if not self._api_key:
+                    raise RuntimeError(
+                        "WORLD_LABS_API_KEY is not set. Set it in your environment or in a .env file "
+                        "(add .env to .gitignore)."
+                    )
+            return self._api_key
+
+    @property
+    def api(self):
+        """api_client.ApiClient for this client's key and API root."""
+        with self._lock:
+            if self._api is None:
+                from api_client import ApiClient
+
+                self._api = ApiClient.from_env(self.api_base, self.api_key)
+            return self._api
+
+    @property
+    def uploader(self):
+        """uploader.SignedUploader; signed PUTs reuse the API client's connection pool."""
+        with self._lock:
+            if self._uploader is None:
+                from uploader import SignedUploader
+
+                self._uploader = SignedUploader(session=self.api.session)
+            return self._uploader
+
+    @property
+    def downloader(self):
+        """downloader.AssetDownloader; range requests reuse the API client's connection pool."""
+        with self._lock:
+            if self._downloader is None:
+                from downloader import AssetDownloader
+
+                self._downloader = AssetDownloader.from_env(session=self.api.session)
+            return self._downloader
+
+    @property
+    def poller(self) -> OperationPoller:
+        """Operation poller: one thread tracks every outstanding operation of this client."""
+        with self._lock:
+            if self._poller is None:
+                self._poller = OperationPoller(self.fetch_operation)
+            return self._poller
+
+    @property
+    def media_cache(self):
+        """Media asset cache (None when disabled via WORLD_MEDIA_CACHE=0)."""
+        with self._lock:
+            if not self._media_cache_loaded:
+                self._media_cache = default_cache()
+                self._media_cache_loaded = True
+            return self._media_cache
+
+    @property
+    def asset_cache(self):
+        """Cache of downloaded world assets (None when disabled via WORLD_ASSET_CACHE=0)."""
+        with self._lock:
+            if not self._asset_cache_loaded:
+                from asset_cache import default_asset_cache
+
+                self._asset_cache = default_asset_cache()
+                self._asset_cache_loaded = True
+            return self._asset_cache
+
+    def upload_params(self, kind: str, compress: bool = True, sampling: str = DEFAULT_SAMPLING) -> dict:
+        """Everything besides the file content that changes what gets uploaded for this kind.
+
+        Media assets belong to an account, so the key's hash is included: two keys never share ids.
+        """
+        params = {"api_base": self.api_base, "account": hashlib.sha256(self.api_key.encode("utf-8")).hexdigest()[:16]}
+        if kind == "video" and not compress:
+            params["precompressed"] = True
+        elif kind == "video":
+            params["max_video_upload_mb"] = MAX_VIDEO_UPLOAD_MB
+            params["max_video_upload_frames"] = MAX_VIDEO_UPLOAD_FRAMES
+            params["sampling"] = sampling
+        elif kind == "image" and compress:
+            from image_prep import settings_from_env as image_settings
+
+            params["image"] = image_settings()
+        return params
+
+    def upload_media_file(
+        self,
+        file_path: str,
+        kind: str,
+        use_cache: bool = True,
+        compress: bool = True,
+        sampling: str = DEFAULT_SAMPLING,
+        on_stage: Optional[Callable] = None,
+        workspace=None,
+    ) -> str:
+        """1) Prepare upload (POST). 2) Upload file (PUT to signed URL with required_headers). Returns media_asset id.
+
+        Identical source files (same content hash and upload params) reuse the cached media_asset id
+        and skip compression and upload; if worlds:generate then rejects that id, start_world_generation
+        drops it from the cache and uploads the file again. Images are downscaled and re-encoded first (see
+        image_prep.py). Compressed outputs live in a workspace of this call (see workspace.py)
+        and are deleted once uploaded; a caller whose workspace already reserves room for them
+        (the server's ingest workspace) passes it as workspace, and they are written there
+        instead of waiting on the quota for a second reservation. Pass compress=False for media
+        that were already prepared (e.g. videos from the server's streaming ingest). sampling
+        selects which video frames are kept when the clip has more than MAX_VIDEO_UPLOAD_FRAMES
+        (see video_prep.sampling_filter). on_stage(stage, **detail), if given, is told when
+        compression and upload start (the "uploading" event carries the media_asset_id).
+        """
+        path = check_media_path(file_path, kind)
+        file_name = os.path.basename(path)
+
+        cache = self.media_cache if use_cache else None
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.key_for(path, kind, self.upload_params(kind, compress, sampling))
+            cached_id = self.reuse_cached_media(
+                cache_key, path, dict(file_path=path, kind=kind, compress=compress, sampling=sampling)
+            )
+            if cached_id:
+                if on_stage:
+                    on_stage("uploading", cached=True, media_asset_id=cached_id)
+                return cached_id
+
+        if not compress:
+            return self._upload_file(path, kind, cache, cache_key, on_stage)
+        # Outputs go in a private workspace, so concurrent runs on the same source cannot clobber
+        # each other's; closing it removes them (and anything a failed encode left behind).
+        stem = os.path.splitext(file_name)[0]
+        if workspace is not None:
+            scratch = nullcontext(workspace)
+        else:
+            reserve = MAX_VIDEO_UPLOAD_MB * 1024 * 1024 if kind == "video" else os.path.getsize(path)
+            scratch = get_workspaces().create("upload", reserve_bytes=reserve, wait=True)
+        with scratch as workspace:
+            if on_stage:
+                on_stage("compressing")
+            if kind == "video":
+                path = compress_video_for_upload(
+                    path,
+                    max_size_mb=MAX_VIDEO_UPLOAD_MB,
+                    max_frames=MAX_VIDEO_UPLOAD_FRAMES,
+                    sampling=sampling,
+                    output_path=workspace.file(stem + ".upload.mp4"),
+                )
+            else:
+                from image_prep import IMAGE_FORMATS, prepare_image_for_upload
+                from image_prep import settings_from_env as image_settings
+
+                settings = image_settings()
+                path = prepare_image_for_upload(
+                    path, output_path=workspace.file(stem + ".upload" + IMAGE_FORMATS[settings["fmt"]][1]), **settings
+                )
+            return self._upload_file(path, kind, cache, cache_key, on_stage)
+
+    def _upload_file(self, path: str, kind: str, cache, cache_key, on_stage) -> str:
+        """prepare_upload + signed PUT of a ready file; records the media_asset id in the cache."""
+
+        def execute(step):
+            if step[0] == "prepare_upload":
+                prep = self.api.post("/media-assets:prepare_upload", json=step[1], span_name="prepare_upload")
+                prep.raise_for_status()
+                return prep.json()
+            if step[0] == "stage":
+                if on_stage:
+                    on_stage(step[1], **step[2])
+                return None
+            return self.uploader.upload(*step[1:])
+
+        media_asset_id = run_steps(upload_steps(path, kind), execute)
+        if cache is not None:
+            cache.put(cache_key, media_asset_id)
+        return media_asset_id
+
+    def reuse_cached_media(self, cache_key: str, path: str, upload: Optional[dict] = None) -> Optional[str]:
+        """The media cache's id for cache_key, remembered as reused (see remember_reused_media), or None."""
+        cached_id = self.media_cache.get(cache_key)
+        if cached_id:
+            print("Reusing cached media asset %s for %s" % (cached_id, os.path.basename(path)))
+            self.remember_reused_media(cached_id, cache_key, upload)
+        return cached_id
+
+    def remember_reused_media(self, media_asset_id: str, cache_key: str, upload: Optional[dict] = None):
+        """Record that media_asset_id came from the media cache under cache_key.
+
+        upload holds the upload_media_file arguments that produce it again (None: the caller re-uploads).
+        """
+        with self._lock:
+            self._reused_media[media_asset_id] = (cache_key, upload)
+            while len(self._reused_media) > REUSED_MEDIA_REMEMBERED:
+                self._reused_media.popitem(last=False)
+
+    def forget_rejected_media(self, media_asset_id: str):
+        """(cache_key, upload) for a cached media_asset_id the API rejected, after removing it from the cache.
+
+        None if the id did not come from the media cache (a fresh upload that was rejected).
+        """
+        with self._lock:
+            reused = self._reused_media.pop(media_asset_id, None)
+        if reused is not None and self.media_cache is not None:
+            self.media_cache.invalidate(reused[0])
+        return reused
+
+    def is_reused_media(self, media_asset_id: Optional[str]) -> bool:
+        with self._lock:
+            return media_asset_id in self._reused_media
+
+    def prefetch_image(self, file_path: str):
+        """Start preparing an image upload in worker processes, unless the media cache already has it.
+
+        A later upload_media_file of the same image waits for that work instead of redoing it.
+        """
+        from image_prep import prefetch
+        from image_prep import settings_from_env as image_settings
+
+        path = os.path.abspath(file_path)
+        cache = self.media_cache
+        if cache is not None and cache.get(cache.key_for(path, "image", self.upload_params("image"))):
+            return
+        prefetch(path, **image_settings())
+
+    def prepare_world_prompt(
+        self,
+        input_type: str,
+        file_path: Optional[str],
+        text_prompt: Optional[str],
+        compress: bool = True,
+        sampling: str = DEFAULT_SAMPLING,
+        on_stage: Optional[Callable] = None,
+        workspace=None,
+    ):
+        """Upload any media and build the world_prompt. Returns (world_prompt, using_default_video_prompt).
+
+        workspace, if given, holds the compressed media (see upload_media_file).
+        """
+        using_default_video_prompt = False
+
+        if input_type == "text":
+            world_prompt = {"type": "text", "text_prompt": (text_prompt or load_prompt("world")).strip()}
+        elif input_type == "video":
+            if not file_path:
+                raise ValueError("--file is required for video input")
+            media_asset_id = self.upload_media_file(
+                file_path, "video", compress=compress, sampling=sampling, on_stage=on_stage, workspace=workspace
+            )
+            world_prompt, using_default_video_prompt = video_world_prompt(media_asset_id, text_prompt)
+        elif input_type == "image":
+            if not file_path:
+                raise ValueError("--file is required for image input")
+            media_asset_id = self.upload_media_file(
+                file_path, "image", compress=compress, on_stage=on_stage, workspace=workspace
+            )
+            world_prompt = {
+                "type": "image",
+                "image_prompt": {"source": "media_asset", "media_asset_id": media_asset_id},
+            }
+            if text_prompt:
+                world_prompt["text_prompt"] = text_prompt.strip()
+        else:
+            raise ValueError("input_type must be text, video, or image")
+
+        return world_prompt, using_default_video_prompt
+
+    def start_world_generation(
+        self,
+        display_name: str,
+        world_prompt: dict,
+        using_default_video_prompt: bool = False,
+        on_stage: Optional[Callable] = None,
+        model: Optional[str] = None,
+        workspace=None,
+    ) -> str:
+        """POST worlds:generate (with the existing fallbacks) and return the operation id.
+
+        model picks a non-default World Labs model (e.g. DRAFT_MODEL). When the API rejects a media
+        asset id that came from the media cache, the file is uploaded again (once) and world_prompt
+        is updated in place to the new id, so later variants of the same request use it too; that
+        upload compresses into workspace, if given (see upload_media_file).
+        """
+        try:
+            return self._start_world_generation(display_name, world_prompt, using_default_video_prompt, on_stage, model)
+        except MediaAssetRejected as exc:
+            reused = self.forget_rejected_media(exc.media_asset_id)
+            if reused is None or reused[1] is None:
+                raise
+            print("Cached media asset %s was rejected (%s); uploading it again..." % (exc.media_asset_id, exc))
+            media_asset_id = self.upload_media_file(on_stage=on_stage, workspace=workspace, **reused[1])
+            set_media_asset_id(world_prompt, media_asset_id)
+            return self._start_world_generation(display_name, world_prompt, using_default_video_prompt, on_stage, model)
+
+    def _start_world_generation(self, display_name, world_prompt, using_default_video_prompt, on_stage, model) -> str:
+        if on_stage:
+            on_stage("generating")
+        cached_media = self.is_reused_media(media_asset_of(world_prompt))
+        steps = generation_steps(display_name, world_prompt, using_default_video_prompt, model, cached_media)
+        return run_steps(steps, self._run_generation_step)
+
+    def _run_generation_step(self, step):
+        if step[0] == "sleep":
+            time.sleep(step[1])
+            return None
+        r = generate_request(self.api, step[1], step[2])
+        return r.status_code, r.text or r.reason, r.json() if r.ok else None
+
+    def create_world(
+        self,
+        input_type: str,
+        file_path: Optional[str],
+        display_name: str,
+        text_prompt: Optional[str],
+        compress: bool = True,
+        sampling: str = DEFAULT_SAMPLING,
+        on_stage: Optional[Callable] = None,
+        workspace=None,
+    ) -> str:
+        """Upload media (if any) and start generation; returns the operation id.
+
+        on_stage(stage, **detail) is called as the job moves through compressing, uploading and
+        generating. workspace, if given, holds the compressed media (see upload_media_file).
+        """
+        world_prompt, using_default_video_prompt = self.prepare_world_prompt(
+            input_type,
+            file_path,
+            text_prompt,
+            compress=compress,
+            sampling=sampling,
+            on_stage=on_stage,
+            workspace=workspace,
+        )
+        return self.start_world_generation(
+            display_name, world_prompt, using_default_video_prompt, on_stage=on_stage, workspace=workspace
+        )
+
+    def create_world_variants(
+        self,
+        input_type: str,
+        file_path: Optional[str],
+        display_name: str,
+        text_prompt: Optional[str],
+        mode: str = DEFAULT_MODE,
+        compress: bool = True,
+        sampling: str = DEFAULT_SAMPLING,
+        on_stage: Optional[Callable] = None,
+        workspace=None,
+    ) -> dict:
+        """create_world for a generation mode: uploads once, then starts one generation per variant.
+
+        Returns {variant: operation_id} in MODE_VARIANTS order ("draft" before "full").
+        """
+        if mode not in MODE_VARIANTS:
+            raise ValueError("mode must be one of %s" % ", ".join(GENERATION_MODES))
+        world_prompt, using_default_video_prompt = self.prepare_world_prompt(
+            input_type,
+            file_path,
+            text_prompt,
+            compress=compress,
+            sampling=sampling,
+            on_stage=on_stage,
+            workspace=workspace,
+        )
+        return {
+            variant: self.start_world_generation(
+                display_name,
+                world_prompt,
+                using_default_video_prompt,
+                on_stage=on_stage,
+                model=VARIANT_MODELS[variant],
+                workspace=workspace,
+            )
+            for variant in MODE_VARIANTS[mode]
+        }
+
+    def cache_world_assets(self, world: dict) -> dict:
+        """Download a described world's assets into the local asset cache; returns {name: cache entry}.
+
+        Assets already cached for this world are not fetched again. An asset that fails to download
+        is left out (its remote URL still works); nothing is downloaded when the cache is disabled.
+        """
+        cache = self.asset_cache
+        if cache is None:
+            return {}
+        entries = {}
+        for name, url in (world.get("assets") or {}).items():
+            try:
+                entries[name] = cache.fetch("%s/%s" % (world["world_id"], name), url, self.downloader)
+            except (RuntimeError, OSError) as exc:
+                print("Could not download %s of world %s: %s" % (name, world["world_id"], exc))
+        return entries
+
+    def fetch_operation(self, operation_id: str) -> dict:
+        r = self.api.get(f"/operations/{operation_id}", span_name="poll")
+        r.raise_for_status()
+        return r.json()
+
+    def poll_until_done(self, operation_id: str, interval: float = 15) -> dict:
+        """Block until the operation is done; interval caps the poll backoff (polls start faster)."""
+        return self.poller.submit(operation_id, on_progress=print_progress, max_interval=interval).result()
+
+
+def check_media_path(file_path: str, kind: str) -> str:
+    """Absolute path of an existing file with an extension the API accepts for kind."""
+    path = os.path.abspath(file_path)
+    if not os.path.isfile(path):
+        raise FileNotFoundError("File not found: %s" % path)
+    ext = (os.path.splitext(path)[1] or "").lstrip(".").lower()
+    if kind == "video" and ext not in VIDEO_EXTENSIONS:
+        raise ValueError("Video extension must be one of %s" % VIDEO_EXTENSIONS)
+    if kind == "image" and ext not in IMAGE_EXTENSIONS:
+        raise ValueError("Image extension must be one of %s" % IMAGE_EXTENSIONS)
+    return path
+
+
+def upload_steps(path: str, kind: str):
+    """prepare_upload and the signed PUT of a ready file, as a step generator (see steps.py).
+
+    Shared with async_world.upload_video. Yields:
+      ("prepare_upload", body)                                     -> the response JSON
+      ("stage", "uploading", detail)                               -> on_stage("uploading", **detail)
+      ("put", path, upload_url, required_headers, content_type)    -> SignedUploader.upload
+    and returns the media_asset id.
+    """
+    file_name = os.path.basename(path)
+    ext = (os.path.splitext(file_name)[1] or "").lstrip(".").lower()
+
+    # 1) Prepare upload
+    print("Preparing upload for %s..." % file_name)
+    data = yield ("prepare_upload", {"file_name": file_name, "kind": kind, "extension": ext or "bin"})
+    media_asset_id, upload_url, required_headers = parse_prepared_upload(data)
+    file_size = os.path.getsize(path)
+    check_upload_size(file_size, required_headers)
+
+    # 2) Upload file: streamed PUT to the signed URL (resumable when the URL supports it),
+    # falling back to an explicit Content-Type for strict storage backends.
+    print("Uploading %s..." % file_name)
+    yield ("stage", "uploading", {"bytes": file_size, "media_asset_id": media_asset_id})
+    yield ("put", path, upload_url, required_headers, mimetypes.guess_type(path)[0])
+    return media_asset_id
+
+
+def parse_prepared_upload(data: dict):
+    """(media_asset_id, upload_url, required_headers) from a prepare_upload response body."""
+    media_asset = data["media_asset"]
+    media_asset_id = media_asset.get("id") or media_asset.get("media_asset_id")
+    if not media_asset_id:
+        raise KeyError("media_asset id not found in response: %s" % media_asset)
+    upload_info = data["upload_info"]
+    return media_asset_id, upload_info["upload_url"], upload_info.get("required_headers") or {}
+
+
+def check_upload_size(file_size: int, required_headers: dict):
+    """Preflight size check from signed upload policy, if provided."""
+    size_range = required_headers.get("x-goog-content-length-range")
+    if size_range:
+        try:
+            lo_str, hi_str = size_range.split(",", 1)
+            min_size = int(lo_str.strip())
+            max_size = int(hi_str.strip())
+            if not (min_size <= file_size <= max_size):
+                raise RuntimeError(
+                    "File too large for signed upload policy: file=%d bytes (%.2f MB), "
+                    "allowed=%d-%d bytes (max %.2f MB). "
+                    "Use a smaller/compressed video and retry."
+                    % (
+                        file_size,
+                        file_size / (1024 * 1024),
+                        min_size,
+                        max_size,
+                        max_size / (1024 * 1024),
+                    )
+                )
+        except ValueError:
+            # If parsing fails, continue and let server validate.
+            pass
+
+
+class MediaAssetRejected(RuntimeError):
+    """worlds:generate does not know the world_prompt's media asset (expired, deleted or never uploaded)."""
+
+    def __init__(self, message: str, media_asset_id: str):
+        super().__init__(message)
+        self.media_asset_id = media_asset_id
+
+
+def media_asset_of(world_prompt: dict) -> Optional[str]:
+    """The media_asset_id a video or image world_prompt refers to, or None."""
+    source = world_prompt.get("video_prompt") or world_prompt.get("image_prompt") or {}
+    return source.get("media_asset_id")
+
+
+def set_media_asset_id(world_prompt: dict, media_asset_id: str):
+    (world_prompt.get("video_prompt") or world_prompt["image_prompt"])["media_asset_id"] = media_asset_id
+
+
+def generate_error(status_code: int, text: str, world_prompt: dict) -> RuntimeError:
+    """Exception for a failed worlds:generate: MediaAssetRejected when the media asset is unknown."""
+    message = "worlds:generate failed (%s): %s" % (status_code, (text or "").strip())
+    media_asset_id = media_asset_of(world_prompt)
+    if media_asset_id and (status_code in (404, 410) or any(m in (text or "").lower() for m in MEDIA_REJECTED_MARKERS)):
+        return MediaAssetRejected(message, media_asset_id)
+    return RuntimeError(message)
+
+
+def video_world_prompt(media_asset_id: str, text_prompt: Optional[str]):
+    """world_prompt for an uploaded video. Returns (world_prompt, using_default_video_prompt)."""
+    world_prompt = {
+        "type": "video",
+        "video_prompt": {"source": "media_asset", "media_asset_id": media_asset_id},
+    }
+    # Use the built-in video prompt by default; override with --prompt if provided
+    world_prompt["text_prompt"] = (text_prompt or load_prompt("video")).strip()
+    return world_prompt, text_prompt is None
+
+
+class GenerateFallbacks:
+    """The worlds:generate payload plus its request-specific fallbacks after a failed response.
+
+    Transient 429/5xx responses are already retried by the client (see retry.py); this covers
+    a fresh upload that is not visible yet and a default video prompt the API rejects.
+    """
+
+    def __init__(
+        self,
+        display_name: str,
+        world_prompt: dict,
+        using_default_video_prompt: bool = False,
+        model: Optional[str] = None,
+        cached_media: bool = False,
+    ):
+        """cached_media: the media asset id came from the media cache, so it is not waited for."""
+        self.display_name = display_name
+        self.cached_media = cached_media
+        self.input_type = world_prompt["type"]
+        self.using_default_video_prompt = using_default_video_prompt
+        self.model = model
+        self.payload = {
+            "display_name": display_name,
+            "world_prompt": world_prompt,
+            "permission": {"public": True},  # world is publicly viewable
+        }
+        if model:
+            self.payload["model"] = model
+        self._dropped_text_prompt = False
+        self._not_ready_attempts = 0
+        self._started_at = time.monotonic()
+
+    def after_failure(self, status_code: int, text: str) -> Optional[float]:
+        """Seconds to wait before resending self.payload, or None to give up."""
+        if self.input_type in ("video", "image") and "has not been uploaded yet" in (text or ""):
+            if self.cached_media:
+                # An old upload that is not there any more will not appear; the caller re-uploads.
+                return None
+            # Upload can take a short moment to become visible to world generation.
+            self._not_ready_attempts += 1
+            wait_s = UPLOAD_VISIBILITY_RETRY.next_delay(self._not_ready_attempts, self._started_at)
+            if wait_s is not None:
+                print(
+                    "Media asset not ready yet. Retrying worlds:generate in %.1fs (attempt %d/%d)..."
+                    % (wait_s, self._not_ready_attempts, UPLOAD_VISIBILITY_RETRY.max_attempts - 1)
+                )
+            return wait_s
+        if (
+            self.input_type == "video"
+            and self.using_default_video_prompt
+            and not self._dropped_text_prompt
+            and 400 <= status_code < 500
+            and status_code not in RETRYABLE_STATUSES
+        ):
+            # If default video prompt is too long/strict for API validation, retry without text_prompt.
+            print("World generation failed with default video prompt. Retrying without text_prompt...")
+            self._dropped_text_prompt = True
+            self.payload = {
+                "display_name": self.display_name,
+                "world_prompt": {
+                    "type": "video",
+                    "video_prompt": self.payload["world_prompt"]["video_prompt"],
+                },
+                "permission": {"public": True},
+            }
+            if self.model:
+                self.payload["model"] = self.model
+            return 0.0
+        return None
+
+
+def operation_id_of(op: dict) -> str:
+    operation_id = op.get("operation_id")
+    if not operation_id:
+        raise RuntimeError("No operation_id in response: %s" % op)
+    print("Operation ID:", operation_id)
+    return operation_id
+
+
+def generation_steps(display_name, world_prompt, using_default_video_prompt, model, cached_media):
+    """worlds:generate with GenerateFallbacks, as a step generator (see steps.py).
+
+    Shared with async_world.start_world_generation. Yields:
+      ("generate", payload, attrs)   -> (status_code, text, body): generate_request's response,
+                                        body being its JSON when it succeeded, else None
+      ("sleep", seconds)             -> wait before the next attempt
+    and returns the operation id; raises generate_error when the fallbacks run out.
+    """
+    fallbacks = GenerateFallbacks(display_name, world_prompt, using_default_video_prompt, model, cached_media)
+
+    print("Starting world generation%s..." % (" (%s)" % model if model else ""))
+    with span("generate", attempts=0) as attrs:
+        status_code, text, body = yield ("generate", fallbacks.payload, attrs)
+        while body is None:
+            wait_s = fallbacks.after_failure(status_code, text)
+            if wait_s is None:
+                break
+            if wait_s:
+                yield ("sleep", wait_s)
+            status_code, text, body = yield ("generate", fallbacks.payload, attrs)
+        attrs["status"] = status_code
+
+    if body is None:
+        raise generate_error(status_code, text, world_prompt)
+    return operation_id_of(body)
+
+
+def generate_request(api, payload: dict, attrs: dict):
+    """One POST worlds:generate; counts it in the enclosing "generate" span's attempts."""
+    attrs["attempts"] += 1
+    return api.post("/worlds:generate", json=payload, span_name="generate_request")
+
+
+def describe_world(operation_id: str, result: dict) -> dict:
+    """World id, viewer URLs and asset download URLs ({name: url}) from a finished operation."""
+    from downloader import asset_urls
+
+    response = result.get("response") or {}
+    world_id = response.get("id") or (result.get("metadata") or {}).get("world_id")
+    marble_url = response.get("world_marble_url") or f"https://marble.worldlabs.ai/world/{world_id}"
+    return {
+        "operation_id": operation_id,
+        "world_id": world_id,
+        "marble_url": marble_url,
+        "worldvr_url": marble_url.replace("/world/", "/worldvr/"),
+        "assets": asset_urls(result),
+    }
+
+
+def print_progress(operation_id: str, progress: str, op: dict):
+    print("[%s] %s" % (time.strftime("%H:%M:%S"), progress or "Waiting..."))
+
+
+_default = None
+_default_pid = None
+_default_lock = threading.Lock()
+
+
+def default_client() -> WorldClient:
+    """Process-wide client configured from the environment (and .env).
+
+    A forked process gets a new one on first use: the parent's poller thread and
+    connection pool do not carry over into the child.
+    """
+    global _default, _default_pid
+    with _default_lock:
+        if _default is None or _default_pid != os.getpid():
+            load_env()
+            _default = WorldClient()
+            _default_pid = os.getpid()
+        return _default
+
+
+# The pipeline as module functions on default_client(), as used by the CLI, batch.py and the servers.
+
+
+def get_client():
+    return default_client().api
+
+
+def get_uploader():
+    return default_client().uploader
+
+
+def get_downloader():
+    return default_client().downloader
+
+
+def get_poller() -> OperationPoller:
+    return default_client().poller
+
+
+def get_media_cache():
+    return default_client().media_cache
+
+
+def get_asset_cache():
+    return default_client().asset_cache
+
+
+def upload_params(kind: str, compress: bool = True, sampling: str = DEFAULT_SAMPLING) -> dict:
+    return default_client().upload_params(kind, compress, sampling)
+
+
+def upload_media_file(file_path: str, kind: str, *args, **kwargs) -> str:
+    return default_client().upload_media_file(file_path, kind, *args, **kwargs)
+
+
+def prefetch_image(file_path: str):
+    default_client().prefetch_image(file_path)
+
+
+def prepare_world_prompt(input_type: str, file_path: Optional[str], text_prompt: Optional[str], *args, **kwargs):
+    return default_client().prepare_world_prompt(input_type, file_path, text_prompt, *args, **kwargs)
+
+
+def start_world_generation(display_name: str, world_prompt: dict, *args, **kwargs) -> str:
+    return default_client().start_world_generation(display_name, world_prompt, *args, **kwargs)
+
+
+def create_world(
+    input_type: str, file_path: Optional[str], display_name: str, text_prompt: Optional[str], *args, **kwargs
+) -> str:
+    return default_client().create_world(input_type, file_path, display_name, text_prompt, *args, **kwargs)
+
+
+def create_world_variants(
+    input_type: str, file_path: Optional[str], display_name: str, text_prompt: Optional[str], *args, **kwargs
+) -> dict:
+    return default_client().create_world_variants(input_type, file_path, display_name, text_prompt, *args, **kwargs)
+
+
+def cache_world_assets(world: dict) -> dict:
+    return default_client().cache_world_assets(world)
+
+
+def fetch_operation(operation_id: str) -> dict:
+    return default_client().fetch_operation(operation_id)
+
+
+def poll_until_done(operation_id: str, interval: float = 15) -> dict:
+    return default_client().poll_until_done(operation_id, interval)
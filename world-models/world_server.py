@@ -6,80 +6,549 @@ POST /generate-worldvr (multipart/form-data):
   - video: required file field
   - prompt: optional text prompt
   - name: optional world display name (default: "Generated World")
+  - sampling: optional frame sampling for long clips: uniform (default), head, fps, motion
+  - mode: optional generation mode: full (default), draft (fast Marble 0.1-mini preview)
+    or draft-then-full (both from one upload; the draft is published as soon as it is
+    ready, under "draft" and a "draft_ready" event, and the full world becomes the result)
 
-Response JSON:
+Set WORLD_SERVER_INGEST=stream to pipe the upload into ffmpeg while it arrives
+(fast-start MP4/MOV only; pass sampling as a query parameter in this mode);
+when every encode slot is busy the upload is spooled and compressed by the job
+instead, so the body is never left unread. Bodies over
+WORLD_SERVER_MAX_UPLOAD_MB get a 413.
+
+Headers:
+  - Idempotency-Key: optional; a repeat with the same key returns the original job
+    (422 if the key was used for a different video/prompt/name/sampling)
+  - X-Api-Key / Authorization / X-Client-Id: optional; identifies the client for
+    fair scheduling (default: remote address)
+  - X-Priority: optional priority class: high, normal (default), low
+
+Admission control (see admission.py): when the server already has
+WORLD_ADMISSION_MAX_JOBS unfinished jobs it answers 503, and when this client
+has WORLD_ADMISSION_MAX_PER_CLIENT of them it answers 429. Both come with
+Retry-After and {"error", "queue_position", "retry_after_s"}. Admitted jobs wait
+for per-stage slots (encode, upload, generate, download) while in stage "queued".
+
+Returns 503 with Retry-After, without reading the upload, while the World Labs
+API circuit breaker is open (see retry.py), or when the upload would not fit in
+the WORLD_WORKSPACE_QUOTA_MB scratch-space quota (shared by all workers using
+the same workspace root). Each request's upload and
+compressed output live in a workspace of its own (see workspace.py), deleted
+when the job no longer needs them; on startup the server reclaims workspaces
+left by processes that crashed.
+
+Returns 202 immediately; generation continues in the background:
+  {
+    "job_id": "...",
+    "status": "queued",
+    "status_url": "/jobs/<job_id>",
+    "events_url": "/generate-worldvr/<job_id>/events",
+    "queue_position": 3              # admitted jobs in the pipeline, this one included
+  }
+An identical request (same video content, prompt, name and sampling) attaches to
+the existing job instead of paying for a new generation: 200 with its result if
+it is done, 202 if still running; either way with "deduplicated": true.
+
+Jobs are persisted (see job_store.py) and leased to the worker process running
+them. init_app() (run by __main__, or by the first request; importing the
+module does no work) builds the registry and starts a thread that resumes
+polling every unfinished job whose owner has stopped and that already had an
+operation_id (or its asset downloads, if it was done); jobs that had not got
+that far are failed. Any number of worker processes can share the store:
+each orphaned job is resumed by exactly one of them, and GET /jobs/<id> on
+any worker reports the current state of jobs other workers run.
+
+GET /jobs/<job_id>:
   {
-    "operation_id": "...",
-    "world_id": "...",
-    "marble_url": "https://marble.worldlabs.ai/world/<id>",
-    "worldvr_url": "https://marble.worldlabs.ai/worldvr/<id>"
+    "job_id": "...",
+    "status": "queued" | "running" | "done" | "error",
+    "stage": "receiving" | "queued" | "compressing" | "uploading" | "generating" | "draft_ready"
+             | "done" | "error" | "downloading",   # downloading: assets of a done job
+    "progress": "...",               # latest World Labs progress text while generating
+    "draft": {...},                  # draft-then-full: the draft world (same shape as result)
+    "result": {                      # once status == "done"
+      "operation_id": "...",
+      "world_id": "...",
+      "marble_url": "https://marble.worldlabs.ai/world/<id>",
+      "worldvr_url": "https://marble.worldlabs.ai/worldvr/<id>",
+      "assets": {"splats.spz_urls.full_res": "https://...", ...},   # World Labs asset URLs
+      "local_assets": {                                             # copies in the asset cache, once downloaded
+        "splats.spz_urls.full_res": {"url": "/assets/<sha256>.spz", "sha256": "...", "size": 123}
+      }
+    },
+    "error": "..."                   # once status == "error"
   }
+
+GET /generate-worldvr/<job_id>/events (text/event-stream):
+  Server-Sent Events replaying the job's stage history, then live updates:
+    event: generating
+    data: {"stage": "generating", "detail": {"progress": "..."}, "at": 1700000000.0}
+  The stream ends after the "error" event, or after "done" and, when assets are
+  cached, the "assets" event that follows it. All watchers of a job share one
+  upstream poll of its operation.
+
+Once a world is generated the job is done, and its splat/mesh/panorama assets
+are then downloaded into the local content-addressed asset cache (see
+downloader.py and asset_cache.py; WORLD_ASSET_CACHE=0 turns this off): the
+stage goes to "downloading", and when the downloads are over an "assets" event
+carries the result with local_assets added (or local_assets_error if caching
+failed, the job staying done). The event stream ends after that event.
+
+GET /assets/<sha256><ext>:
+  A cached asset, with Range requests (206) and a strong ETag (the sha256;
+  If-None-Match gets 304), so repeat views and headsets on the LAN load it from
+  this machine instead of the remote storage.
+
+GET /metrics (Prometheus text format):
+  world_span_duration_seconds{span, status} histograms for compress, prepare_upload,
+  upload_attempt, generate_request, generate, poll, download and job (see telemetry.py),
+  world_span_bytes_total{span}, and gauges for active jobs, polled operations,
+  encode slots in use, scratch workspaces and whether the upstream circuit breaker is open.
+
+asgi_server.py serves the same contract from one asyncio process (see world_api.py
+for the shared validation and response shaping).
 """
 
 import os
-import tempfile
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask, Request, Response, abort, jsonify, request, send_file
+
+import world_api
+from admission import AdmissionController, QueueFull
+from encode_scheduler import get_encode_scheduler
+from job_store import dedupe_key_for, default_store
+from jobs import JobRegistry, chain
+from media_cache import file_sha256
+from telemetry import metrics
+from video_prep import DEFAULT_SAMPLING, SAMPLING_STRATEGIES, STREAMING_ENCODE_THREADS, StreamingVideoCompressor
+from workspace import WorkspaceFull, get_workspaces
+from world_client import (
+    DEFAULT_MODE,
+    MAX_VIDEO_UPLOAD_FRAMES,
+    MAX_VIDEO_UPLOAD_MB,
+    MODE_VARIANTS,
+    cache_world_assets,
+    create_world_variants,
+    describe_world,
+    get_asset_cache,
+    get_client,
+    get_poller,
+    load_env,
+    print_progress,
+)
+
+# The settings below, and those read by admission, the job store and the rest, may come from .env.
+load_env()
+
+# "spool": save the upload to a temp file, then compress it in the background job.
+# "stream": pipe the upload into ffmpeg while it is still arriving; only the compressed
+#           output is written to disk. Input must not need seeking (fast-start MP4/MOV).
+INGEST_MODE = os.environ.get("WORLD_SERVER_INGEST", "spool")
+MAX_UPLOAD_MB = int(os.environ.get("WORLD_SERVER_MAX_UPLOAD_MB", "1024"))
+
+
+class IngestRequest(Request):
+    """Request whose uploaded files are written straight into its workspace.
+
+    In spool mode each file part is written once, to the file the job will compress from
+    (no spooled temp file copied by FileStorage.save); in stream mode it is piped into ffmpeg
+    and only the compressed output lands in the workspace (or, with no encode slot free, it is
+    spooled as in spool mode).
+    """
+
+    workspace = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.workspace is None:
+            self.workspace = get_workspaces().create("ingest", ingest_reservation(total_content_length))
+        self.ingest_files = getattr(self, "ingest_files", 0) + 1
+        # Streaming needs an encoder now; rather than leave the body unread while waiting for one,
+        # spool it like spool mode and let the job compress it.
+        slots = get_encode_scheduler().try_acquire(STREAMING_ENCODE_THREADS) if INGEST_MODE == "stream" else 0
+        if not slots:
+            ext = os.path.splitext(filename or "")[1].lower()
+            ext = ext if ext[1:].isalnum() else ""
+            return open(self.workspace.file("upload-%d%s" % (self.ingest_files, ext or ".mp4")), "w+b")
+        output_path = self.workspace.file("upload-%d.mp4" % self.ingest_files)
+        # The file part may arrive before the "sampling" field, so read it from the query string.
+        sampling = self.args.get("sampling", DEFAULT_SAMPLING)
+        if sampling not in SAMPLING_STRATEGIES:
+            sampling = DEFAULT_SAMPLING
+        compressor = StreamingVideoCompressor(
+            output_path, MAX_VIDEO_UPLOAD_MB, MAX_VIDEO_UPLOAD_FRAMES, sampling, slots=slots
+        )
+        if not hasattr(self, "ingest_compressors"):
+            self.ingest_compressors = []
+        self.ingest_compressors.append(compressor)
+        return compressor
 
-from flask import Flask, jsonify, request
 
-from create_world import create_world, poll_until_done
+def ingest_reservation(content_length) -> int:
+    """Workspace bytes to reserve for a request body: the upload plus its compressed output."""
+    return (content_length or MAX_UPLOAD_MB * 1024 * 1024) + MAX_VIDEO_UPLOAD_MB * 1024 * 1024
+
 
 app = Flask(__name__)
+app.request_class = IngestRequest
+# Werkzeug rejects larger bodies with 413 while reading, in both ingest modes.
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_MB * 1024 * 1024
+
+# Pool threads only cover compress + upload + worlds:generate; polling is handed off to the
+# shared operation poller, so many more generations than threads can be in flight.
+MAX_JOBS_IN_FLIGHT = int(os.environ.get("WORLD_SERVER_MAX_JOBS", "256"))
+# Built per process by init_app(), so importing this module opens no store and starts no threads.
+jobs = None
+# Asset downloads run here once a generation finishes, each waiting for a download slot.
+asset_downloads = None
+# Bounded queue plus per-stage concurrency in front of the pipeline (see admission.py).
+admission = None
+
+
+def run_generation(
+    temp_path: str,
+    display_name: str,
+    prompt,
+    compress: bool = True,
+    sampling: str = DEFAULT_SAMPLING,
+    mode: str = DEFAULT_MODE,
+    on_stage=None,
+    workspace=None,
+):
+    # The compressed output goes in the request's workspace, whose ingest reservation covers it.
+    operations = create_world_variants(
+        "video",
+        temp_path,
+        display_name,
+        prompt,
+        mode,
+        compress=compress,
+        sampling=sampling,
+        on_stage=on_stage,
+        workspace=workspace,
+    )
+    # The last variant (full, or the draft in draft mode) is the job's result.
+    operation_id = operations[MODE_VARIANTS[mode][-1]]
+    draft_operation_id = operations["draft"] if "draft" in operations and mode != "draft" else None
+    if on_stage:
+        detail = {"operation_id": operation_id}
+        if draft_operation_id:
+            detail["draft_operation_id"] = draft_operation_id
+        on_stage("generating", **detail)
+    if draft_operation_id:
+        watch_draft(draft_operation_id, on_stage)
+    return watch_operation(operation_id, on_stage)
+
+
+def watch_draft(operation_id: str, on_stage=None):
+    """Poll a draft-then-full draft alongside the full generation; publishes "draft_ready" when done."""
+
+    def done(future):
+        try:
+            draft = describe_world(operation_id, future.result())
+        except Exception as exc:
+            # The full-quality world is still coming; a failed draft only loses the preview.
+            print("Draft generation %s failed: %s" % (operation_id, exc))
+            return
+        if on_stage:
+            on_stage("draft_ready", draft=draft)
+
+    get_poller().submit(operation_id, on_progress=print_progress).add_done_callback(done)
+
+
+def watch_operation(operation_id: str, on_stage=None):
+    """Future for the described world once operation_id finishes, publishing progress meanwhile."""
+
+    def on_progress(operation_id, progress, op):
+        print_progress(operation_id, progress, op)
+        if on_stage:
+            on_stage("generating", operation_id=operation_id, progress=progress)
+
+    operation = get_poller().submit(operation_id, on_progress=on_progress)
+    return chain(operation, lambda result: describe_world(operation_id, result))
+
+
+def asset_follow_up(on_stage=None, on_end=None):
+    """JobRegistry.run follow_up caching a done world's assets; None when the asset cache is off.
+
+    on_end(), if given, is called once the downloads are over.
+    """
+    if get_asset_cache() is None:
+        return None
+    return "assets", lambda world: asset_downloads.submit(download_assets, world, on_stage, on_end)
+
+
+def download_assets(world: dict, on_stage=None, on_end=None) -> dict:
+    """{"local_assets": copies in the asset cache, served under /assets/} for a finished world.
+
+    Any failure is returned as local_assets_error instead: the world itself is already done.
+    """
+    try:
+        if world["assets"] and on_stage:
+            on_stage("downloading", assets=len(world["assets"]))
+        return {"local_assets": world_api.local_assets(cache_world_assets(world))}
+    except Exception as exc:
+        print("Could not cache the assets of world %s: %s" % (world.get("world_id"), exc))
+        return {"local_assets_error": str(exc)}
+    finally:
+        if on_end:
+            on_end()
+
+
+def admitted_publisher(ticket, job):
+    """on_stage that waits for each stage's admission gate, then publishes the stage on job."""
+
+    def on_stage(stage, **detail):
+        ticket.enter(stage, on_wait=lambda gate: jobs.publish(job, "queued", waiting_for=gate))
+        jobs.publish(job, stage, **detail)
+
+    return on_stage
+
+
+def run_admitted(ticket, job, *args, **kwargs):
+    """run_generation through the admission gates; a failed run releases the ticket (see accept_upload)."""
+    try:
+        operation = run_generation(*args, on_stage=admitted_publisher(ticket, job), **kwargs)
+    except BaseException:
+        ticket.finish()
+        raise
+
+    def done(future):
+        # A done world keeps the ticket for its asset downloads, whose follow-up finishes it.
+        if future.exception() is not None or get_asset_cache() is None:
+            ticket.finish()
+
+    operation.add_done_callback(done)
+    return operation
+
+
+def stage_publisher(job):
+    return lambda stage, **detail: jobs.publish(job, stage, **detail)
+
+
+def resume_job(job):
+    """Pick a job back up whose process stopped before it finished (see JobRegistry.start_leases)."""
+    on_stage = stage_publisher(job)
+    if job.finished:
+        # Only its asset downloads were left.
+        print("Resuming asset downloads of job %s" % job.id)
+        follow_up = asset_follow_up(on_stage)
+        if follow_up is None:
+            jobs.finish_follow_up(job)
+        else:
+            jobs.follow(job, follow_up)
+    elif job.operation_id:
+        print("Resuming job %s (operation %s)" % (job.id, job.operation_id))
+        if job.draft_operation_id and job.draft is None:
+            watch_draft(job.draft_operation_id, on_stage=on_stage)
+        jobs.run(job, watch_operation, job.operation_id, on_stage=on_stage, follow_up=asset_follow_up(on_stage))
+    else:
+        # The uploaded video was in the stopped process's workspace; nothing to resume from.
+        jobs.fail(job, "Server restarted before generation started; please resubmit")
+
+
+_init_lock = threading.Lock()
+_initialized_pid = None
+
+
+def init_app():
+    """Per-process startup: build the job registry, asset pool and admission controller, reclaim
+    scratch space of crashed workers and start resuming orphaned jobs.
+
+    Runs once per process (the first request does it if nothing called it before); a process
+    forked after init_app() builds its own on first use, since threads do not survive fork.
+    """
+    global jobs, asset_downloads, admission, _initialized_pid
+    with _init_lock:
+        if _initialized_pid == os.getpid():
+            return
+        jobs = JobRegistry(max_workers=MAX_JOBS_IN_FLIGHT, store=default_store())
+        asset_downloads = ThreadPoolExecutor(max_workers=MAX_JOBS_IN_FLIGHT, thread_name_prefix="world-assets")
+        admission = AdmissionController.from_env()
+        get_workspaces().reap_orphans()
+        jobs.start_leases(resume_job)
+        _initialized_pid = os.getpid()
+
+
+@app.before_request
+def ensure_initialized():
+    init_app()
+
+
+def json_response(shaped):
+    """Flask response for a world_api (body, status, headers) triple."""
+    body, status, headers = shaped
+    return jsonify(body), status, headers
+
+
+@app.teardown_request
+def abort_unused_ingest(exc=None):
+    # Early returns and errors must not leave streaming ffmpeg processes or upload files behind.
+    for compressor in getattr(request, "ingest_compressors", []):
+        if compressor.proc.poll() is None:
+            compressor.abort()
+    if request.workspace is not None:
+        request.close()
+        request.workspace.close()
 
 
 @app.post("/generate-worldvr")
 def generate_worldvr():
+    # Shed load before reading the body while the World Labs API is failing.
+    retry_in = get_client().breaker.retry_in()
+    if retry_in > 0:
+        return json_response(world_api.degraded_response(retry_in))
+
+    client = world_api.client_identity(request.headers, request.remote_addr)
+    try:
+        ticket = admission.admit(client, world_api.priority_of(request.headers))
+    except QueueFull as exc:
+        return json_response(world_api.queue_full_response(exc))
+
+    started = False
+    try:
+        # Claim scratch space before the body is read, so a full disk quota rejects it cheaply.
+        request.workspace = get_workspaces().create("ingest", ingest_reservation(request.content_length))
+    except WorkspaceFull as exc:
+        ticket.finish()
+        return json_response(world_api.workspace_full_response(exc))
+    try:
+        response, started = accept_upload(ticket)
+        return response
+    finally:
+        if not started:
+            ticket.finish()
+
+
+def accept_upload(ticket):
+    """Validate and store the upload, then start (or attach to) a job; returns (response, started)."""
     if "video" not in request.files:
-        return jsonify({"error": "Missing file field: video"}), 400
+        return json_response(world_api.error_response("Missing file field: video", 400)), False
 
     video_file = request.files["video"]
-    if not video_file or not video_file.filename:
-        return jsonify({"error": "No video file provided"}), 400
+    try:
+        world_api.check_video_filename(video_file.filename if video_file else None)
+        params = world_api.generate_params(request.headers, request.form, request.args)
+    except world_api.BadRequest as exc:
+        return json_response(world_api.error_response(str(exc), exc.status)), False
+    prompt, display_name, sampling, mode = params["prompt"], params["name"], params["sampling"], params["mode"]
 
-    ext = os.path.splitext(video_file.filename)[1] or ".mp4"
-    prompt = request.form.get("prompt")
-    display_name = request.form.get("name", "Generated World")
+    if isinstance(video_file.stream, StreamingVideoCompressor):
+        # Streaming ingest: ffmpeg has been encoding while the body arrived.
+        for compressor in request.ingest_compressors:
+            if compressor is not video_file.stream:
+                compressor.abort()
+        try:
+            temp_path = video_file.stream.finish()
+        except Exception as exc:
+            video_file.stream.abort()
+            return (jsonify({"error": str(exc)}), 422), False
+        compress = False
+        input_sha256 = video_file.stream.input_sha256
+    else:
+        # Already on disk in the request's workspace (see IngestRequest); nothing to copy.
+        temp_path = video_file.stream.name
+        video_file.stream.close()
+        compress = True
+        input_sha256 = file_sha256(temp_path)
 
-    temp_path = None
-    compressed_path = None
-    try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            temp_path = tmp.name
-            video_file.save(temp_path)
-
-        operation_id = create_world("video", temp_path, display_name, prompt)
-        result = poll_until_done(operation_id)
-
-        response = result.get("response") or {}
-        world_id = response.get("id") or (result.get("metadata") or {}).get("world_id")
-        marble_url = response.get("world_marble_url") or f"https://marble.worldlabs.ai/world/{world_id}"
-        worldvr_url = marble_url.replace("/world/", "/worldvr/")
-
-        return jsonify(
-            {
-                "operation_id": operation_id,
-                "world_id": world_id,
-                "marble_url": marble_url,
-                "worldvr_url": worldvr_url,
-            }
-        )
-    except Exception as exc:
-        return jsonify({"error": str(exc)}), 500
-    finally:
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-            except OSError:
-                pass
-
-        # create_world.py compresses to "<input>.upload.mp4" for videos.
-        if temp_path:
-            compressed_path = os.path.splitext(temp_path)[0] + ".upload.mp4"
-            if os.path.exists(compressed_path):
+    dedupe_key = dedupe_key_for(input_sha256, prompt, display_name, sampling, mode)
+    job, created = jobs.create_or_attach(
+        params["idempotency_key"],
+        dedupe_key,
+        input_sha256=input_sha256,
+        prompt=prompt,
+        name=display_name,
+        sampling=sampling,
+    )
+    if not created:
+        return json_response(world_api.attached_response(job, dedupe_key)), False
+
+    # The job owns the upload from here; its cleanup deletes the workspace.
+    workspace, request.workspace = request.workspace, None
+    jobs.publish(job, "receiving", bytes=request.content_length)
+    jobs.run(
+        job,
+        run_admitted,
+        ticket,
+        job,
+        temp_path,
+        display_name,
+        prompt,
+        compress,
+        sampling,
+        mode,
+        workspace=workspace,
+        cleanup=workspace.close,
+        follow_up=asset_follow_up(admitted_publisher(ticket, job), on_end=ticket.finish),
+    )
+    return json_response(world_api.job_response(job, 202, queue_position=ticket.queue_position)), True
+
+
+@app.get("/assets/<name>")
+def get_asset(name):
+    cache = get_asset_cache()
+    entry = cache.get(name) if cache is not None else None
+    if entry is None:
+        abort(404)
+    # conditional=True answers Range with 206 and a matching If-None-Match with 304.
+    response = send_file(
+        entry["path"], mimetype=entry["content_type"], conditional=True, etag=entry["sha256"], max_age=31536000
+    )
+    response.headers["Cache-Control"] = world_api.ASSET_CACHE_CONTROL
+    return response
+
+
+@app.get("/jobs/<job_id>")
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return json_response(world_api.unknown_job_response(job_id))
+    return jsonify(job.to_dict())
+
+
+@app.get("/generate-worldvr/<job_id>/events")
+def job_events(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return json_response(world_api.unknown_job_response(job_id))
+    events = jobs.subscribe(job)
+
+    def stream():
+        try:
+            while True:
                 try:
-                    os.remove(compressed_path)
-                except OSError:
-                    pass
+                    event = events.get(timeout=world_api.SSE_HEARTBEAT_S)
+                except queue.Empty:
+                    # A job another worker runs only changes here when it is re-read from the store.
+                    jobs.refresh(job)
+                    yield world_api.SSE_KEEPALIVE
+                    continue
+                if event is None:
+                    return
+                yield world_api.sse_event(event)
+        finally:
+            jobs.unsubscribe(job, events)
+
+    return Response(stream(), mimetype="text/event-stream", headers=world_api.SSE_HEADERS)
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Per-stage span histograms plus current job, poll and encode load."""
+    gauges = world_api.metrics_gauges(
+        jobs,
+        admission,
+        get_client().breaker,
+        world_operations_polling=get_poller().pending(),
+        world_encode_slots_in_use=get_encode_scheduler().in_use(),
+    )
+    return Response(metrics.render(gauges), mimetype="text/plain; version=0.0.4")
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8080)
+    init_app()
+    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", "8080")), threaded=True)